@@ -3,32 +3,34 @@
 import os
 import logging
 from datetime import timedelta
-from flask import Flask, request, render_template, send_from_directory # Keep render_template for error handlers
+from flask import Flask, request, render_template # Keep render_template for error handlers
 from dotenv import load_dotenv
 
 # Load environment variables first
 load_dotenv()
 
 # --- Logging Setup ---
-# Configure logging early
+# Configure logging early. Records go through a queue so request threads never
+# block on disk; a background listener writes the rotated log file (see utils/logging_setup.py)
+from utils.logging_setup import configure_logging
 LOG_DIR_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-os.makedirs(LOG_DIR_MAIN, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(LOG_DIR_MAIN, 'app.log')),
-        logging.StreamHandler()
-    ]
-)
+configure_logging(LOG_DIR_MAIN, level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO))
 # You can get specific loggers later using logging.getLogger(__name__) in other modules
 
 # --- Flask App Initialization & Config ---
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None) # /static is served by utils/assets.py
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7) # Example: 1 week
 
+# Compact JSON on the wire (PRETTY_JSON=true indents responses and data files for debugging)
+from utils.helpers import PRETTY_JSON
+app.json.compact = not PRETTY_JSON
+
+# gzip/brotli negotiation for large HTML and JSON responses (see utils/compression.py)
+from utils.compression import init_compression
+init_compression(app)
+
 # --- Import and Register Blueprints ---
 # Imports must come *after* app = Flask(...) if blueprints need 'app',
 # but here they only need helpers/decorators from utils.
@@ -45,11 +47,13 @@ app.register_blueprint(api_bp)   # url_prefix='/api' is set in routes/api.py
 
 # --- Global Routes (Static files, Error Handlers) ---
 
-# Static files route (kept global)
-@app.route('/static/<path:path>')
-def serve_static(path):
-    # Use Flask's built-in static handling if possible, otherwise use this
-    return send_from_directory('static', path)
+# Static files: content-hashed URLs via url_for('static', ...) served with far-future caching
+from utils.assets import init_assets
+init_assets(app, os.path.join(app.root_path, 'static'))
+
+# Published projects are re-rendered to static pages in the background after saves (see utils/publish.py)
+from utils.publish import init_publishing
+init_publishing(app)
 
 # Error handlers (kept global)
 @app.errorhandler(404)
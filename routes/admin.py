@@ -4,12 +4,16 @@ import json
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash # Ensure this line is correct
 
-from utils.decorators import admin_required # Absolute import
+from utils.decorators import admin_required, calendar_write # Absolute import
 # --- Corrected helpers import ---
 from utils.helpers import get_projects, get_project, save_project, get_project_calendar, save_project_calendar, generate_calendar, DATA_DIR, logger, recalculate_shoot_days
 from utils.helpers import update_day_from_form # Absolute import
 # --- Corrected calendar_generator import ---
 from utils.calendar_generator import calculate_department_counts, calculate_location_counts # Absolute import
+from utils.events import publish_calendar_change, changed_dates
+from utils.oplog import record_operation
+from utils.archive import archived_projects
+from utils.conflicts import conflict_warnings
 
 # Define Blueprint: Set url_prefix and template_folder
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='../templates/admin')
@@ -19,8 +23,9 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='..
 def admin_dashboard():
     """Admin dashboard"""
     projects = get_projects()
+    archived = archived_projects() # Manifest rows only; packs stay compressed
     # Renders 'admin/dashboard.html' because of template_folder
-    return render_template('dashboard.html', projects=projects)
+    return render_template('dashboard.html', projects=projects, archived=archived)
 
 @admin_bp.route('/project/<project_id>', methods=['GET', 'POST'])
 @admin_required
@@ -127,11 +132,22 @@ def admin_calendar(project_id):
     calendar_data = calculate_department_counts(calendar_data)
     calendar_data = calculate_location_counts(calendar_data)
 
+    # Subscription link for phone calendars (calendar apps cannot log in, so it carries a token)
+    from flask import current_app # Local imports; only needed for the feed link
+    from utils.ics import feed_token
+    feed_url = url_for('main.calendar_feed', project_id=project_id,
+                       token=feed_token(current_app.secret_key, project), _external=True)
+
+    from utils.publish import published_record # Local import; only needed for the publish button
+    published = published_record(project_id)
+
     # Renders 'admin/calendar.html'
-    return render_template('calendar.html', project=project, calendar=calendar_data, locations=locations)
+    return render_template('calendar.html', project=project, calendar=calendar_data, locations=locations, feed_url=feed_url,
+                           published=published)
 
 @admin_bp.route('/day/<project_id>/<date>', methods=['GET', 'POST'])
 @admin_required
+@calendar_write
 def admin_day(project_id, date):
     """Day editor"""
     # Import helper function locally or ensure it's imported from app/utils
@@ -156,6 +172,7 @@ def admin_day(project_id, date):
     if request.method == 'POST':
         try:
             form_data = request.form.to_dict()
+            days_before = [dict(d) for d in calendar_data['days']] # Copies, for the live update diff
 
             # --- Update locationArea based on selected location ---
             if 'location' in form_data and form_data['location']:
@@ -215,17 +232,17 @@ def admin_day(project_id, date):
                     # Recalculate all shoot day numbers
                     calendar_data['days'] = recalculate_shoot_days(calendar_data['days'])
 
-            # Save the entire updated calendar
-            # Consider making save_project_calendar more granular later if performance is an issue
-            save_project_calendar(project_id, calendar_data)
-
-            # Recalculate and save counts after saving day changes
+            # Recalculate counts, then save the entire updated calendar once
             calendar_data = calculate_department_counts(calendar_data)
             calendar_data = calculate_location_counts(calendar_data)
             # update_calendar_with_location_areas might be implicitly covered by calc_loc_counts now
-            save_project_calendar(project_id, calendar_data) # Save again with updated counts/areas
+            save_project_calendar(project_id, calendar_data)
+            record_operation(project_id, 'patch', days_before, calendar_data)
+            publish_calendar_change(project_id, calendar_data, 'day', changed_dates(days_before, calendar_data['days']))
 
             flash('Day updated successfully', 'success')
+            for warning in conflict_warnings(project_id, [d for d in calendar_data['days'] if d.get('date') == date]):
+                flash(warning['message'], 'warning')
             return redirect(url_for('admin.admin_calendar', project_id=project_id))
 
         except Exception as e:
@@ -3,10 +3,33 @@ import os
 import json
 import uuid
 import shutil
-from flask import Blueprint, jsonify, request # <-- Ensure this line is correct
-
-from utils.decorators import admin_required # Absolute import
-from utils.helpers import get_projects, get_project, save_project, get_project_calendar, save_project_calendar, generate_calendar, DATA_DIR, PROJECTS_DIR, logger, update_all_projects_department_counts, recalculate_shoot_days # Absolute import
+import hashlib
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app, url_for # <-- Ensure this line is correct
+
+from utils.decorators import admin_required, calendar_write # Absolute import
+from utils.helpers import get_projects, get_project, save_project, get_project_calendar, save_project_calendar, generate_calendar, DATA_DIR, PROJECTS_DIR, BACKUP_DIR, logger, update_all_projects_department_counts, recalculate_shoot_days, dump_json, notify_calendar_listeners, load_global_data, calendar_lock # Absolute import
+from utils.calendar_generator import calculate_department_counts, calculate_location_counts
+from utils.events import publish_calendar_change, changed_dates, iter_sse, record_special_dates_change, calendar_changes_since
+from utils.search import search_index
+from utils.archive import archive_project, unarchive_project, delete_archived_project, archived_projects, ArchiveError
+from utils.file_utils import create_snapshot, list_snapshots, load_manifest, restore_snapshot
+from utils.oplog import record_operation, undo, redo, history, forget_project, OperationConflict
+from utils.calendar_diff import diff_calendars
+from utils.versions import list_versions, list_backups, snapshot_version, load_source
+from utils.branches import (list_branches, get_branch, save_branch, create_branch, delete_branch, materialize,
+                            update_branch_day, regenerate_branch, diff_branch, merge_branch, promote_branch,
+                            with_counts, branch_summary, BranchConflict, BRANCH_PROJECT_FIELDS, SPECIAL_DATE_FILES)
+from utils.conflicts import conflict_index, conflict_warnings, CONFLICT_KINDS
+from utils.capacity import department_usage_index, department_capacity
+from utils.references import reference_index, usage_summary, cascade_rename, REFERENCE_FIELDS
+from utils.autocomplete import autocompleter, AUTOCOMPLETE_TYPES, DEFAULT_LIMIT, MAX_LIMIT
+from utils.daylight import parse_coordinates, coordinates_of, refresh_projects
+from utils.ics import feed_token, forget_feeds
+from utils.publish import publish_project, unpublish_project, published_record
+from utils.row_model import build_row_model
+from utils.snapshots import calendar_view
+from utils.spreadsheet import (iter_csv, iter_xlsx, iter_upload_rows, validate_import, apply_import,
+                               SpreadsheetError, MAX_REPORTED_ERRORS)
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -50,8 +73,18 @@ def api_project(project_id):
     elif request.method == 'DELETE':
         try:
             project_dir = os.path.join(PROJECTS_DIR, project_id)
+            if delete_archived_project(project_id):
+                forget_project(project_id)
+                forget_feeds(project_id)
+                unpublish_project(project_id)
+                logger.info(f"Archived project {project_id} deleted via API.")
+                return jsonify({'success': True})
             if os.path.exists(project_dir):
                 shutil.rmtree(project_dir)
+                notify_calendar_listeners(project_id, None) # Drop the project from search/conflict indexes
+                forget_project(project_id)
+                forget_feeds(project_id)
+                unpublish_project(project_id)
                 logger.info(f"Project {project_id} deleted via API.")
                 return jsonify({'success': True})
             else:
@@ -60,9 +93,43 @@ def api_project(project_id):
              logger.error(f"API Error deleting project {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/archive')
+@admin_required
+def api_archived_projects():
+    """Manifest rows of archived projects"""
+    return jsonify(archived_projects())
+
+@api_bp.route('/projects/<project_id>/archive', methods=['POST'])
+@admin_required
+def api_archive_project(project_id):
+    """Pack a wrapped project into cold storage ({"force": true} skips the wrap date check)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        row = archive_project(project_id, force=bool(data.get('force')))
+        forget_project(project_id)
+        return jsonify(row)
+    except ArchiveError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error archiving project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/unarchive', methods=['POST'])
+@admin_required
+def api_unarchive_project(project_id):
+    """Restore an archived project to active storage"""
+    try:
+        return jsonify(unarchive_project(project_id))
+    except ArchiveError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error unarchiving project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # --- Calendar API Routes ---
 @api_bp.route('/projects/<project_id>/calendar', methods=['GET', 'POST'])
 @admin_required
+@calendar_write
 def api_project_calendar(project_id):
     """Get or update project calendar"""
     if request.method == 'GET':
@@ -71,14 +138,36 @@ def api_project_calendar(project_id):
     elif request.method == 'POST':
         try:
             calendar_data = request.get_json()
+            previous = get_project_calendar(project_id)
+            # Continue from the stored revision rather than trusting the payload
+            calendar_data['revision'] = previous.get('revision', 0)
             result = save_project_calendar(project_id, calendar_data)
+            record_operation(project_id, 'regenerate', previous.get('days', []), result)
+            publish_calendar_change(project_id, result, 'regenerated',
+                                    changed_dates(previous.get('days', []), result.get('days', [])),
+                                    include_days=False)
             return jsonify(result)
         except Exception as e:
              logger.error(f"API Error saving calendar for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/projects/<project_id>/calendar/changes')
+@admin_required
+def api_calendar_changes(project_id):
+    """Delta sync: day records and count deltas changed since revision ?since=N"""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer revision'}), 400
+
+    calendar_data = get_project_calendar(project_id)
+    return jsonify(calendar_changes_since(project_id, calendar_data, since))
+
 @api_bp.route('/projects/<project_id>/calendar/generate', methods=['POST'])
 @admin_required
+@calendar_write
 def api_generate_calendar(project_id):
     """Generate calendar for project"""
     project = get_project(project_id)
@@ -93,6 +182,7 @@ def api_generate_calendar(project_id):
 
 @api_bp.route('/projects/<project_id>/calendar/day/<date>', methods=['GET', 'PUT'])
 @admin_required
+@calendar_write
 def api_calendar_day(project_id, date):
     """Get or update a specific calendar day"""
     # This duplicates logic from admin_day PUT. Consider refactoring later.
@@ -107,14 +197,19 @@ def api_calendar_day(project_id, date):
     elif request.method == 'PUT':
         try:
             day_data = request.get_json()
+            day_data.pop('warnings', None) # Response-only field, never stored
+            day_before = dict(calendar_data['days'][day_index])
             # Basic update - might need more complex logic like in admin_day
             calendar_data['days'][day_index].update(day_data)
+            # Recalculate counts so live viewers get accurate counters
+            calendar_data = calculate_department_counts(calendar_data)
+            calendar_data = calculate_location_counts(calendar_data)
             save_project_calendar(project_id, calendar_data)
-            # Recalculate counts after API update? Might be needed.
-            # calendar_data = calculate_department_counts(calendar_data)
-            # calendar_data = calculate_location_counts(calendar_data)
-            # save_project_calendar(project_id, calendar_data)
-            return jsonify(calendar_data['days'][day_index])
+            record_operation(project_id, 'patch', [day_before], calendar_data, dates=[date])
+            publish_calendar_change(project_id, calendar_data, 'day', [date])
+            # Saving is never blocked; clashes with other projects come back as warnings
+            warnings = conflict_warnings(project_id, [calendar_data['days'][day_index]])
+            return jsonify(dict(calendar_data['days'][day_index], warnings=warnings))
         except Exception as e:
              logger.error(f"API Error updating day {date} for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
@@ -122,6 +217,7 @@ def api_calendar_day(project_id, date):
 
 @api_bp.route('/projects/<project_id>/calendar/move-day', methods=['POST'])
 @admin_required
+@calendar_write
 def api_move_calendar_day(project_id):
     """Move a shoot day"""
     try:
@@ -140,6 +236,7 @@ def api_move_calendar_day(project_id):
             return jsonify({'error': 'Calendar data not found or invalid'}), 404
 
         days = calendar_data.get('days', [])
+        days_before = [dict(d) for d in days] # Copies, for the live update diff
         from_day_index = next((i for i, d in enumerate(days) if d.get('date') == from_date), None)
         to_day_index = next((i for i, d in enumerate(days) if d.get('date') == to_date), None)
 
@@ -188,16 +285,31 @@ def api_move_calendar_day(project_id):
         else: # Add other modes like 'insert' later if needed
             return jsonify({'error': 'Unsupported move mode'}), 400
 
-        # Recalculate shoot day numbers after any move
+        # Recalculate shoot day numbers and counts after any move
         calendar_data['days'] = recalculate_shoot_days(days)
+        calendar_data = calculate_department_counts(calendar_data)
+        calendar_data = calculate_location_counts(calendar_data)
         save_project_calendar(project_id, calendar_data)
 
+        moved_dates = set(changed_dates(days_before, calendar_data['days']))
+        record_operation(project_id, 'swap', [d for d in days_before if d.get('date') in moved_dates], calendar_data, dates=moved_dates)
+        publish_calendar_change(project_id, calendar_data, 'move', moved_dates)
+
         return jsonify({
             'success': True,
             'message': f'Day {original_shoot_day} swapped with {to_date}',
             'originalDay': original_shoot_day,
             'targetDay': target_shoot_day,
-            'mode': mode
+            'mode': mode,
+            # Patch for the client to apply in place (same shape as the live 'move' event)
+            'revision': calendar_data.get('revision'),
+            'days': [d for d in calendar_data['days'] if d.get('date') in moved_dates],
+            'warnings': conflict_warnings(project_id, [d for d in calendar_data['days'] if d.get('date') in moved_dates]),
+            'counts': {
+                'departmentCounts': calendar_data.get('departmentCounts', {}),
+                'locationCounts': calendar_data.get('locationCounts', {}),
+                'areaCounts': calendar_data.get('areaCounts', {})
+            }
         }), 200
 
     except Exception as e:
@@ -205,6 +317,642 @@ def api_move_calendar_day(project_id):
         return jsonify({'error': f'Error moving calendar day: {str(e)}'}), 500
 
 
+@api_bp.route('/projects/<project_id>/calendar/export')
+@admin_required
+def api_export_calendar(project_id):
+    """Stream the calendar as a spreadsheet: ?format=csv (default) or xlsx"""
+    project = get_project(project_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+
+    days = get_project_calendar(project_id).get('days', [])
+    name = '-'.join(v for v in (project.get('title'), project.get('version')) if v) or 'calendar'
+    filename = ''.join(c if c.isalnum() or c in '-_' else '-' for c in name)
+    if fmt == 'xlsx':
+        response = Response(stream_with_context(iter_xlsx(days, project.get('title') or 'Schedule')),
+                            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    else:
+        response = Response(stream_with_context(iter_csv(days)), mimetype='text/csv')
+        response.mimetype_params['charset'] = 'utf-8'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+@api_bp.route('/projects/<project_id>/calendar/import', methods=['POST'])
+@admin_required
+@calendar_write
+def api_import_calendar(project_id):
+    """
+    Bulk update days from an uploaded CSV/XLSX (multipart field 'file'), keyed by the Date column.
+    Every row is validated first; any error rejects the whole file. ?dryRun=1 only validates.
+    """
+    project = get_project(project_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        calendar_data = get_project_calendar(project_id)
+        updates, errors, row_count = validate_import(iter_upload_rows(upload.stream, upload.filename), calendar_data)
+    except SpreadsheetError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error reading import for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    if errors:
+        return jsonify({
+            'error': f"{len(errors)} of {row_count} row(s) have errors; nothing was imported",
+            'rows': row_count,
+            'errorCount': len(errors),
+            'errors': errors[:MAX_REPORTED_ERRORS],
+        }), 400
+    if request.args.get('dryRun', '').lower() in ('1', 'true', 'yes'):
+        return jsonify({'success': True, 'dryRun': True, 'rows': row_count, 'dates': sorted(updates)})
+
+    try:
+        days_before = [dict(d) for d in calendar_data.get('days', [])] # Copies, for undo and live updates
+        changed = apply_import(calendar_data, updates, project.get('shootStartDate'))
+        if not changed:
+            return jsonify({'success': True, 'rows': row_count, 'updated': 0, 'revision': calendar_data.get('revision')})
+        # One recount and one atomic write for the whole file
+        calendar_data = calculate_department_counts(calendar_data)
+        calendar_data = calculate_location_counts(calendar_data)
+        saved = save_project_calendar(project_id, calendar_data)
+        record_operation(project_id, 'import', days_before, saved)
+        publish_calendar_change(project_id, saved, 'day', changed_dates(days_before, saved['days']))
+        return jsonify({'success': True, 'rows': row_count, 'updated': len(changed), 'dates': changed,
+                        'revision': saved.get('revision')})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error importing calendar for project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/history')
+@admin_required
+def api_calendar_history(project_id):
+    """Undo/redo history of calendar edits, newest first"""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    return jsonify(history(project_id))
+
+def _undo_redo(project_id, step, label):
+    """Shared handler for undo/redo. Optional JSON {"revision": N} is the revision the client last saw."""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    data = request.get_json(silent=True) or {}
+    revision = data.get('revision')
+    if revision is not None:
+        try:
+            revision = int(revision)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'revision must be an integer'}), 400
+    try:
+        result = step(project_id, revision)
+        if result is None:
+            return jsonify({'error': f'Nothing to {label}'}), 400
+        return jsonify(result)
+    except OperationConflict as e:
+        return jsonify({'error': str(e), 'conflicts': e.conflicts}), 409
+    except ValueError as e: # e.g. the project is archived and read-only
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error during {label} for {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/undo', methods=['POST'])
+@admin_required
+def api_calendar_undo(project_id):
+    """Revert the latest calendar edit"""
+    return _undo_redo(project_id, undo, 'undo')
+
+@api_bp.route('/projects/<project_id>/redo', methods=['POST'])
+@admin_required
+def api_calendar_redo(project_id):
+    """Re-apply the most recently undone calendar edit"""
+    return _undo_redo(project_id, redo, 'redo')
+
+@api_bp.route('/projects/<project_id>/feed', methods=['GET', 'POST'])
+@admin_required
+def api_calendar_feed(project_id):
+    """Subscription URL of the project's .ics feed; POST issues a new token, revoking the old one"""
+    project = get_project(project_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    if request.method == 'POST':
+        try:
+            project['feedKey'] = uuid.uuid4().hex
+            project = save_project(project)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"API Error rotating feed token for project {project_id}: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    token = feed_token(current_app.secret_key, project)
+    return jsonify({
+        'token': token,
+        'url': url_for('main.calendar_feed', project_id=project_id, token=token, _external=True),
+        'filters': ['dept', 'location', 'area', 'shoot'],
+    })
+
+@api_bp.route('/projects/<project_id>/publish', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def api_publish_project(project_id):
+    """Static snapshot of the viewer page: POST (re)publishes now, DELETE unpublishes"""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    try:
+        if request.method == 'POST':
+            record = publish_project(project_id)
+        elif request.method == 'DELETE':
+            return jsonify({'success': unpublish_project(project_id), 'published': False})
+        else:
+            record = published_record(project_id)
+            if not record:
+                return jsonify({'published': False})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error publishing project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'published': True,
+        'url': url_for('main.viewer', project_id=project_id, _external=True),
+        **{key: record.get(key) for key in ('version', 'slug', 'revision', 'publishedAt', 'versions')},
+    })
+
+@api_bp.route('/projects/<project_id>/rows')
+# Not admin_required: same access as the viewer page
+def api_calendar_rows(project_id):
+    """Compact row model of the calendar (?offset=&limit= for a window), as the virtualized table uses"""
+    project = get_project(project_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    try:
+        offset = int(request.args.get('offset') or 0)
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Invalid offset or limit'}), 400
+
+    calendar_data = calendar_view(project_id)
+    calendar_data['locationAreas'] = load_global_data('areas.json', [])
+    calendar_data['departments'] = load_global_data('departments.json', [])
+    model = build_row_model(calendar_data, offset, limit)
+    model['project'] = {'id': project_id, 'title': project.get('title') or '', 'version': project.get('version') or ''}
+    response = jsonify(model)
+    # Revision-keyed ETag: the offline viewer's service worker revalidates its cached copy with it
+    response.set_etag(f"rows-{model['revision']}-{hashlib.sha1(response.get_data()).hexdigest()[:16]}")
+    response.headers['X-Calendar-Revision'] = str(model['revision'])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@api_bp.route('/projects/<project_id>/events')
+# Not admin_required: same access as the viewer page, which crew keep open
+def api_project_events(project_id):
+    """Server-sent events stream of live calendar changes"""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+
+    # EventSource sends Last-Event-ID (the last revision seen) when it reconnects
+    last_revision = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_revision = int(last_revision) if last_revision not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid revision'}), 400
+
+    return Response(
+        stream_with_context(iter_sse(project_id, last_revision)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# --- Branch (What-If Scenario) API Routes ---
+@api_bp.route('/projects/<project_id>/branches', methods=['GET', 'POST'])
+@admin_required
+def api_branches(project_id):
+    """List or create scenario branches of a project calendar"""
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    if request.method == 'GET':
+        return jsonify(list_branches(project_id))
+    try:
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Branch name is required'}), 400
+        branch = create_branch(project_id, name, data.get('description', ''))
+        return jsonify(branch_summary(branch)), 201
+    except Exception as e:
+        logger.error(f"API Error creating branch for {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _load_branch(project_id, branch_id):
+    """(branch, error response) for branch routes"""
+    try:
+        branch = get_branch(project_id, branch_id)
+    except ValueError:
+        branch = None
+    if not branch:
+        return None, (jsonify({'error': 'Branch not found'}), 404)
+    return branch, None
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>', methods=['GET', 'PUT', 'DELETE'])
+@admin_required
+def api_branch(project_id, branch_id):
+    """
+    GET: the branch's calendar (main with the branch's edits applied).
+    PUT: update name/description and the overrides used for regeneration:
+         project (prepStartDate, shootStartDate, wrapDate) and specialDates
+         (holidays, weekends, hiatus, specialDates lists; null drops an override).
+         Changing overrides regenerates the branch.
+    DELETE: discard the branch.
+    """
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    try:
+        if request.method == 'GET':
+            return jsonify(with_counts(materialize(get_project_calendar(project_id), branch)))
+
+        if request.method == 'DELETE':
+            delete_branch(project_id, branch_id)
+            return jsonify({'success': True})
+
+        data = request.get_json() or {}
+        for key in ('name', 'description'):
+            if key in data:
+                branch[key] = data[key]
+        regenerate = False
+        for field, value in (data.get('project') or {}).items():
+            if field not in BRANCH_PROJECT_FIELDS:
+                return jsonify({'error': f"Branches can only override: {', '.join(BRANCH_PROJECT_FIELDS)}"}), 400
+            if value is None:
+                branch['project'].pop(field, None)
+            else:
+                branch['project'][field] = value
+            regenerate = True
+        for key, entries in (data.get('specialDates') or {}).items():
+            if key not in SPECIAL_DATE_FILES:
+                return jsonify({'error': f"Unknown special date list: {key}"}), 400
+            if entries is None:
+                branch['specialDates'].pop(key, None)
+            elif isinstance(entries, list):
+                branch['specialDates'][key] = entries
+            else:
+                return jsonify({'error': f"{key} must be a list"}), 400
+            regenerate = True
+
+        branch = regenerate_branch(project_id, branch) if regenerate else save_branch(project_id, branch)
+        return jsonify(branch_summary(branch))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error updating branch {branch_id} of {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>/day/<date>', methods=['PUT'])
+@admin_required
+def api_branch_day(project_id, branch_id, date):
+    """Edit a day on a branch (main is untouched)"""
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    try:
+        day = update_branch_day(project_id, branch, date, request.get_json() or {})
+        if day is None:
+            return jsonify({'error': 'Day not found'}), 404
+        return jsonify(day)
+    except Exception as e:
+        logger.error(f"API Error updating day {date} on branch {branch_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>/regenerate', methods=['POST'])
+@admin_required
+def api_branch_regenerate(project_id, branch_id):
+    """Regenerate the branch from its own project dates and special dates"""
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    try:
+        return jsonify(branch_summary(regenerate_branch(project_id, branch)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error regenerating branch {branch_id} of {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>/diff')
+@admin_required
+def api_branch_diff(project_id, branch_id):
+    """Changed, added and removed days of the branch relative to main, with count deltas"""
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    try:
+        return jsonify(diff_branch(project_id, branch))
+    except Exception as e:
+        logger.error(f"API Error diffing branch {branch_id} of {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>/merge', methods=['POST'])
+@admin_required
+@calendar_write
+def api_branch_merge(project_id, branch_id):
+    """
+    Merge the branch's edits into main. Returns 409 with the conflicts if main
+    changed the same fields since the branch diverged, unless {"force": true}.
+    The branch is deleted after a successful merge unless {"keep": true}.
+    """
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        saved, conflicts = merge_branch(project_id, branch, force=bool(data.get('force')))
+        if not data.get('keep'):
+            delete_branch(project_id, branch_id)
+        return jsonify({'success': True, 'revision': saved.get('revision'), 'overridden': conflicts})
+    except BranchConflict as e:
+        return jsonify({'error': 'Main has conflicting changes', 'conflicts': e.conflicts}), 409
+    except Exception as e:
+        logger.error(f"API Error merging branch {branch_id} of {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/branches/<branch_id>/promote', methods=['POST'])
+@admin_required
+@calendar_write
+def api_branch_promote(project_id, branch_id):
+    """Make the branch the main calendar; the branch wins wherever both changed a field"""
+    branch, error = _load_branch(project_id, branch_id)
+    if error:
+        return error
+    try:
+        saved = promote_branch(project_id, branch)
+        delete_branch(project_id, branch_id)
+        return jsonify({'success': True, 'revision': saved.get('revision')})
+    except Exception as e:
+        logger.error(f"API Error promoting branch {branch_id} of {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Version Diff API Routes ---
+@api_bp.route('/projects/<project_id>/versions', methods=['GET', 'POST'])
+@admin_required
+def api_versions(project_id):
+    """
+    GET: stored calendar versions and backups that can be diffed.
+    POST: snapshot the current calendar under {"label": ...} (default: the project's version).
+    """
+    project = get_project(project_id)
+    if not project:
+        return jsonify({'error': 'Project not found'}), 404
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            label = (data.get('label') or project.get('version') or '').strip()
+            if not label:
+                return jsonify({'error': 'A version label is required'}), 400
+            snapshot = snapshot_version(project_id, label)
+            if not snapshot:
+                return jsonify({'error': 'Invalid version label'}), 400
+            return jsonify({'version': snapshot['version'], 'created': snapshot['created']}), 201
+        return jsonify({
+            'current': project.get('version'),
+            'versions': list_versions(project_id),
+            'backups': list_backups(project_id),
+        })
+    except Exception as e:
+        logger.error(f"API Error with versions of project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/projects/<project_id>/diff')
+@admin_required
+def api_diff(project_id):
+    """
+    Diff two calendar versions: ?from=<source>&to=<source> where a source is
+    'current', 'version:<label>' (or just the label) or 'backup:<name>'.
+    'to' defaults to the current calendar.
+    """
+    if not get_project(project_id):
+        return jsonify({'error': 'Project not found'}), 404
+    source_from = request.args.get('from', '').strip()
+    if not source_from:
+        return jsonify({'error': 'Query parameter "from" is required'}), 400
+    try:
+        old, old_label = load_source(project_id, source_from)
+        new, new_label = load_source(project_id, request.args.get('to', 'current'))
+        diff = diff_calendars(old, new)
+        diff['from'] = old_label
+        diff['to'] = new_label
+        return jsonify(diff)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"API Error diffing calendars of project {project_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Backup API Routes ---
+@api_bp.route('/backups', methods=['GET', 'POST'])
+@admin_required
+def api_backups():
+    """List snapshots, or take one now"""
+    if not BACKUP_DIR:
+        return jsonify({'error': 'Backups are not configured (set BACKUP_DIR)'}), 400
+    try:
+        if request.method == 'POST':
+            manifest = create_snapshot(DATA_DIR, BACKUP_DIR)
+            return jsonify({'name': manifest['name'], 'created': manifest['created'], 'stats': manifest['stats']}), 201
+        snapshots = []
+        for name in reversed(list_snapshots(BACKUP_DIR)):
+            manifest = load_manifest(BACKUP_DIR, name)
+            projects = sorted({rel.split('/')[1] for rel in manifest['files']
+                               if rel.startswith('projects/') and rel.count('/') >= 2})
+            snapshots.append({'name': name, 'created': manifest.get('created'),
+                              'stats': manifest.get('stats', {}), 'projects': projects})
+        return jsonify(snapshots)
+    except Exception as e:
+        logger.error(f"API Error with backups: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/backups/<name>/restore', methods=['POST'])
+@admin_required
+def api_restore_backup(name):
+    """Restore a snapshot: all data, or one project with {"projectId": ...}"""
+    if not BACKUP_DIR:
+        return jsonify({'error': 'Backups are not configured (set BACKUP_DIR)'}), 400
+    data = request.get_json(silent=True) or {}
+    project_id = data.get('projectId')
+    try:
+        if name not in list_snapshots(BACKUP_DIR):
+            return jsonify({'error': 'Snapshot not found'}), 404
+        # Remember live revisions: restored calendars must move forward, not back, for live clients
+        project_ids = [project_id] if project_id else [p['id'] for p in get_projects()]
+        revisions = {pid: get_project_calendar(pid).get('revision', 0) for pid in project_ids}
+        restored = restore_snapshot(BACKUP_DIR, name, DATA_DIR, project_id)
+
+        touched = {rel.split('/')[1] for rel in restored if rel.startswith('projects/') and rel.count('/') >= 2}
+        for pid in sorted(touched):
+            with calendar_lock(pid):
+                forget_project(pid)  # Undo deltas no longer describe this calendar
+                calendar_data = get_project_calendar(pid)
+                if not calendar_data.get('days'):
+                    continue
+                calendar_data['revision'] = max(int(calendar_data.get('revision') or 0), int(revisions.get(pid) or 0))
+                saved = save_project_calendar(pid, calendar_data)
+                publish_calendar_change(pid, saved, 'regenerated')
+        return jsonify({'success': True, 'restoredFiles': len(restored), 'projects': sorted(touched)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"API Error restoring snapshot {name}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# --- Search API Routes ---
+@api_bp.route('/search')
+@admin_required
+def api_search():
+    """
+    Full-text search over calendar days in all projects.
+
+    Query parameters: q (required; "quoted phrases" and prefix* terms),
+    project (repeatable or comma separated), start/end (YYYY-MM-DD, inclusive),
+    dayType (repeatable or comma separated), limit (default 50, max 500).
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+
+    def multi(name):
+        values = [v.strip() for arg in request.args.getlist(name) for v in arg.split(',')]
+        return set(v for v in values if v) or None
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    try:
+        total, results = search_index.search(
+            query,
+            project_ids=multi('project'),
+            start=request.args.get('start') or None,
+            end=request.args.get('end') or None,
+            day_types=multi('dayType'),
+            limit=limit
+        )
+        return jsonify({'query': query, 'total': total, 'results': results})
+    except Exception as e:
+        logger.error(f"API Error searching for '{query}': {str(e)}")
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+
+@api_bp.route('/conflicts')
+@admin_required
+def api_conflicts():
+    """
+    Dates where two or more projects share a location (or area).
+
+    Query parameters: start/end (YYYY-MM-DD, inclusive), kind (location,
+    area or all; default all), project (only clashes involving this project).
+    """
+    kind = request.args.get('kind', 'all')
+    if kind != 'all' and kind not in CONFLICT_KINDS:
+        return jsonify({'error': f"kind must be one of: all, {', '.join(CONFLICT_KINDS)}"}), 400
+    try:
+        conflicts = conflict_index.conflicts(
+            start=request.args.get('start') or None,
+            end=request.args.get('end') or None,
+            kinds=CONFLICT_KINDS if kind == 'all' else (kind,),
+            project_id=request.args.get('project') or None
+        )
+        titles = {p.get('id'): p.get('title', '') for p in get_projects()}
+        for conflict in conflicts:
+            for project_id, booking in conflict['projects'].items():
+                booking['title'] = titles.get(project_id, '')
+        return jsonify({'total': len(conflicts), 'conflicts': conflicts})
+    except Exception as e:
+        logger.error(f"API Error listing conflicts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _capacity_args():
+    """(start, end, department codes) from the capacity query string"""
+    codes = set(v.strip().upper() for arg in request.args.getlist('department') for v in arg.split(',') if v.strip())
+    return request.args.get('start') or None, request.args.get('end') or None, codes or None
+
+@api_bp.route('/capacity')
+@admin_required
+def api_capacity():
+    """
+    Shared department usage across all projects against each department's
+    daily capacity: per-department totals plus every over-allocated date.
+    Query parameters: start/end (YYYY-MM-DD), department (codes, repeatable or comma separated).
+    """
+    try:
+        start, end, codes = _capacity_args()
+        return jsonify(department_usage_index.summary(start, end, codes))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        logger.error(f"API Error computing department capacity: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/capacity/heatmap')
+@admin_required
+def api_capacity_heatmap():
+    """Weekly usage and utilisation per department (same parameters as /api/capacity)"""
+    try:
+        start, end, codes = _capacity_args()
+        return jsonify(department_usage_index.heatmap(start, end, codes))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    except Exception as e:
+        logger.error(f"API Error computing capacity heatmap: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/references/<kind>')
+@admin_required
+def api_references(kind):
+    """Projects and dates using a location/area name or department code: ?value=..."""
+    if kind not in REFERENCE_FIELDS:
+        return jsonify({'error': f"kind must be one of: {', '.join(REFERENCE_FIELDS)}"}), 400
+    value = request.args.get('value', '')
+    if not value:
+        return jsonify({'error': 'Query parameter value is required'}), 400
+    try:
+        return jsonify(dict(usage_summary(reference_index.usage(kind, value)), kind=kind, value=value))
+    except Exception as e:
+        logger.error(f"API Error looking up {kind} references for '{value}': {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/autocomplete')
+@admin_required
+def api_autocomplete():
+    """Prefix suggestions for the day editor: ?type=location|department|sequence&q=...&limit="""
+    kind = request.args.get('type', 'location')
+    if kind not in AUTOCOMPLETE_TYPES:
+        return jsonify({'error': f"type must be one of: {', '.join(AUTOCOMPLETE_TYPES)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    query = request.args.get('q', '')
+    try:
+        response = jsonify({'type': kind, 'query': query, 'results': autocompleter.complete(kind, query, limit)})
+        # Suggestions change rarely; let the browser reuse them briefly and then revalidate
+        response.cache_control.private = True
+        response.cache_control.max_age = 30
+        response.add_etag()
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"API Error autocompleting {kind} '{query}': {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # --- Location API Routes ---
 @api_bp.route('/locations', methods=['GET', 'POST'])
 @admin_required
@@ -224,12 +972,16 @@ def api_locations():
             location_data = request.get_json()
             if 'id' not in location_data or not location_data['id']:
                 location_data['id'] = str(uuid.uuid4())
+            try:
+                parse_coordinates(location_data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
             locations = []
             if os.path.exists(locations_file):
                  with open(locations_file, 'r') as f: locations = json.load(f)
             locations.append(location_data)
-            with open(locations_file, 'w') as f: json.dump(locations, f, indent=2)
+            with open(locations_file, 'w') as f: dump_json(locations, f)
             return jsonify(location_data), 201
         except Exception as e:
              logger.error(f"API Error creating location: {e}")
@@ -257,16 +1009,31 @@ def api_location(location_id):
         try:
             location_data = request.get_json()
             location_data['id'] = location_id # Ensure ID consistency
+            try:
+                parse_coordinates(location_data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            old = locations[location_index]
+            old_name = old.get('name')
             locations[location_index] = location_data
-            with open(locations_file, 'w') as f: json.dump(locations, f, indent=2)
+            with open(locations_file, 'w') as f: dump_json(locations, f)
+            # Renamed: rewrite the days that still use the old name
+            cascade_rename([('location', old_name, location_data.get('name'))])
+            # Moved (or moved area): recompute light times on the days at this location only
+            if coordinates_of(old) != coordinates_of(location_data) or old.get('areaId') != location_data.get('areaId'):
+                refresh_projects(reference_index.usage('location', location_data.get('name')))
             return jsonify(location_data)
         except Exception as e:
              logger.error(f"API Error updating location {location_id}: {e}")
              return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
+            usage = reference_index.usage('location', locations[location_index].get('name'))
+            if usage:
+                return jsonify(dict(usage_summary(usage), error='Cannot delete location, it is still used on calendar days.')), 400
+
             del locations[location_index]
-            with open(locations_file, 'w') as f: json.dump(locations, f, indent=2)
+            with open(locations_file, 'w') as f: dump_json(locations, f)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting location {location_id}: {e}")
@@ -291,11 +1058,15 @@ def api_areas():
             area_data = request.get_json()
             if 'id' not in area_data or not area_data['id']:
                 area_data['id'] = str(uuid.uuid4())
+            try:
+                parse_coordinates(area_data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             areas = []
             if os.path.exists(areas_file):
                  with open(areas_file, 'r') as f: areas = json.load(f)
             areas.append(area_data)
-            with open(areas_file, 'w') as f: json.dump(areas, f, indent=2)
+            with open(areas_file, 'w') as f: dump_json(areas, f)
             return jsonify(area_data), 201
         except Exception as e:
              logger.error(f"API Error creating area: {e}")
@@ -322,8 +1093,18 @@ def api_area(area_id):
          try:
             area_data = request.get_json()
             area_data['id'] = area_id # Ensure ID
+            try:
+                parse_coordinates(area_data)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            old = areas[area_index]
+            old_name = old.get('name')
             areas[area_index] = area_data
-            with open(areas_file, 'w') as f: json.dump(areas, f, indent=2)
+            with open(areas_file, 'w') as f: dump_json(areas, f)
+            cascade_rename([('area', old_name, area_data.get('name'))])
+            if coordinates_of(old) != coordinates_of(area_data):
+                # Only days without location coordinates of their own will change
+                refresh_projects(reference_index.usage('area', area_data.get('name')))
             return jsonify(area_data)
          except Exception as e:
              logger.error(f"API Error updating area {area_id}: {e}")
@@ -336,9 +1117,12 @@ def api_area(area_id):
                  with open(locations_file, 'r') as f: locations = json.load(f)
                  if any(loc.get('areaId') == area_id for loc in locations):
                       return jsonify({'error': 'Cannot delete area, it is still assigned to locations.'}), 400
+            usage = reference_index.usage('area', areas[area_index].get('name'))
+            if usage:
+                return jsonify(dict(usage_summary(usage), error='Cannot delete area, it is still used on calendar days.')), 400
 
             del areas[area_index]
-            with open(areas_file, 'w') as f: json.dump(areas, f, indent=2)
+            with open(areas_file, 'w') as f: dump_json(areas, f)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting area {area_id}: {e}")
@@ -362,11 +1146,12 @@ def api_departments():
             department_data = request.get_json()
             if 'id' not in department_data or not department_data['id']:
                 department_data['id'] = str(uuid.uuid4())
+            department_data['capacity'] = department_capacity(department_data) # Normalise; None means unlimited
             departments = []
             if os.path.exists(departments_file):
                  with open(departments_file, 'r') as f: departments = json.load(f)
             departments.append(department_data)
-            with open(departments_file, 'w') as f: json.dump(departments, f, indent=2)
+            with open(departments_file, 'w') as f: dump_json(departments, f)
             # Update counts across all projects
             update_all_projects_department_counts()
             return jsonify(department_data), 201
@@ -395,19 +1180,24 @@ def api_department(department_id):
         try:
             department_data = request.get_json()
             department_data['id'] = department_id # Ensure ID
+            department_data['capacity'] = department_capacity(department_data) # Normalise; None means unlimited
+            old_code = departments[department_index].get('code')
             departments[department_index] = department_data
-            with open(departments_file, 'w') as f: json.dump(departments, f, indent=2)
-            update_all_projects_department_counts()
+            with open(departments_file, 'w') as f: dump_json(departments, f)
+            # A new code rewrites the tagged days (and recounts them); otherwise just recount
+            if not cascade_rename([('department', old_code, department_data.get('code'))]):
+                update_all_projects_department_counts()
             return jsonify(department_data)
         except Exception as e:
              logger.error(f"API Error updating department {department_id}: {e}")
              return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
-            # Add check: ensure department is not used? (More complex, involves checking all calendar.json files)
-            # Skipping check for now for simplicity.
+            usage = reference_index.usage('department', departments[department_index].get('code'))
+            if usage:
+                return jsonify(dict(usage_summary(usage), error='Cannot delete department, it is still tagged on calendar days.')), 400
             del departments[department_index]
-            with open(departments_file, 'w') as f: json.dump(departments, f, indent=2)
+            with open(departments_file, 'w') as f: dump_json(departments, f)
             update_all_projects_department_counts()
             return jsonify({'success': True})
         except Exception as e:
@@ -449,7 +1239,8 @@ def api_weekends(project_id):
             else:
                  weekends.append(weekend_data) # Add new
 
-            with open(weekends_file, 'w') as f: json.dump(weekends, f, indent=2)
+            with open(weekends_file, 'w') as f: dump_json(weekends, f)
+            record_special_dates_change(project_id, weekend_data)
             # Regenerate calendar? Maybe not needed if generator checks this file.
             return jsonify(weekend_data), 201
         except Exception as e:
@@ -481,16 +1272,19 @@ def api_weekend(project_id, weekend_id):
         try:
             weekend_data = request.get_json()
             weekend_data['id'] = weekend_id # Ensure ID
+            previous_entry = weekends[weekend_index]
             weekends[weekend_index] = weekend_data
-            with open(weekends_file, 'w') as f: json.dump(weekends, f, indent=2)
+            with open(weekends_file, 'w') as f: dump_json(weekends, f)
+            record_special_dates_change(project_id, previous_entry, weekend_data)
             return jsonify(weekend_data)
         except Exception as e:
             logger.error(f"API Error updating weekend {weekend_id} for {project_id}: {e}")
             return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
-            del weekends[weekend_index]
-            with open(weekends_file, 'w') as f: json.dump(weekends, f, indent=2)
+            removed_entry = weekends.pop(weekend_index)
+            with open(weekends_file, 'w') as f: dump_json(weekends, f)
+            record_special_dates_change(project_id, removed_entry)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting weekend {weekend_id} for {project_id}: {e}")
@@ -520,7 +1314,8 @@ def api_holidays(project_id):
             if os.path.exists(holidays_file):
                  with open(holidays_file, 'r') as f: holidays = json.load(f)
             holidays.append(holiday_data) # Assuming no duplicates check needed for simple add
-            with open(holidays_file, 'w') as f: json.dump(holidays, f, indent=2)
+            with open(holidays_file, 'w') as f: dump_json(holidays, f)
+            record_special_dates_change(project_id, holiday_data)
             return jsonify(holiday_data), 201
         except Exception as e:
             logger.error(f"API Error creating holiday for {project_id}: {e}")
@@ -547,16 +1342,19 @@ def api_holiday(project_id, holiday_id):
         try:
             holiday_data = request.get_json()
             holiday_data['id'] = holiday_id
+            previous_entry = holidays[holiday_index]
             holidays[holiday_index] = holiday_data
-            with open(holidays_file, 'w') as f: json.dump(holidays, f, indent=2)
+            with open(holidays_file, 'w') as f: dump_json(holidays, f)
+            record_special_dates_change(project_id, previous_entry, holiday_data)
             return jsonify(holiday_data)
         except Exception as e:
              logger.error(f"API Error updating holiday {holiday_id} for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
-            del holidays[holiday_index]
-            with open(holidays_file, 'w') as f: json.dump(holidays, f, indent=2)
+            removed_entry = holidays.pop(holiday_index)
+            with open(holidays_file, 'w') as f: dump_json(holidays, f)
+            record_special_dates_change(project_id, removed_entry)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting holiday {holiday_id} for {project_id}: {e}")
@@ -586,7 +1384,8 @@ def api_hiatus_periods(project_id):
             if os.path.exists(hiatus_file):
                  with open(hiatus_file, 'r') as f: hiatus_periods = json.load(f)
             hiatus_periods.append(hiatus_data)
-            with open(hiatus_file, 'w') as f: json.dump(hiatus_periods, f, indent=2)
+            with open(hiatus_file, 'w') as f: dump_json(hiatus_periods, f)
+            record_special_dates_change(project_id, hiatus_data)
             return jsonify(hiatus_data), 201
         except Exception as e:
              logger.error(f"API Error creating hiatus for {project_id}: {e}")
@@ -614,16 +1413,19 @@ def api_hiatus_period(project_id, hiatus_id):
          try:
             hiatus_data = request.get_json()
             hiatus_data['id'] = hiatus_id
+            previous_entry = hiatus_periods[hiatus_index]
             hiatus_periods[hiatus_index] = hiatus_data
-            with open(hiatus_file, 'w') as f: json.dump(hiatus_periods, f, indent=2)
+            with open(hiatus_file, 'w') as f: dump_json(hiatus_periods, f)
+            record_special_dates_change(project_id, previous_entry, hiatus_data)
             return jsonify(hiatus_data)
          except Exception as e:
              logger.error(f"API Error updating hiatus {hiatus_id} for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
-            del hiatus_periods[hiatus_index]
-            with open(hiatus_file, 'w') as f: json.dump(hiatus_periods, f, indent=2)
+            removed_entry = hiatus_periods.pop(hiatus_index)
+            with open(hiatus_file, 'w') as f: dump_json(hiatus_periods, f)
+            record_special_dates_change(project_id, removed_entry)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting hiatus {hiatus_id} for {project_id}: {e}")
@@ -653,7 +1455,8 @@ def api_special_dates(project_id):
             if os.path.exists(special_dates_file):
                  with open(special_dates_file, 'r') as f: special_dates = json.load(f)
             special_dates.append(special_date_data)
-            with open(special_dates_file, 'w') as f: json.dump(special_dates, f, indent=2)
+            with open(special_dates_file, 'w') as f: dump_json(special_dates, f)
+            record_special_dates_change(project_id, special_date_data)
             return jsonify(special_date_data), 201
         except Exception as e:
              logger.error(f"API Error creating special date for {project_id}: {e}")
@@ -680,19 +1483,29 @@ def api_special_date(project_id, special_date_id):
         try:
             special_date_data = request.get_json()
             special_date_data['id'] = special_date_id
+            previous_entry = special_dates[special_date_index]
             special_dates[special_date_index] = special_date_data
-            with open(special_dates_file, 'w') as f: json.dump(special_dates, f, indent=2)
+            with open(special_dates_file, 'w') as f: dump_json(special_dates, f)
+            record_special_dates_change(project_id, previous_entry, special_date_data)
             return jsonify(special_date_data)
         except Exception as e:
              logger.error(f"API Error updating special date {special_date_id} for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
     elif request.method == 'DELETE':
         try:
-            del special_dates[special_date_index]
-            with open(special_dates_file, 'w') as f: json.dump(special_dates, f, indent=2)
+            removed_entry = special_dates.pop(special_date_index)
+            with open(special_dates_file, 'w') as f: dump_json(special_dates, f)
+            record_special_dates_change(project_id, removed_entry)
             return jsonify({'success': True})
         except Exception as e:
              logger.error(f"API Error deleting special date {special_date_id} for {project_id}: {e}")
              return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/metrics')
+@admin_required
+def api_metrics():
+    """Request coalescing counters: calls per singleflight group and how many waited on another request's work"""
+    from utils import singleflight, view_cache # Local import; only needed for metrics
+    return jsonify({'singleflight': singleflight.stats(), 'viewCache': view_cache.stats()})
+
 # Note: Serve static can stay in app.py or move to main_bp
\ No newline at end of file
@@ -1,14 +1,20 @@
 # routes/main.py
 import os
 import json
-from flask import Blueprint, render_template, redirect, url_for, flash, send_from_directory # <-- Add this line back
+from flask import Blueprint, Response, render_template, redirect, url_for, flash, send_from_directory, request, session # <-- Add this line back
 
 from utils.decorators import viewer_required # Absolute import
 from utils.helpers import get_project, get_project_calendar, DATA_DIR, logger, get_projects # Absolute import
 from utils.calendar_generator import calculate_department_counts, calculate_location_counts # Absolute import
+from utils.row_model import calendar_row_model
+from utils.view_cache import viewer_view, get_view
+from utils.snapshots import calendar_view
 
 main_bp = Blueprint('main', __name__)
 
+# Long calendars render as a virtualized table from a JSON row model (see utils/row_model.py)
+main_bp.add_app_template_global(calendar_row_model)
+
 @main_bp.route('/')
 @viewer_required
 def index():
@@ -25,8 +31,59 @@ def viewer(project_id):
         flash('Project not found', 'error')
         return redirect(url_for('main.index')) # Use blueprint name
 
+    # Plain views of a published project are sent as the pre-rendered page (see utils/publish.py).
+    # Admins, branch/diff modes and pending flash messages still render live.
+    if not request.args and session.get('user_role') != 'admin' and not session.get('_flashes'):
+        from utils.publish import published_response # Local import; only needed for published projects
+        response = published_response(project_id)
+        if response is not None:
+            return response
+
+    # Plain views are rendered once per source revision and view; concurrent requests share the render
+    view = viewer_view(request.args, session)
+    if view is not None:
+        body, etag = get_view(project_id, view,
+                              lambda: _render_viewer(get_project(project_id) or project, calendar_view(project_id)))
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
     calendar_data = get_project_calendar(project_id)
 
+    # Admins can preview a what-if branch (?branch=<id>) in the viewer
+    branch_id = request.args.get('branch')
+    if branch_id and session.get('user_role') == 'admin':
+        from utils.branches import get_branch, materialize # Local import; only needed for previews
+        try:
+            branch = get_branch(project_id, branch_id)
+        except ValueError:
+            branch = None
+        if not branch:
+            flash('Branch not found', 'error')
+            return redirect(url_for('main.viewer', project_id=project_id))
+        calendar_data = materialize(calendar_data, branch)
+
+    # Diff mode (?diff=<version>): highlight what changed since an earlier version
+    diff = None
+    diff_source = request.args.get('diff')
+    if diff_source:
+        from utils.versions import load_source # Local imports; only needed in diff mode
+        from utils.calendar_diff import diff_calendars, day_statuses
+        try:
+            previous, label = load_source(project_id, diff_source)
+            diff = diff_calendars(previous, calendar_data)
+            diff['from'] = label
+            diff['statuses'] = day_statuses(diff)
+            diff['changedFields'] = {c['date']: ', '.join(c['fields']) for c in diff['changed']}
+            diff['movedFrom'] = {m['to']: m['from'] for m in diff['moved']}
+        except ValueError as e:
+            flash(str(e), 'error')
+
+    return _render_viewer(project, calendar_data, diff)
+
+def _render_viewer(project, calendar_data, diff=None):
+    """viewer.html for a calendar, with the supporting data and counts it shows"""
     # --- Load supporting data ---
     departments = []
     departments_file = os.path.join(DATA_DIR, 'departments.json')
@@ -67,7 +124,83 @@ def viewer(project_id):
     # Note: Avoid saving calendar data here just for viewing
     # save_project_calendar(project_id, calendar_data)
 
-    return render_template('viewer.html', project=project, calendar=calendar_data, locations=locations)
+    return render_template('viewer.html', project=project, calendar=calendar_data, locations=locations, diff=diff)
+
+@main_bp.route('/viewer/<project_id>/calendar.ics')
+def calendar_feed(project_id):
+    """
+    iCalendar feed for calendar apps. Filters: ?dept=CODE[,CODE]&location=&area=&shoot=1.
+    Logged-in users need no token; subscriptions pass ?token= (calendar apps cannot log in).
+    """
+    from flask import Response, stream_with_context, current_app # Local imports; only needed for feeds
+    from utils.ics import feed_state, feed_etag, parse_filters, check_feed_token, cached_feed, ICS_MAX_AGE
+
+    if '/' in project_id or '.' in project_id:
+        return Response('Not found\n', status=404, mimetype='text/plain')
+    try:
+        state = feed_state(project_id)
+    except Exception as e:
+        logger.error(f"Error loading calendar feed for project {project_id}: {str(e)}")
+        return Response('Error loading calendar\n', status=500, mimetype='text/plain')
+    if not state:
+        return Response('Not found\n', status=404, mimetype='text/plain')
+    if session.get('user_role') not in ('viewer', 'admin') and \
+            not check_feed_token(current_app.secret_key, state['project'], request.args.get('token')):
+        return Response('A valid feed token is required\n', status=403, mimetype='text/plain')
+
+    filters = parse_filters(request.args)
+    etag = feed_etag(project_id, state, filters)
+    headers = {'Cache-Control': f"private, max-age={ICS_MAX_AGE}, must-revalidate"}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    response = Response(stream_with_context(cached_feed(project_id, state, filters, etag)),
+                        mimetype='text/calendar', headers=headers)
+    response.mimetype_params['charset'] = 'utf-8'
+    response.set_etag(etag)
+    filename = ''.join(c if c.isalnum() else '-' for c in (state['project'].get('title') or 'schedule').lower())
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}.ics"'
+    return response
+
+@main_bp.route('/viewer/<project_id>/schedule.pdf')
+# Same access as the viewer page
+def schedule_pdf(project_id):
+    """PDF one-liner of the schedule. Options: ?start=&end= (YYYY-MM-DD) and ?layout=oneliner|wide"""
+    from flask import Response # Local imports; only needed for PDFs
+    from utils.pdf import get_pdf, parse_range, DEFAULT_LAYOUT
+
+    project = get_project(project_id)
+    if not project:
+        return Response('Not found\n', status=404, mimetype='text/plain')
+    try:
+        date_range = parse_range(request.args)
+        body, digest = get_pdf(project, date_range, request.args.get('layout', DEFAULT_LAYOUT))
+    except ValueError as e:
+        return Response(f"{e}\n", status=400, mimetype='text/plain')
+    except Exception as e:
+        logger.error(f"Error rendering PDF for project {project_id}: {str(e)}")
+        return Response('Error rendering PDF\n', status=500, mimetype='text/plain')
+
+    response = Response(body, mimetype='application/pdf')
+    response.set_etag(f"pdf-{digest}")
+    response.cache_control.no_cache = True
+    filename = ''.join(c if c.isalnum() else '-' for c in (project.get('title') or 'schedule').lower())
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}-schedule.pdf"'
+    return response.make_conditional(request)
+
+@main_bp.route('/sw.js')
+def service_worker():
+    """Service worker for the offline viewer, served from the root so its scope is the whole site"""
+    from utils.offline import service_worker_response # Local import; only needed for the worker script
+    return service_worker_response()
+
+@main_bp.route('/offline/viewer')
+def offline_viewer():
+    """App shell the service worker shows when a viewer page cannot load (see utils/offline.py)"""
+    # Cached once and shown to whoever is on the device, like a published page: no Login/Logout link
+    return render_template('offline_viewer.html', published=True)
 
 @main_bp.route('/health')
 # @viewer_required # Apply if needed
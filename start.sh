@@ -25,9 +25,16 @@ fi
 # Create a backup of current data (if any)
 if [ -d "data" ] && [ "$(ls -A data 2>/dev/null)" ]; then
   echo "Creating backup of existing data..."
-  BACKUP_DIR="/mnt/user/backups/film-scheduler-v4/$(date +%Y%m%d_%H%M%S)"
+  BACKUP_ROOT="/mnt/user/backups/film-scheduler-v4"
+  BACKUP_DIR="$BACKUP_ROOT/$(date +%Y%m%d_%H%M%S)"
   mkdir -p "$BACKUP_DIR"
-  cp -r data/* "$BACKUP_DIR/"
+  # Hard-link files unchanged since the previous backup, so only changed files use time and space
+  PREVIOUS_BACKUP=$(ls -1d "$BACKUP_ROOT"/2*/ 2>/dev/null | grep -v "^$BACKUP_DIR/$" | sort | tail -n 1)
+  if command -v rsync >/dev/null 2>&1; then
+    rsync -a --exclude '*.tmp' ${PREVIOUS_BACKUP:+--link-dest="$PREVIOUS_BACKUP"} data/ "$BACKUP_DIR/"
+  else
+    cp -r data/* "$BACKUP_DIR/"
+  fi
   echo "Backup created at $BACKUP_DIR"
 fi
 
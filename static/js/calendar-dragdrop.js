@@ -30,64 +30,80 @@ document.addEventListener('DOMContentLoaded', function() {
     const projectId = projectIdElement.value;
     console.log(`Initializing drag and drop for project ID: ${projectId}`);
     
-    // Make days with shoot day numbers draggable
-    calendarRows.forEach(row => {
+    /**
+     * Make a row draggable only if it currently shows a shoot day number.
+     * Called again after live patches, which can change a row's shoot day.
+     */
+    function refreshDraggable(row) {
         const shootDayCell = row.querySelector('.day-cell');
         const hasShootDay = shootDayCell && shootDayCell.textContent && shootDayCell.textContent.trim() !== '';
         
-        // Check if it's a shoot day based on shoot day number presence
         if (hasShootDay) {
             row.setAttribute('draggable', 'true');
             row.classList.add('draggable');
             row.style.cursor = 'grab';
-            
-            // Drag start
-            row.addEventListener('dragstart', function(e) {
-                // Prevent default click navigation during drag
-                e.stopPropagation();
-                
-                // Set data transfer
-                const date = this.getAttribute('data-date');
-                const shootDay = this.querySelector('.day-cell').textContent.trim();
-                
-                // Store the complete day info in JSON format
-                const dayInfo = {
-                    date: date,
-                    shootDay: shootDay
-                };
-                
-                e.dataTransfer.setData('application/json', JSON.stringify(dayInfo));
-                e.dataTransfer.setData('text/plain', date); // Fallback
-                
-                // Visual feedback
-                draggedRow = this;
-                setTimeout(() => {
-                    this.classList.add('dragging');
-                    // Add class to body to signal drag is in progress
-                    document.body.classList.add('calendar-dragging');
-                }, 0);
-                
-                console.log('Started dragging:', date, 'with shoot day', shootDay);
-            });
-            
-            // Drag end
-            row.addEventListener('dragend', function(e) {
-                // Prevent default click navigation during drag
-                e.stopPropagation();
-                
-                this.classList.remove('dragging');
-                document.querySelectorAll('.calendar-row').forEach(r => r.classList.remove('drop-target'));
-                document.body.classList.remove('calendar-dragging');
-                draggedRow = null;
-                
-                console.log('Ended dragging');
-            });
         } else {
             // Ensure non-shoot days aren't draggable
             row.removeAttribute('draggable');
             row.classList.remove('draggable');
             row.style.cursor = '';
         }
+    }
+    
+    // Make days with shoot day numbers draggable
+    calendarRows.forEach(row => {
+        refreshDraggable(row);
+        
+        // Drag start
+        row.addEventListener('dragstart', function(e) {
+            if (this.getAttribute('draggable') !== 'true') {
+                e.preventDefault();
+                return;
+            }
+            // Prevent default click navigation during drag
+            e.stopPropagation();
+            
+            // Set data transfer
+            const date = this.getAttribute('data-date');
+            const shootDay = this.querySelector('.day-cell').textContent.trim();
+            
+            // Store the complete day info in JSON format
+            const dayInfo = {
+                date: date,
+                shootDay: shootDay
+            };
+            
+            e.dataTransfer.setData('application/json', JSON.stringify(dayInfo));
+            e.dataTransfer.setData('text/plain', date); // Fallback
+            
+            // Visual feedback
+            draggedRow = this;
+            setTimeout(() => {
+                this.classList.add('dragging');
+                // Add class to body to signal drag is in progress
+                document.body.classList.add('calendar-dragging');
+            }, 0);
+            
+            console.log('Started dragging:', date, 'with shoot day', shootDay);
+        });
+        
+        // Drag end
+        row.addEventListener('dragend', function(e) {
+            // Prevent default click navigation during drag
+            e.stopPropagation();
+            
+            this.classList.remove('dragging');
+            document.querySelectorAll('.calendar-row').forEach(r => r.classList.remove('drop-target'));
+            document.body.classList.remove('calendar-dragging');
+            draggedRow = null;
+            
+            console.log('Ended dragging');
+        });
+    });
+    
+    // Rows patched in place (after a move or a live update) may gain or lose a shoot day
+    document.addEventListener('calendar:patched', function() {
+        calendarRows.forEach(refreshDraggable);
     });
     
     // Set up drop zones
@@ -192,8 +208,23 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(data => {
             console.log('Move successful:', data);
-            // Reload page to show updated calendar
-            window.location.reload();
+            if (data.warnings && data.warnings.length) {
+                // Saved, but another project is booked at the same location/area
+                setTimeout(() => alert(data.warnings.map(w => w.message).join('\n')), 0);
+            }
+            if (typeof window.applyCalendarPatch === 'function' && data.days) {
+                // Patch the moved rows in place instead of reloading the page
+                window.applyCalendarPatch({
+                    type: 'move',
+                    revision: data.revision,
+                    days: data.days,
+                    counts: data.counts
+                });
+                hideLoading();
+            } else {
+                // Reload page to show updated calendar
+                window.location.reload();
+            }
         })
         .catch(error => {
             console.error('Error moving day:', error);
@@ -0,0 +1,312 @@
+/**
+ * Calendar row index and virtualized table.
+ *
+ * Every calendar page gets a row index (window.calendarRows): one facet
+ * bitmask per day (its row type plus flags), so filters and filter stats
+ * are bit tests over an array instead of repeated DOM queries.
+ *
+ * Long calendars (data-virtual="true") ship their days as a compact JSON
+ * row model (utils/row_model.py). Only the rows in view, plus an overscan
+ * margin, are in the DOM; spacer rows stand in for the rest. Row arrays
+ * are turned into day objects the first time they are rendered.
+ */
+
+// Must match FACET_BITS in utils/row_model.py
+const FACET_BITS = {
+    'weekend': 1, 'prep': 2, 'holiday': 4, 'hiatus': 8, 'shoot': 16,
+    'working-weekend': 32, 'normal': 64,
+    'secondUnit': 128
+};
+const ROW_TYPES = ['weekend', 'prep', 'holiday', 'hiatus', 'shoot', 'working-weekend', 'normal'];
+const VIRTUAL_OVERSCAN = 10; // Rows rendered above and below the visible ones
+
+/**
+ * Row type class of a day record, as the templates and patchCalendarRow compute it.
+ */
+function rowTypeOf(day) {
+    return day.dayType || (day.isWeekend ? 'weekend' : day.isHoliday ? 'holiday' :
+        day.isHiatus ? 'hiatus' : day.isPrep ? 'prep' : day.isShootDay ? 'shoot' : '');
+}
+
+function rowFacetsOf(day) {
+    return (FACET_BITS[rowTypeOf(day)] || 0) | (day.secondUnit ? FACET_BITS.secondUnit : 0);
+}
+
+/**
+ * Filter state and stats shared by both row sources.
+ */
+class CalendarRowIndex {
+    constructor(container) {
+        this.container = container;
+        this.hiddenMask = 0;
+        this.facets = new Uint8Array(0);
+    }
+
+    /** Hide rows having any of the bits in `mask`. */
+    applyFilters(mask) {
+        this.hiddenMask = mask;
+    }
+
+    isHidden(index) {
+        return (this.facets[index] & this.hiddenMask) !== 0;
+    }
+
+    stats() {
+        const shoot = FACET_BITS.shoot, second = FACET_BITS.secondUnit;
+        const stats = { total: this.facets.length, visible: 0, shootTotal: 0, shootVisible: 0, secondUnitTotal: 0, secondUnitVisible: 0 };
+        for (let i = 0; i < this.facets.length; i++) {
+            const facets = this.facets[i];
+            const visible = (facets & this.hiddenMask) === 0;
+            if (visible) stats.visible++;
+            if (facets & shoot) {
+                stats.shootTotal++;
+                if (visible) stats.shootVisible++;
+            }
+            if (facets & second) {
+                stats.secondUnitTotal++;
+                if (visible) stats.secondUnitVisible++;
+            }
+        }
+        return stats;
+    }
+}
+
+/**
+ * Index over server-rendered rows (short calendars and the admin editor,
+ * whose drag and drop binds to each row).
+ */
+class DomCalendarRows extends CalendarRowIndex {
+    constructor(container) {
+        super(container);
+        this.virtual = false;
+        this.rows = Array.from(container.querySelectorAll('.calendar-row'));
+        this.byDate = new Map(this.rows.map((row, i) => [row.dataset.date, i]));
+        this.facets = new Uint8Array(this.rows.length);
+        this.hidden = new Uint8Array(this.rows.length);
+        this.rows.forEach((row, i) => {
+            let facets = 0;
+            ROW_TYPES.forEach(type => { if (row.classList.contains(type)) facets |= FACET_BITS[type]; });
+            if (row.querySelector('.second-unit-description')) facets |= FACET_BITS.secondUnit;
+            this.facets[i] = facets;
+            this.hidden[i] = row.classList.contains('filtered-hidden') ? 1 : 0;
+        });
+    }
+
+    applyFilters(mask) {
+        super.applyFilters(mask);
+        // Only rows whose visibility changes are touched
+        for (let i = 0; i < this.rows.length; i++) {
+            const hidden = this.isHidden(i) ? 1 : 0;
+            if (hidden !== this.hidden[i]) {
+                this.rows[i].classList.toggle('filtered-hidden', hidden === 1);
+                this.hidden[i] = hidden;
+            }
+        }
+    }
+
+    /** Re-render changed days in place (live updates). */
+    patch(days, areas) {
+        days.forEach(day => {
+            const index = this.byDate.get(day.date);
+            if (index === undefined) return;
+            patchCalendarRow(this.rows[index], day, areas);
+            this.facets[index] = rowFacetsOf(day);
+        });
+    }
+}
+
+/**
+ * Virtualized rows rendered from the JSON row model.
+ */
+class VirtualCalendarRows extends CalendarRowIndex {
+    constructor(container, model) {
+        super(container);
+        this.virtual = true;
+        this.fields = model.fields;
+        this.rows = model.rows;               // Arrays until hydrated into day objects
+        this.areas = model.areas || {};
+        this.revision = model.revision;
+        const facetsAt = this.fields.indexOf('facets'), dateAt = this.fields.indexOf('date');
+        this.facets = Uint8Array.from(this.rows, row => row[facetsAt] || 0);
+        this.byDate = new Map(this.rows.map((row, i) => [row[dateAt], i]));
+
+        this.wrapper = container.querySelector('.calendar-table-wrapper');
+        this.tbody = container.querySelector('.calendar-table tbody');
+        this.columns = container.querySelectorAll('.calendar-table thead th').length || 10;
+        this.topSpacer = this.createSpacer();
+        this.bottomSpacer = this.createSpacer();
+        this.rendered = new Map();            // Row index -> <tr> currently in the DOM
+        this.range = [0, 0];
+        this.printing = false;
+        this.frame = null;
+        this.pendingForce = false;
+
+        // Row heights: measured once rendered, estimated from the server-rendered rows until then
+        this.heights = new Float32Array(this.rows.length);
+        const initial = Array.from(this.tbody.querySelectorAll('.calendar-row'));
+        const measured = initial.map(row => row.offsetHeight).filter(Boolean);
+        this.estimate = measured.length ? measured.reduce((a, b) => a + b, 0) / measured.length : 48;
+        this.heights.fill(this.estimate);
+        initial.forEach((row, i) => { if (row.offsetHeight) this.heights[i] = row.offsetHeight; });
+
+        this.visible = Int32Array.from(this.rows.keys());
+        this.tbody.replaceChildren(this.topSpacer, this.bottomSpacer);
+
+        const schedule = () => this.scheduleRender();
+        (this.wrapper || window).addEventListener('scroll', schedule, { passive: true });
+        window.addEventListener('scroll', schedule, { passive: true });
+        window.addEventListener('resize', schedule);
+        // Printing needs every (filtered) row in the DOM
+        window.addEventListener('beforeprint', () => { this.printing = true; this.render(true); });
+        window.addEventListener('afterprint', () => { this.printing = false; this.render(true); });
+        this.render(true);
+        console.log(`Virtualized calendar: ${this.rows.length} rows`);
+    }
+
+    createSpacer() {
+        const row = document.createElement('tr');
+        row.className = 'virtual-spacer';
+        row.setAttribute('aria-hidden', 'true');
+        row.appendChild(document.createElement('td'));
+        return row;
+    }
+
+    /** Day object for a row, converting the row array on first use. */
+    hydrate(index) {
+        const row = this.rows[index];
+        if (!Array.isArray(row)) return row;
+        const day = {};
+        this.fields.forEach((field, i) => { day[field] = row[i]; });
+        this.rows[index] = day;
+        return day;
+    }
+
+    buildRow(index) {
+        const day = this.hydrate(index);
+        const row = document.createElement('tr');
+        row.className = 'calendar-row';
+        row.dataset.date = day.date;
+        row.innerHTML = '<td class="date-cell"><div class="date-display"></div><div class="date-day"></div></td>' +
+            '<td class="day-cell"></td><td class="main-unit-cell"></td><td class="extras-cell"></td>' +
+            '<td class="featured-extras-cell"></td><td class="location-cell"></td><td class="sequence-cell"></td>' +
+            '<td class="departments-cell"></td><td class="notes-cell"></td><td class="second-unit-cell"></td>';
+        row.querySelector('.date-display').textContent = day.date;
+        row.querySelector('.date-day').textContent = day.dayOfWeek || '';
+        patchCalendarRow(row, day, this.areas);
+        return row;
+    }
+
+    applyFilters(mask) {
+        super.applyFilters(mask);
+        const visible = [];
+        for (let i = 0; i < this.rows.length; i++) {
+            if (!this.isHidden(i)) visible.push(i);
+        }
+        this.visible = Int32Array.from(visible);
+        this.render(true);
+    }
+
+    patch(days, areas) {
+        days.forEach(day => {
+            const index = this.byDate.get(day.date);
+            if (index === undefined) return;
+            this.rows[index] = day;
+            this.facets[index] = rowFacetsOf(day);
+            this.rendered.delete(index); // Rebuilt on the next render
+        });
+        this.render(true);
+    }
+
+    scheduleRender(force = false) {
+        this.pendingForce = this.pendingForce || force;
+        if (this.frame !== null) return;
+        this.frame = requestAnimationFrame(() => {
+            const force = this.pendingForce;
+            this.frame = null;
+            this.pendingForce = false;
+            this.render(force);
+        });
+    }
+
+    /** Visible part of the table body, in tbody coordinates. */
+    viewport() {
+        const bodyTop = this.tbody.getBoundingClientRect().top;
+        const clip = this.wrapper ? this.wrapper.getBoundingClientRect() : { top: 0, bottom: window.innerHeight };
+        return {
+            top: Math.max(clip.top, 0) - bodyTop,
+            bottom: Math.min(clip.bottom, window.innerHeight) - bodyTop
+        };
+    }
+
+    render(force) {
+        const visible = this.visible, heights = this.heights, count = visible.length;
+        let start = 0, end = count, before = 0;
+        if (!this.printing) {
+            const { top, bottom } = this.viewport();
+            let y = 0, first = 0;
+            while (first < count && y + heights[visible[first]] <= top) y += heights[visible[first++]];
+            start = Math.max(0, first - VIRTUAL_OVERSCAN);
+            before = y;
+            for (let k = start; k < first; k++) before -= heights[visible[k]];
+            end = first;
+            while (end < count && y < bottom) y += heights[visible[end++]];
+            end = Math.min(count, end + VIRTUAL_OVERSCAN);
+        }
+        if (!force && start === this.range[0] && end === this.range[1]) return;
+        this.range = [start, end];
+
+        let after = 0;
+        for (let k = end; k < count; k++) after += heights[visible[k]];
+
+        const rendered = new Map();
+        const rows = [];
+        for (let k = start; k < end; k++) {
+            const index = visible[k];
+            const row = this.rendered.get(index) || this.buildRow(index);
+            rendered.set(index, row);
+            rows.push(row);
+        }
+        this.rendered = rendered;
+        this.topSpacer.firstChild.colSpan = this.bottomSpacer.firstChild.colSpan = this.columns;
+        this.topSpacer.firstChild.style.height = `${before}px`;
+        this.bottomSpacer.firstChild.style.height = `${after}px`;
+        this.topSpacer.hidden = before === 0;
+        this.bottomSpacer.hidden = after === 0;
+        this.tbody.replaceChildren(this.topSpacer, ...rows, this.bottomSpacer);
+
+        // Remember real heights so spacers match the rows they replace; re-render once they settle
+        let resized = false;
+        rows.forEach((row, k) => {
+            const height = row.offsetHeight;
+            if (height && Math.abs(height - heights[visible[start + k]]) > 0.5) {
+                heights[visible[start + k]] = height;
+                resized = true;
+            }
+        });
+        if (resized && !this.printing) this.scheduleRender(true);
+        document.dispatchEvent(new CustomEvent('calendar:rows-rendered', { detail: { rows } }));
+    }
+}
+
+/**
+ * Build the page's row index: virtualized when the server sent a row model.
+ */
+function createCalendarRows() {
+    const container = document.querySelector('.calendar-container[data-project-id]');
+    if (!container) return null;
+    const modelElement = container.querySelector('#calendar-rows');
+    if (container.dataset.virtual === 'true' && modelElement) {
+        try {
+            return new VirtualCalendarRows(container, JSON.parse(modelElement.textContent));
+        } catch (error) {
+            console.error('Error setting up the virtualized calendar, using the rendered rows:', error);
+        }
+    }
+    return new DomCalendarRows(container);
+}
+
+window.calendarRows = null;
+document.addEventListener('DOMContentLoaded', function() {
+    // Registered before calendar.js's initializers, which filter through window.calendarRows
+    window.calendarRows = createCalendarRows();
+});
@@ -185,13 +185,16 @@ function applyLocationAreaColors(areas) {
 // Make it available globally for other scripts
 window.applyLocationAreaColors = applyLocationAreaColors;
 
+let departmentColorCache = null; // Department code -> color, parsed on first use
+
 /**
  * Apply colors to department tags based on embedded or default data.
+ * @param {ParentNode} [root=document] - Limit coloring to tags inside this element.
  */
-function applyDepartmentTagColors() {
-    console.log("Applying department tag colors...");
-    let departmentColors = {};
-    const departmentDataElement = document.getElementById('department-data');
+function applyDepartmentTagColors(root = document) {
+    if (root === document) console.log("Applying department tag colors...");
+    let departmentColors = departmentColorCache || {};
+    const departmentDataElement = departmentColorCache ? null : document.getElementById('department-data');
 
     const fallbackColors = { // Keep fallback just in case
         "SFX": "#ffd8e6", "STN": "#ffecd8", "CR": "#d8fff2", "ST": "#f2d8ff",
@@ -207,12 +210,13 @@ function applyDepartmentTagColors() {
             console.error('Error parsing department data, using fallbacks:', e);
             departmentColors = fallbackColors;
         }
-    } else {
+    } else if (!departmentColorCache) {
         console.warn("Department data element not found, using fallbacks.");
         departmentColors = fallbackColors;
     }
+    departmentColorCache = departmentColors;
 
-    const departmentTags = document.querySelectorAll('.department-tag');
+    const departmentTags = root.querySelectorAll('.department-tag');
     departmentTags.forEach(tag => {
         const deptCode = tag.getAttribute('data-dept-code') || tag.textContent.trim();
         if (departmentColors[deptCode]) {
@@ -225,7 +229,7 @@ function applyDepartmentTagColors() {
              ensureTextContrast(tag);
         }
     });
-    console.log("Finished applying department tag colors.");
+    if (root === document) console.log("Finished applying department tag colors.");
 }
 
 /**
@@ -235,10 +239,10 @@ function applyDepartmentTagColors() {
  */
 function toggleRowType(rowType, isVisible) {
     // console.log(`Toggling row type ${rowType} to ${isVisible ? 'visible' : 'hidden'}`);
-    const rows = document.querySelectorAll(`.calendar-row.${rowType}`);
-    rows.forEach(row => {
-        row.classList.toggle('filtered-hidden', !isVisible);
-    });
+    const rows = window.calendarRows; // Facet bitmask index, see calendar-virtual.js
+    if (!rows) return;
+    const bit = FACET_BITS[rowType] || 0;
+    rows.applyFilters(isVisible ? rows.hiddenMask & ~bit : rows.hiddenMask | bit);
     updateFilterStats(); // Update stats after visibility change
 }
 
@@ -249,12 +253,10 @@ function toggleRowType(rowType, isVisible) {
  */
 function toggleColumnVisibility(colName, isVisible) {
     // console.log(`Toggling column ${colName} to ${isVisible ? 'visible' : 'hidden'}`);
-    const headers = document.querySelectorAll(`.${colName}-col`);
-    const cells = document.querySelectorAll(`.${colName}-cell`);
-    const displayValue = isVisible ? '' : 'none'; // Use '' to reset to default display
-
-    headers.forEach(header => { header.style.display = displayValue; });
-    cells.forEach(cell => { cell.style.display = displayValue; });
+    // A class on the table (see calendar.css) also covers rows rendered later by the virtualized table
+    document.querySelectorAll('.calendar-table').forEach(table => {
+        table.classList.toggle(`hide-col-${colName}`, !isVisible);
+    });
 }
 
 /**
@@ -312,24 +314,17 @@ function saveFilterPreferences() {
  */
 function applyAllFilters() {
     // console.log("Applying all filters based on checkbox states...");
-    // Reset row visibility first
-    document.querySelectorAll('.calendar-row').forEach(row => {
-        row.classList.remove('filtered-hidden');
-    });
-
-    // Apply row filters
+    // Apply row filters: one bitmask of hidden row types, applied in a single pass
     const rowMappings = {
         'filter-weekends': 'weekend', 'filter-prep': 'prep', 'filter-holidays': 'holiday',
         'filter-hiatus': 'hiatus', 'filter-shoot': 'shoot'
     };
+    let hiddenMask = 0;
     for (const [elementId, rowType] of Object.entries(rowMappings)) {
         const toggle = document.getElementById(elementId);
-        if (toggle && !toggle.checked) {
-            toggleRowType(rowType, false);
-        } else if (toggle && toggle.checked) {
-             toggleRowType(rowType, true); // Ensure shown if checked (handles reset case)
-        }
+        if (toggle && !toggle.checked) hiddenMask |= FACET_BITS[rowType];
     }
+    if (window.calendarRows) window.calendarRows.applyFilters(hiddenMask);
 
     // Apply column filters
     const colMappings = {
@@ -350,24 +345,19 @@ function applyAllFilters() {
  * Updates the filter statistics display elements.
  */
 function updateFilterStats() {
-    const totalRows = document.querySelectorAll('.calendar-row').length;
-    // Count only rows that DON'T have the filtered-hidden class
-    const visibleRows = document.querySelectorAll('.calendar-row:not(.filtered-hidden)').length;
-    const totalShootDays = document.querySelectorAll('.calendar-row.shoot').length;
-    const visibleShootDays = document.querySelectorAll('.calendar-row.shoot:not(.filtered-hidden)').length;
-    // Add stats for second unit days if needed
-    // const totalSecondUnitDays = document.querySelectorAll('.calendar-row .second-unit-cell:not(:empty)').length; // Example criteria
-    // const visibleSecondUnitDays = document.querySelectorAll('.calendar-row:not(.filtered-hidden) .second-unit-cell:not(:empty)').length; // Example criteria
+    if (!window.calendarRows) return;
+    // Counted from the facet bitmasks, so rows the virtualized table hasn't rendered count too
+    const stats = window.calendarRows.stats();
 
     const statsTotal = document.getElementById('filter-stats-total');
     const statsVisible = document.getElementById('filter-stats-visible');
     const statsShootDays = document.getElementById('filter-stats-shoot-days');
-    // const statsSecondUnit = document.getElementById('filter-stats-second-unit'); // Get the element
+    const statsSecondUnit = document.getElementById('filter-stats-second-unit');
 
-    if (statsTotal) statsTotal.textContent = totalRows;
-    if (statsVisible) statsVisible.textContent = visibleRows;
-    if (statsShootDays) statsShootDays.textContent = `${visibleShootDays} / ${totalShootDays}`;
-    // if (statsSecondUnit) statsSecondUnit.textContent = `${visibleSecondUnitDays} / ${totalSecondUnitDays}`; // Update the display
+    if (statsTotal) statsTotal.textContent = stats.total;
+    if (statsVisible) statsVisible.textContent = stats.visible;
+    if (statsShootDays) statsShootDays.textContent = `${stats.shootVisible} / ${stats.shootTotal}`;
+    if (statsSecondUnit) statsSecondUnit.textContent = `${stats.secondUnitVisible} / ${stats.secondUnitTotal}`;
 }
 
 /**
@@ -641,6 +631,285 @@ function setupZoomControls() {
      console.log("Zoom controls setup finished.");
 }
 
+// =======================================
+// Live Updates (server-sent events)
+// =======================================
+
+/**
+ * Re-render one calendar row from a day record, mirroring the row markup
+ * in viewer.html and admin/calendar.html.
+ * @param {HTMLTableRowElement} row - The existing row for the day's date.
+ * @param {object} day - Day record as stored in calendar.json.
+ * @param {object} areas - Area name to color map (from getLocationAreas).
+ */
+function patchCalendarRow(row, day, areas) {
+    const setText = (selector, text) => {
+        const cell = row.querySelector(selector);
+        if (cell) cell.textContent = text;
+        return cell;
+    };
+    const appendDiv = (parent, className, text) => {
+        const div = document.createElement('div');
+        div.className = className;
+        div.textContent = text;
+        parent.appendChild(div);
+        return div;
+    };
+
+    // Row type classes
+    const dayTypes = ['weekend', 'holiday', 'hiatus', 'prep', 'shoot', 'working-weekend', 'normal'];
+    row.classList.remove(...dayTypes);
+    const dayType = day.dayType || (day.isWeekend ? 'weekend' : day.isHoliday ? 'holiday' :
+        day.isHiatus ? 'hiatus' : day.isPrep ? 'prep' : day.isShootDay ? 'shoot' : '');
+    if (dayType) row.classList.add(dayType);
+
+    // Area color
+    const areaColor = day.locationArea && areas[day.locationArea];
+    row.setAttribute('data-area', day.locationArea || '');
+    if (areaColor) {
+        row.style.setProperty('--row-area-color', areaColor);
+        row.setAttribute('data-color', areaColor);
+        row.classList.add('has-area-color');
+    } else {
+        row.style.removeProperty('--row-area-color');
+        row.removeAttribute('data-color');
+        row.classList.remove('has-area-color');
+    }
+
+    // Light times (recomputed server-side when the location's coordinates change)
+    const dateCell = row.querySelector('.date-cell');
+    if (dateCell) {
+        const light = day.daylight;
+        let lightDiv = dateCell.querySelector('.date-daylight');
+        if (light && light.sunrise && light.sunset) {
+            if (!lightDiv) lightDiv = appendDiv(dateCell, 'date-daylight', '');
+            lightDiv.textContent = `${light.sunrise}–${light.sunset}`;
+            lightDiv.title = `Civil twilight ${light.dawn || '-'}–${light.dusk || '-'}, ` +
+                `${Math.floor(light.minutes / 60)}h ${String(light.minutes % 60).padStart(2, '0')}m daylight`;
+        } else if (lightDiv) {
+            lightDiv.remove();
+        }
+    }
+
+    setText('.day-cell', day.shootDay ? day.shootDay : '');
+    setText('.main-unit-cell', day.mainUnit || '');
+    setText('.extras-cell', day.extras > 0 ? day.extras : '');
+    setText('.featured-extras-cell', day.featuredExtras > 0 ? day.featuredExtras : '');
+    setText('.sequence-cell', day.sequence || '');
+    setText('.notes-cell', day.notes || '');
+
+    const locationCell = setText('.location-cell', '');
+    if (locationCell && day.location) {
+        appendDiv(locationCell, 'location-name', day.location);
+        if (day.locationArea) appendDiv(locationCell, 'location-area', day.locationArea);
+    }
+
+    const departmentsCell = setText('.departments-cell', '');
+    if (departmentsCell) {
+        (day.departments || []).forEach(dept => {
+            const tag = document.createElement('span');
+            tag.className = 'department-tag';
+            tag.textContent = dept;
+            departmentsCell.appendChild(tag);
+        });
+        applyDepartmentTagColors(departmentsCell);
+    }
+
+    const secondUnitCell = setText('.second-unit-cell', '');
+    if (secondUnitCell && day.secondUnit) {
+        const content = appendDiv(secondUnitCell, 'second-unit-content', '');
+        appendDiv(content, 'second-unit-description', day.secondUnit);
+        if (day.secondUnitLocation) appendDiv(content, 'second-unit-location', day.secondUnitLocation);
+    }
+}
+
+/**
+ * Update the department, area and location counters in place.
+ * @param {object} counts - {departmentCounts, areaCounts, locationCounts}.
+ */
+function updateCounters(counts) {
+    const departmentCounts = counts.departmentCounts || {};
+    document.querySelectorAll('.department-counters [data-count-key]').forEach(el => {
+        el.textContent = departmentCounts[el.dataset.countKey] || 0;
+    });
+    const areaCounts = counts.areaCounts || {};
+    document.querySelectorAll('.location-areas [data-area-id]').forEach(el => {
+        el.textContent = areaCounts[el.dataset.areaId] || 0;
+    });
+    const locationCounts = counts.locationCounts || {};
+    document.querySelectorAll('.location-counters [data-location]').forEach(el => {
+        el.textContent = locationCounts[el.dataset.location] || 0;
+    });
+}
+
+/**
+ * Apply a change event ('day', 'move', 'counts' or 'regenerated') to the
+ * page without reloading. Events at or below the page's revision are skipped,
+ * so a patch applied from an API response is not applied again from the stream.
+ * @param {object} event - {type, revision, days?, counts?}
+ */
+function applyCalendarPatch(event) {
+    const container = document.querySelector('.calendar-container[data-project-id]');
+    if (!container || !event) return;
+
+    const currentRevision = parseInt(container.dataset.revision || '0', 10);
+    if (event.revision && event.revision <= currentRevision) return;
+
+    if (event.type === 'regenerated') {
+        // Days may have been added or removed - rebuild the page
+        window.location.reload();
+        return;
+    }
+
+    if (event.days && event.days.length && window.calendarRows) {
+        window.calendarRows.patch(event.days, getLocationAreas());
+        applyAllFilters(); // Row types may have changed
+    }
+    if (event.counts) updateCounters(event.counts);
+    if (event.revision) container.dataset.revision = event.revision;
+
+    document.dispatchEvent(new CustomEvent('calendar:patched', { detail: event }));
+}
+window.applyCalendarPatch = applyCalendarPatch;
+
+/**
+ * Subscribe to the project's server-sent events feed. The browser reconnects
+ * on its own and resumes from the last revision seen (Last-Event-ID).
+ */
+function setupLiveUpdates() {
+    const container = document.querySelector('.calendar-container[data-project-id]');
+    if (!container || !window.EventSource) {
+        console.log("Live updates unavailable, skipping.");
+        return;
+    }
+    if (container.dataset.live === 'false') {
+        // Branch previews show a what-if calendar; main's live events don't apply
+        return;
+    }
+
+    const projectId = container.dataset.projectId;
+    const since = container.dataset.revision || '0';
+    const source = new EventSource(`/api/projects/${projectId}/events?since=${since}`);
+
+    ['day', 'move', 'counts', 'regenerated'].forEach(type => {
+        source.addEventListener(type, (e) => {
+            try {
+                applyCalendarPatch(JSON.parse(e.data));
+            } catch (error) {
+                console.error(`Error applying ${type} event:`, error);
+            }
+        });
+    });
+    console.log(`Live updates subscribed for project ${projectId} from revision ${since}`);
+}
+
+/**
+ * Undo/redo buttons and shortcuts (Ctrl+Z, Ctrl+Shift+Z / Ctrl+Y) on the admin
+ * calendar. The page's revision is sent along, so an undo never applies on top
+ * of changes this page has not seen yet.
+ */
+function setupUndoRedo() {
+    const container = document.querySelector('.calendar-container.admin-calendar[data-project-id]');
+    if (!container) return;
+    const projectId = container.dataset.projectId;
+
+    const step = (action) => {
+        fetch(`/api/projects/${projectId}/${action}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ revision: parseInt(container.dataset.revision || '0', 10) })
+        })
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                alert(data.error || `Could not ${action}`);
+                return;
+            }
+            applyCalendarPatch(data);
+        })
+        .catch(error => console.error(`Error during ${action}:`, error));
+    };
+
+    const undoButton = document.getElementById('undo-button');
+    const redoButton = document.getElementById('redo-button');
+    if (undoButton) undoButton.addEventListener('click', () => step('undo'));
+    if (redoButton) redoButton.addEventListener('click', () => step('redo'));
+
+    document.addEventListener('keydown', (e) => {
+        if (!(e.ctrlKey || e.metaKey) || e.target.closest('input, textarea, select, [contenteditable]')) return;
+        const key = e.key.toLowerCase();
+        if (key === 'z' || key === 'y') {
+            e.preventDefault();
+            step(key === 'y' || e.shiftKey ? 'redo' : 'undo');
+        }
+    });
+}
+
+/**
+ * Spreadsheet import on the admin calendar. The server validates every row
+ * before writing anything; changed rows then arrive through live updates.
+ */
+function setupSpreadsheetImport() {
+    const container = document.querySelector('.calendar-container.admin-calendar[data-project-id]');
+    const button = document.getElementById('import-calendar-button');
+    const input = document.getElementById('import-calendar-file');
+    if (!container || !button || !input) return;
+
+    button.addEventListener('click', () => input.click());
+    input.addEventListener('change', () => {
+        const file = input.files[0];
+        if (!file) return;
+        const formData = new FormData();
+        formData.append('file', file);
+        button.disabled = true;
+
+        fetch(`/api/projects/${container.dataset.projectId}/calendar/import`, { method: 'POST', body: formData })
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                const details = (data.errors || []).slice(0, 10)
+                    .map(e => `Row ${e.row}${e.date ? ` (${e.date})` : ''}: ${e.error}`).join('\n');
+                const more = data.errorCount > 10 ? `\n...and ${data.errorCount - 10} more` : '';
+                alert(`${data.error || 'Import failed'}${details ? `\n\n${details}${more}` : ''}`);
+                return;
+            }
+            alert(`Imported ${data.rows} row(s); ${data.updated} day(s) changed.`);
+        })
+        .catch(error => console.error('Error importing spreadsheet:', error))
+        .finally(() => {
+            button.disabled = false;
+            input.value = '';
+        });
+    });
+}
+
+/**
+ * Publish button on the admin calendar: renders the viewer page as a static
+ * snapshot. Once published, the server republishes after every save.
+ */
+function setupPublish() {
+    const container = document.querySelector('.calendar-container.admin-calendar[data-project-id]');
+    const button = document.getElementById('publish-button');
+    if (!container || !button) return;
+
+    button.addEventListener('click', () => {
+        button.disabled = true;
+        fetch(`/api/projects/${container.dataset.projectId}/publish`, { method: 'POST' })
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) {
+                alert(data.error || 'Publishing failed');
+                return;
+            }
+            button.textContent = 'Republish';
+            button.dataset.published = 'true';
+            alert(`Published revision ${data.revision} (${data.version || 'unversioned'}) at ${data.url}`);
+        })
+        .catch(error => console.error('Error publishing project:', error))
+        .finally(() => { button.disabled = false; });
+    });
+}
+
 // =======================================
 // Main Initialization on DOMContentLoaded
 // =======================================
@@ -715,6 +984,34 @@ document.addEventListener('DOMContentLoaded', function() {
     } catch (error) {
         console.error("Error setting up sticky header:", error);
     }
+
+    // --- 8. Live Updates ---
+    try {
+        setupLiveUpdates(); // Patches rows and counters as changes are published
+    } catch (error) {
+        console.error("Error setting up live updates:", error);
+    }
+
+    // --- 9. Undo / Redo (admin calendar) ---
+    try {
+        setupUndoRedo();
+    } catch (error) {
+        console.error("Error setting up undo/redo:", error);
+    }
+
+    // --- 10. Spreadsheet Import (admin calendar) ---
+    try {
+        setupSpreadsheetImport();
+    } catch (error) {
+        console.error("Error setting up spreadsheet import:", error);
+    }
+
+    // --- 11. Publish (admin calendar) ---
+    try {
+        setupPublish();
+    } catch (error) {
+        console.error("Error setting up publishing:", error);
+    }
     
     console.log("All initializers called.");
 });
\ No newline at end of file
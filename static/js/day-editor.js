@@ -1,65 +1,29 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // Location dropdown functionality
-    const locationSelect = document.getElementById('location');
+    // Location autocomplete functionality
+    const locationInput = document.getElementById('location');
     const locationAreaDisplay = document.getElementById('location-area-display');
+    const locationAreas = {}; // Location name -> area name, from the suggestions seen so far
     
-    if (locationSelect) {
-        // Fetch locations from API
-        fetchLocations();
+    if (locationInput) {
+        attachAutocomplete(locationInput, 'location', document.getElementById('location-suggestions'), function(results) {
+            results.forEach(result => {
+                locationAreas[result.value] = result.area || '';
+            });
+        });
         
         // Handle location selection change
-        locationSelect.addEventListener('change', function() {
-            updateLocationArea(this.value);
+        locationInput.addEventListener('change', function() {
+            updateLocationArea(this.value.trim());
         });
     }
     
-    // Department tags functionality
-    initializeDepartmentTags();
-    
-    // Function to fetch locations from API
-    function fetchLocations() {
-        fetch('/api/locations')
-            .then(response => response.json())
-            .then(locations => {
-                populateLocationDropdown(locations);
-                
-                // If a location is already selected, update the area
-                if (locationSelect.value) {
-                    updateLocationArea(locationSelect.value);
-                }
-            })
-            .catch(error => {
-                console.error('Error fetching locations:', error);
-            });
+    const sequenceInput = document.getElementById('sequence');
+    if (sequenceInput) {
+        attachAutocomplete(sequenceInput, 'sequence', document.getElementById('sequence-suggestions'));
     }
     
-    // Function to populate location dropdown
-    function populateLocationDropdown(locations) {
-        // Save current selection
-        const currentSelection = locationSelect.value;
-        
-        // Clear existing options except the first one (placeholder)
-        while (locationSelect.options.length > 1) {
-            locationSelect.remove(1);
-        }
-        
-        // Sort locations by name
-        locations.sort((a, b) => a.name.localeCompare(b.name));
-        
-        // Add location options
-        locations.forEach(location => {
-            const option = document.createElement('option');
-            option.value = location.name;
-            option.textContent = location.name;
-            option.setAttribute('data-area-id', location.areaId || '');
-            locationSelect.appendChild(option);
-        });
-        
-        // Restore selection if it exists
-        if (currentSelection) {
-            locationSelect.value = currentSelection;
-        }
-    }
+    // Department tags functionality
+    initializeDepartmentTags();
     
     // Function to update location area based on selection
     function updateLocationArea(locationName) {
@@ -69,30 +33,72 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        // Find the selected option
-        const selectedOption = Array.from(locationSelect.options).find(option => option.value === locationName);
+        const applyArea = areaName => {
+            locationAreaDisplay.textContent = areaName || '';
+            document.getElementById('locationArea').value = areaName || '';
+        };
         
-        if (selectedOption) {
-            const areaId = selectedOption.getAttribute('data-area-id');
-            
-            // If area ID exists, fetch area details
-            if (areaId) {
-                fetch(`/api/areas/${areaId}`)
-                    .then(response => response.json())
-                    .then(area => {
-                        locationAreaDisplay.textContent = area.name || '';
-                        document.getElementById('locationArea').value = area.name || '';
-                    })
-                    .catch(error => {
-                        console.error('Error fetching area details:', error);
-                    });
-            } else {
-                locationAreaDisplay.textContent = '';
-                document.getElementById('locationArea').value = '';
-            }
+        if (locationName in locationAreas) {
+            applyArea(locationAreas[locationName]);
+            return;
         }
+        
+        // Typed or pasted without picking a suggestion: look the exact name up
+        fetchSuggestions('location', locationName, 5)
+            .then(results => {
+                const match = results.find(result => result.value.toLowerCase() === locationName.toLowerCase());
+                applyArea(match ? match.area : '');
+            })
+            .catch(error => {
+                console.error('Error fetching location area:', error);
+            });
     }
 });
+
+// Fetch autocomplete suggestions (type: location, department or sequence)
+function fetchSuggestions(type, query, limit = 10) {
+    const params = new URLSearchParams({ type: type, q: query, limit: limit });
+    return fetch(`/api/autocomplete?${params}`)
+        .then(response => response.json())
+        .then(data => data.results || []);
+}
+
+// Fill a <datalist> with server-side suggestions as the user types
+function attachAutocomplete(input, type, datalist, onResults) {
+    if (!input || !datalist) return;
+    
+    let timer = null;
+    let lastQuery = null;
+    
+    const update = () => {
+        const query = input.value.trim();
+        if (query === lastQuery) return;
+        lastQuery = query;
+        
+        fetchSuggestions(type, query)
+            .then(results => {
+                if (input.value.trim() !== query) return; // A newer query is on its way
+                datalist.innerHTML = '';
+                results.forEach(result => {
+                    const option = document.createElement('option');
+                    option.value = result.value;
+                    if (result.area) option.label = `${result.value} (${result.area})`;
+                    datalist.appendChild(option);
+                });
+                if (onResults) onResults(results);
+            })
+            .catch(error => {
+                console.error(`Error fetching ${type} suggestions:`, error);
+            });
+    };
+    
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(update, 150);
+    });
+    input.addEventListener('focus', update);
+}
+
 // Department tag selection functionality
 function initializeDepartmentTags() {
     const departmentsInput = document.getElementById('departments');
@@ -105,9 +111,10 @@ function initializeDepartmentTags() {
     
     let selectedDepartments = departmentsInput.value ? departmentsInput.value.split(',') : [];
     
-    // Fetch departments
-    fetch('/api/departments')
-        .then(response => response.json())
+    // Fetch departments once; the selector and the selected tags share the list
+    const departmentsPromise = fetch('/api/departments').then(response => response.json());
+    
+    departmentsPromise
         .then(departments => {
             // Populate department tag selector
             populateDepartmentTags(departments);
@@ -189,8 +196,7 @@ function initializeDepartmentTags() {
         }
         
         // Get department details for selected codes
-        fetch('/api/departments')
-            .then(response => response.json())
+        departmentsPromise
             .then(departments => {
                 // Create a map of department codes to details
                 const departmentMap = {};
@@ -0,0 +1,123 @@
+/**
+ * Offline viewer shell (templates/offline_viewer.html)
+ *
+ * The service worker shows this page when a viewer page cannot be loaded.
+ * It renders the calendar from the project's cached row model, applying
+ * newer revisions as the worker syncs them, or lists the projects that
+ * are available offline.
+ */
+const DATA_CACHE = 'aag-calendars'; // Must match DATA_CACHE in service-worker.js
+
+function offlineProjectId() {
+    const match = window.location.pathname.match(/^\/viewer\/([^/.]+)\/?$/);
+    return match ? match[1] : null;
+}
+
+/** Day objects from the row model's arrays (see utils/row_model.py). */
+function daysFromModel(model) {
+    return model.rows.map(row => {
+        const day = {};
+        model.fields.forEach((field, i) => { day[field] = row[i]; });
+        return day;
+    });
+}
+
+function setOfflineStatus(model, syncedAt) {
+    const status = document.getElementById('offline-status');
+    if (!status) return;
+    status.hidden = false;
+    const synced = syncedAt ? new Date(syncedAt).toLocaleString() : 'unknown';
+    status.textContent = `${navigator.onLine ? 'Saved copy' : 'Offline'}: revision ${model.revision}, last synced ${synced}. `;
+    if (navigator.onLine) {
+        const reload = document.createElement('a');
+        reload.href = window.location.pathname;
+        reload.textContent = 'Load the full page';
+        status.appendChild(reload);
+    }
+}
+
+async function fetchRowModel(projectId) {
+    // Answered from the service worker's cache when there is a copy
+    const response = await fetch(`/api/projects/${projectId}/rows`);
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    return { model: await response.json(), syncedAt: response.headers.get('X-Synced-At') };
+}
+
+async function showOfflineCalendar(container, projectId) {
+    let result;
+    try {
+        result = await fetchRowModel(projectId);
+    } catch (error) {
+        console.error(`No offline copy of project ${projectId}:`, error);
+        container.hidden = true;
+        document.getElementById('offline-missing').hidden = false;
+        return;
+    }
+    const { model, syncedAt } = result;
+    const project = model.project || {};
+    document.title = `${project.title || 'Untitled Project'} - Schedule, At a Glance!`;
+    document.getElementById('offline-title').textContent =
+        project.version ? `${project.title} (${project.version})` : project.title || 'Untitled Project';
+    document.getElementById('offline-pdf').href = `/viewer/${projectId}/schedule.pdf`;
+    setOfflineStatus(model, syncedAt);
+
+    departmentColorCache = model.departments || {}; // calendar.js: department tag colors
+    container.dataset.projectId = projectId;
+    container.dataset.revision = model.revision;
+    window.calendarRows = new VirtualCalendarRows(container, model);
+    applyAllFilters();
+
+    // The service worker posts here when it synced a newer revision
+    if (!('serviceWorker' in navigator)) return;
+    navigator.serviceWorker.addEventListener('message', async event => {
+        const data = event.data || {};
+        if (data.projectId !== projectId) return;
+        if (data.type === 'calendar-removed') {
+            window.location.reload();
+            return;
+        }
+        if (data.type !== 'calendar-updated' || data.revision <= Number(container.dataset.revision)) return;
+        try {
+            const fresh = await fetchRowModel(projectId);
+            if (fresh.model.total !== window.calendarRows.rows.length) {
+                window.location.reload(); // Days added or removed
+                return;
+            }
+            window.calendarRows.patch(daysFromModel(fresh.model), fresh.model.areas || {});
+            applyAllFilters();
+            container.dataset.revision = fresh.model.revision;
+            setOfflineStatus(fresh.model, fresh.syncedAt);
+        } catch (error) {
+            console.error('Error applying synced calendar:', error);
+        }
+    });
+}
+
+async function showOfflineProjects(container) {
+    container.hidden = true;
+    const list = document.getElementById('offline-projects');
+    list.hidden = false;
+    if (!window.caches) return;
+    const cache = await caches.open(DATA_CACHE);
+    const responses = await Promise.all((await cache.keys()).map(request => cache.match(request)));
+    const models = await Promise.all(responses.map(response => response.json().catch(() => null)));
+    const items = models.filter(model => model && model.project).map(model => {
+        const item = document.createElement('li');
+        const link = document.createElement('a');
+        link.href = `/viewer/${model.project.id}`;
+        link.textContent = model.project.version ? `${model.project.title} (${model.project.version})` : model.project.title;
+        item.appendChild(link);
+        return item;
+    });
+    list.querySelector('ul').replaceChildren(...items);
+    list.querySelector('.empty-state').hidden = items.length > 0;
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.querySelector('.calendar-container');
+    if (!container) return;
+    const projectId = offlineProjectId();
+    (projectId ? showOfflineCalendar(container, projectId) : showOfflineProjects(container)).catch(error => {
+        console.error('Error rendering the offline viewer:', error);
+    });
+});
@@ -0,0 +1,39 @@
+/**
+ * Offline support
+ * Registers the service worker (/sw.js, see utils/offline.py) and asks it to
+ * save the calendar on this page for offline use, refreshing it whenever the
+ * connection comes back.
+ */
+const OFFLINE_SYNC_TAG = 'calendar-sync'; // Must match SYNC_TAG in service-worker.js
+
+function requestCalendarSync() {
+    const container = document.querySelector('.calendar-container[data-project-id]');
+    const message = container && container.dataset.projectId
+        ? { type: 'sync', projectId: container.dataset.projectId }
+        : { type: 'sync-all' };
+    navigator.serviceWorker.ready.then(registration => {
+        if (registration.active) registration.active.postMessage(message);
+    });
+}
+
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', function() {
+        navigator.serviceWorker.register('/sw.js').then(() => {
+            // Keep an offline copy of the calendar being viewed
+            if (document.querySelector('.calendar-container[data-project-id]')) requestCalendarSync();
+        }).catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    });
+
+    window.addEventListener('online', requestCalendarSync);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible' && navigator.onLine) requestCalendarSync();
+    });
+    // Background Sync runs the queued sync once the connection is back, even if the page was closed
+    window.addEventListener('offline', function() {
+        navigator.serviceWorker.ready.then(registration => {
+            if (registration.sync) return registration.sync.register(OFFLINE_SYNC_TAG);
+        }).catch(() => {});
+    });
+}
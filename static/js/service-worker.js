@@ -0,0 +1,196 @@
+/**
+ * Service worker for the offline viewer, served as /sw.js by utils/offline.py,
+ * which prepends OFFLINE_CONFIG: {version, shell, precache, navTimeout}.
+ *
+ * - The app shell (/offline/viewer and its fingerprinted assets) is
+ *   precached on install; a new version replaces the old shell cache.
+ * - The latest row model of each project (/api/projects/<id>/rows) is kept
+ *   in DATA_CACHE. It is answered from the cache at once and revalidated
+ *   in the background with If-None-Match; pages are told when the
+ *   revision changed.
+ * - Viewer pages are never cached. When one does not load within
+ *   navTimeout (no signal), the shell is shown instead and renders the
+ *   calendar from the cached row model.
+ */
+
+const SHELL_CACHE = `aag-shell-${OFFLINE_CONFIG.version}`;
+const ASSET_CACHE = 'aag-assets';      // Fingerprinted assets outside the shell, e.g. from published pages
+const DATA_CACHE = 'aag-calendars';    // Must match DATA_CACHE in offline-viewer.js
+const ASSET_CACHE_LIMIT = 100;
+const SYNC_TAG = 'calendar-sync';
+
+const ROWS_PATH = /^\/api\/projects\/([^/]+)\/rows$/;
+const VIEWER_PATH = /^\/viewer\/[^/.]+\/?$/;
+const HASHED_PATH = /^\/static\/.+\.[0-9a-f]{10}\.[^./]+$/;
+
+// --- Lifecycle ---
+
+self.addEventListener('install', event => {
+    // Credentials are omitted so the shell is rendered for an anonymous visitor
+    // (and precaching never consumes the user's pending flash messages)
+    const requests = OFFLINE_CONFIG.precache.map(url => new Request(url, { credentials: 'omit', cache: 'reload' }));
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(requests))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith('aag-shell-') && name !== SHELL_CACHE)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// --- Calendar data ---
+
+function rowsUrl(projectId) {
+    return new URL(`/api/projects/${projectId}/rows`, self.location.origin).href;
+}
+
+async function notifyClients(message) {
+    const windows = await self.clients.matchAll({ type: 'window' });
+    windows.forEach(client => client.postMessage(message));
+}
+
+/** Store a rows response, stamped with the time it was last confirmed current. */
+async function storeRows(cache, url, response) {
+    const headers = new Headers(response.headers);
+    headers.set('X-Synced-At', new Date().toISOString());
+    const body = await response.blob();
+    await cache.put(url, new Response(body, { status: 200, statusText: 'OK', headers }));
+}
+
+/**
+ * Revalidate one project's cached row model. Returns the cached or fresh
+ * response; throws if the network fails and nothing is cached.
+ */
+async function syncProject(projectId) {
+    const url = rowsUrl(projectId);
+    const cache = await caches.open(DATA_CACHE);
+    const cached = await cache.match(url);
+    const headers = {};
+    if (cached && cached.headers.get('ETag')) headers['If-None-Match'] = cached.headers.get('ETag');
+
+    const response = await fetch(url, { headers, cache: 'no-store', credentials: 'same-origin' });
+    if (response.status === 304 && cached) {
+        await storeRows(cache, url, cached);
+        return cache.match(url);
+    }
+    if (response.status === 404) {
+        await cache.delete(url);
+        await notifyClients({ type: 'calendar-removed', projectId });
+        return response;
+    }
+    if (!response.ok) return cached || response;
+
+    const previous = cached ? cached.headers.get('X-Calendar-Revision') : null;
+    const revision = response.headers.get('X-Calendar-Revision');
+    await storeRows(cache, url, response);
+    if (previous !== null && previous !== revision) {
+        await notifyClients({ type: 'calendar-updated', projectId, revision: Number(revision) });
+    }
+    return cache.match(url);
+}
+
+async function syncAllProjects() {
+    const cache = await caches.open(DATA_CACHE);
+    const keys = await cache.keys();
+    await Promise.all(keys.map(request => {
+        const match = new URL(request.url).pathname.match(ROWS_PATH);
+        return match ? syncProject(match[1]).catch(() => null) : null;
+    }));
+}
+
+/** Stale-while-revalidate for a project's full row model. */
+async function respondWithRows(event, projectId) {
+    const cached = await caches.match(rowsUrl(projectId), { cacheName: DATA_CACHE });
+    const revalidated = syncProject(projectId);
+    if (cached) {
+        event.waitUntil(revalidated.catch(() => null));
+        return cached;
+    }
+    return revalidated;
+}
+
+// --- Pages and assets ---
+
+function timeout(ms) {
+    return new Promise((_, reject) => setTimeout(() => reject(new Error('timeout')), ms));
+}
+
+/**
+ * Viewer pages and the dashboard come from the network. If that fails or
+ * takes longer than navTimeout, the cached shell is shown.
+ */
+async function respondWithPage(event) {
+    const network = fetch(event.request);
+    try {
+        return await Promise.race([network, timeout(OFFLINE_CONFIG.navTimeout)]);
+    } catch (error) {
+        const shell = await caches.match(OFFLINE_CONFIG.shell, { cacheName: SHELL_CACHE });
+        return shell || network;
+    }
+}
+
+async function respondWithAsset(request) {
+    const cached = await caches.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(ASSET_CACHE);
+        await cache.put(request, response.clone());
+        const keys = await cache.keys();
+        await Promise.all(keys.slice(0, Math.max(0, keys.length - ASSET_CACHE_LIMIT)).map(key => cache.delete(key)));
+    }
+    return response;
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+    const rows = url.pathname.match(ROWS_PATH);
+    if (rows && !url.search) {
+        event.respondWith(respondWithRows(event, rows[1]));
+        return;
+    }
+    if (request.mode === 'navigate' && !url.search) {
+        if (VIEWER_PATH.test(url.pathname) || url.pathname === '/') {
+            event.respondWith(respondWithPage(event));
+        } else if (url.pathname === OFFLINE_CONFIG.shell) {
+            event.respondWith(caches.match(OFFLINE_CONFIG.shell, { cacheName: SHELL_CACHE })
+                .then(shell => shell || fetch(request)));
+        }
+        return;
+    }
+    if (HASHED_PATH.test(url.pathname)) {
+        event.respondWith(respondWithAsset(request));
+    }
+});
+
+// --- Background sync ---
+
+self.addEventListener('message', event => {
+    const data = event.data || {};
+    if (data.type === 'sync' && data.projectId) {
+        event.waitUntil(syncProject(data.projectId).catch(() => null));
+    } else if (data.type === 'sync-all') {
+        event.waitUntil(syncAllProjects());
+    }
+});
+
+// Queued by pages when they go offline; runs once the connection is back
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) event.waitUntil(syncAllProjects());
+});
+
+// Installed apps (where the browser allows it)
+self.addEventListener('periodicsync', event => {
+    if (event.tag === SYNC_TAG) event.waitUntil(syncAllProjects());
+});
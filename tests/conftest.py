@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+# Import the app's packages (utils, routes) from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Runtime state (event log, oplog, indexes) goes to a scratch directory, not the checkout's run/
+os.environ.setdefault('RUN_DIR', tempfile.mkdtemp(prefix='aag-tests-run-'))
@@ -0,0 +1,52 @@
+# tests/test_branches.py
+import pytest
+
+from utils import helpers, branches
+from utils.helpers import get_project_calendar, save_project_calendar
+from utils.branches import create_branch, update_branch_day, promote_branch
+
+PROJECT_ID = 'branch-test'
+
+
+def _day(date, **fields):
+    day = {'date': date, 'isShootDay': True, 'shootDay': None, 'location': '', 'notes': '', 'departments': []}
+    day.update(fields)
+    return day
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'PROJECTS_DIR', str(tmp_path))
+    monkeypatch.setattr(branches, 'PROJECTS_DIR', str(tmp_path))
+    (tmp_path / PROJECT_ID).mkdir()
+    save_project_calendar(PROJECT_ID, {'days': [_day('2025-03-03'), _day('2025-03-04'), _day('2025-03-05')]})
+    return PROJECT_ID
+
+
+def _by_date(project_id):
+    return {d['date']: d for d in get_project_calendar(project_id)['days']}
+
+
+def test_promote_keeps_main_edits_made_after_branching(project):
+    branch = create_branch(project, 'What if')
+    update_branch_day(project, branch, '2025-03-03', {'notes': 'branch note'})
+    update_branch_day(project, branch, '2025-03-04', {'notes': 'branch wins'})
+
+    # Main is edited after the branch was created
+    main = get_project_calendar(project)
+    for day in main['days']:
+        if day['date'] == '2025-03-03':
+            day['location'] = 'A Stage'        # Field the branch did not touch
+        elif day['date'] == '2025-03-04':
+            day['notes'] = 'main note'         # Same field the branch changed
+        elif day['date'] == '2025-03-05':
+            day['notes'] = 'main only'         # Day the branch did not touch
+    save_project_calendar(project, main)
+
+    promote_branch(project, branch)
+    days = _by_date(project)
+
+    assert days['2025-03-03']['notes'] == 'branch note'
+    assert days['2025-03-03']['location'] == 'A Stage'
+    assert days['2025-03-04']['notes'] == 'branch wins'
+    assert days['2025-03-05']['notes'] == 'main only'
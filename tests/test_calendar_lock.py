@@ -0,0 +1,51 @@
+# tests/test_calendar_lock.py
+import threading
+
+import pytest
+
+from utils import helpers
+from utils.helpers import calendar_lock, get_project_calendar, save_project_calendar, generate_calendar
+
+PROJECT_ID = 'lock-test'
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, 'PROJECTS_DIR', str(tmp_path))
+    (tmp_path / PROJECT_ID).mkdir()
+    save_project_calendar(PROJECT_ID, {'days': [{'date': '2025-03-03', 'notes': '', 'departments': []}]})
+    return PROJECT_ID
+
+
+def _edit_day(project_id, notes):
+    """A day edit as the day PUT route makes it, in another thread"""
+    def edit():
+        with calendar_lock(project_id):
+            calendar_data = get_project_calendar(project_id)
+            calendar_data['days'][0]['notes'] = notes
+            save_project_calendar(project_id, calendar_data)
+    thread = threading.Thread(target=edit)
+    thread.start()
+    return thread
+
+
+def test_edit_during_regenerate_waits_and_is_kept(project, monkeypatch):
+    edits = []
+
+    def regenerate(project, existing_calendar):
+        # A day edit arrives while the calendar is being regenerated
+        edits.append(_edit_day(project['id'], 'edited meanwhile'))
+        edits[0].join(timeout=0.3)
+        assert edits[0].is_alive(), "the edit must wait for the regenerate to save"
+        return {'days': [dict(d, location='A Stage') for d in existing_calendar['days']],
+                'revision': existing_calendar.get('revision')}
+
+    monkeypatch.setattr(helpers, 'generate_calendar_days', regenerate)
+    saved = generate_calendar({'id': project})
+    edits[0].join(timeout=5)
+
+    assert 'error' not in saved
+    day = get_project_calendar(project)['days'][0]
+    assert day['location'] == 'A Stage'
+    assert day['notes'] == 'edited meanwhile'
+    assert get_project_calendar(project)['revision'] == saved['revision'] + 1
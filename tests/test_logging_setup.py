@@ -0,0 +1,90 @@
+# tests/test_logging_setup.py
+import json
+import queue
+import logging
+import multiprocessing
+from logging.handlers import QueueListener
+
+from utils.logging_setup import JsonLineFormatter, TracebackQueueHandler, SharedRotatingFileHandler
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _log_through_queue(formatter, log):
+    log_queue = queue.SimpleQueue()
+    collect = _Collect()
+    collect.setFormatter(formatter)
+    listener = QueueListener(log_queue, collect)
+    logger = logging.getLogger('tests.logging_setup')
+    logger.propagate = False
+    handler = TracebackQueueHandler(log_queue)
+    logger.addHandler(handler)
+    listener.start()
+    try:
+        log(logger)
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    return collect.lines
+
+
+def test_json_lines_keep_exception_apart_from_message():
+    def log(logger):
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            logger.exception("Saving %s failed", "calendar")
+
+    [line] = _log_through_queue(JsonLineFormatter(), log)
+    entry = json.loads(line)
+    assert entry["msg"] == "Saving calendar failed"
+    assert "Traceback" in entry["exc"]
+    assert "ValueError: bad value" in entry["exc"]
+
+
+def test_text_lines_include_traceback():
+    def log(logger):
+        try:
+            raise KeyError("x")
+        except KeyError:
+            logger.error("Lookup failed", exc_info=True)
+
+    [line] = _log_through_queue(logging.Formatter('%(message)s'), log)
+    assert line.startswith("Lookup failed\nTraceback")
+    assert line.count("Traceback") == 1
+
+
+def test_records_without_exception_have_no_exc_key():
+    [line] = _log_through_queue(JsonLineFormatter(), lambda logger: logger.warning("plain %d", 1))
+    entry = json.loads(line)
+    assert entry["msg"] == "plain 1"
+    assert "exc" not in entry
+
+
+def _write_records(path, worker, count):
+    handler = SharedRotatingFileHandler(path, max_bytes=2000, backup_count=100, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for i in range(count):
+        handler.handle(logging.makeLogRecord({'msg': f"worker {worker} record {i:04d} " + 'x' * 40}))
+    handler.close()
+
+
+def test_rotation_from_several_processes_keeps_every_record(tmp_path):
+    path = str(tmp_path / 'app.log')
+    workers = [multiprocessing.Process(target=_write_records, args=(path, w, 300)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    files = [p for p in tmp_path.iterdir() if p.name.startswith('app.log') and not p.name.endswith('.lock')]
+    lines = [line for p in files for line in p.read_text(encoding='utf-8').splitlines()]
+    assert len(files) > 10                            # It did rotate...
+    assert len(lines) == len(set(lines)) == 4 * 300   # ...without losing or duplicating records
@@ -0,0 +1,235 @@
+# utils/archive.py
+"""
+Cold storage for wrapped productions.
+
+Archiving packs a project's directory into one compressed file
+(data/archive/<id>.tar.xz) and removes the loose files, leaving a single row
+in data/archive/manifest.json with the details project lists need. Active
+code paths (get_projects, bulk count updates, the search/conflict/capacity
+indexes) only walk data/projects/, so archived projects cost nothing there.
+
+Reads of an archived project (viewer, API) rehydrate the pack into a small
+in-memory LRU on first access; archived projects are read-only until
+unarchived.
+"""
+import os
+import json
+import fcntl
+import shutil
+import tarfile
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, date
+
+from .helpers import DATA_DIR, PROJECTS_DIR, write_json_atomic, notify_calendar_listeners, calendar_lock
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+ARCHIVE_MANIFEST = os.path.join(ARCHIVE_DIR, 'manifest.json')
+ARCHIVE_CACHE_SIZE = int(os.environ.get('ARCHIVE_CACHE_SIZE', 4))  # Rehydrated projects kept in memory
+# Project fields copied into the manifest row
+MANIFEST_FIELDS = ('id', 'title', 'version', 'director', 'producer', 'firstAD',
+                   'prepStartDate', 'shootStartDate', 'wrapDate', 'created', 'updated')
+
+
+class ArchiveError(Exception):
+    """Raised for invalid archive operations (e.g. archiving a production that has not wrapped)"""
+
+
+_lock = threading.RLock()   # Guards the in-memory caches of this worker
+_manifest_cache = (None, {})
+_cache = OrderedDict()   # project_id -> {relative path: bytes}
+
+
+@contextmanager
+def _manifest_lock():
+    """
+    Exclusive lock on the archive across threads and gunicorn workers (flock
+    on ARCHIVE_DIR), held around every manifest read-modify-write so that
+    concurrent archive/unarchive calls don't drop each other's rows.
+    """
+    with _lock:
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        fd = os.open(ARCHIVE_DIR, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd) # Releases the flock
+
+
+def _pack_path(project_id):
+    return os.path.join(ARCHIVE_DIR, f"{project_id}.tar.xz")
+
+
+def _valid_id(project_id):
+    return bool(project_id) and not any(c in project_id for c in '/\\.')
+
+
+def load_manifest():
+    """project_id -> manifest row, re-read only when the manifest file changes"""
+    global _manifest_cache
+    try:
+        st = os.stat(ARCHIVE_MANIFEST)
+        signature = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return {}
+    if _manifest_cache[0] != signature:
+        try:
+            with open(ARCHIVE_MANIFEST, 'r', encoding='utf-8') as f:
+                _manifest_cache = (signature, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading archive manifest: {str(e)}")
+            return _manifest_cache[1]
+    return _manifest_cache[1]
+
+
+def _save_manifest(manifest):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    write_json_atomic(ARCHIVE_MANIFEST, manifest, ensure_ascii=False)
+
+
+def is_archived(project_id):
+    return bool(project_id) and project_id in load_manifest()
+
+
+def archived_projects():
+    """Manifest rows of archived projects, most recently archived first"""
+    rows = [dict(row, archived=True) for row in load_manifest().values()]
+    return sorted(rows, key=lambda r: r.get('archivedAt', ''), reverse=True)
+
+
+def _summary(calendar_data):
+    days = [d for d in calendar_data.get('days', []) if d.get('date')]
+    return {
+        'days': len(days),
+        'shootDays': sum(1 for d in days if d.get('isShootDay')),
+        'firstDate': days[0]['date'] if days else None,
+        'lastDate': days[-1]['date'] if days else None,
+    }
+
+
+def archive_project(project_id, force=False):
+    """
+    Pack a project into the archive and remove its loose files.
+    Refuses productions that have not wrapped yet unless force is set.
+    """
+    if not _valid_id(project_id):
+        raise ArchiveError("Invalid project ID")
+    project_dir = os.path.join(PROJECTS_DIR, project_id)
+    main_file = os.path.join(project_dir, 'main.json')
+
+    # The calendar lock keeps saves out from the read to the rmtree: a save
+    # waiting on it finds the project archived and is refused, rather than
+    # landing after the pack (lost) or recreating a partial project directory
+    with calendar_lock(project_id), _manifest_lock():
+        if not os.path.exists(main_file):
+            raise ArchiveError("Project not found" if not is_archived(project_id) else "Project is already archived")
+        with open(main_file, 'r', encoding='utf-8') as f:
+            project = json.load(f)
+        wrap = project.get('wrapDate')
+        if not force and (not wrap or wrap >= date.today().isoformat()):
+            raise ArchiveError("Only wrapped productions can be archived (wrap date must be in the past)")
+
+        calendar_data = {}
+        try:
+            with open(os.path.join(project_dir, 'calendar.json'), 'r', encoding='utf-8') as f:
+                calendar_data = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        tmp = f"{_pack_path(project_id)}.{os.getpid()}.tmp"
+        with tarfile.open(tmp, 'w:xz') as tar:
+            tar.add(project_dir, arcname='.')
+        os.replace(tmp, _pack_path(project_id))
+
+        manifest = dict(load_manifest())
+        row = {field: project.get(field) for field in MANIFEST_FIELDS}
+        row.update(_summary(calendar_data))
+        row['archivedAt'] = datetime.utcnow().isoformat() + 'Z'
+        row['packSize'] = os.path.getsize(_pack_path(project_id))
+        manifest[project_id] = row
+        _save_manifest(manifest)
+
+        shutil.rmtree(project_dir)
+        _cache.pop(project_id, None)
+    notify_calendar_listeners(project_id, None)  # Drop it from the search/conflict/capacity indexes
+    logger.info(f"Archived project {project_id} ({row['packSize']} bytes)")
+    return row
+
+
+def _read_pack(project_id):
+    """{relative path: bytes} for an archived project, via the LRU cache"""
+    with _lock:
+        files = _cache.get(project_id)
+        if files is not None:
+            _cache.move_to_end(project_id)
+            return files
+        files = {}
+        with tarfile.open(_pack_path(project_id), 'r:xz') as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    files[os.path.normpath(member.name)] = tar.extractfile(member).read()
+        _cache[project_id] = files
+        while len(_cache) > ARCHIVE_CACHE_SIZE:
+            _cache.popitem(last=False)
+        logger.info(f"Rehydrated archived project {project_id}")
+        return files
+
+
+def read_archived_json(project_id, filename):
+    """Parsed JSON file of an archived project, or None"""
+    if not is_archived(project_id):
+        return None
+    try:
+        content = _read_pack(project_id).get(filename)
+        return json.loads(content) if content is not None else None
+    except (OSError, ValueError, tarfile.TarError) as e:
+        logger.error(f"Error reading {filename} from archived project {project_id}: {str(e)}")
+        return None
+
+
+def unarchive_project(project_id):
+    """Unpack an archived project back into data/projects/ and drop its manifest row"""
+    project_dir = os.path.join(PROJECTS_DIR, project_id)
+    with _manifest_lock():
+        if not is_archived(project_id):
+            raise ArchiveError("Project is not archived")
+        if os.path.exists(project_dir):
+            raise ArchiveError("An active project with this ID already exists")
+        files = _read_pack(project_id)
+        for name, content in files.items():
+            dest = os.path.normpath(os.path.join(project_dir, name))
+            if not dest.startswith(project_dir + os.sep):
+                raise ArchiveError(f"Unsafe path in archive: {name}")
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as f:
+                f.write(content)
+        manifest = dict(load_manifest())
+        manifest.pop(project_id, None)
+        _save_manifest(manifest)
+        os.remove(_pack_path(project_id))
+        _cache.pop(project_id, None)
+
+    calendar_content = files.get('calendar.json')
+    if calendar_content is not None:
+        notify_calendar_listeners(project_id, json.loads(calendar_content))
+    logger.info(f"Unarchived project {project_id}")
+    return json.loads(files['main.json']) if 'main.json' in files else {'id': project_id}
+
+
+def delete_archived_project(project_id):
+    with _manifest_lock():
+        manifest = dict(load_manifest())
+        if manifest.pop(project_id, None) is None:
+            return False
+        _save_manifest(manifest)
+        try:
+            os.remove(_pack_path(project_id))
+        except OSError:
+            pass
+        _cache.pop(project_id, None)
+    return True
@@ -0,0 +1,214 @@
+# utils/assets.py
+import os
+import re
+import hashlib
+import logging
+import mimetypes
+import threading
+
+from flask import Response, request, send_from_directory, abort, url_for
+
+logger = logging.getLogger(__name__)
+
+ASSET_MAX_AGE = 365 * 24 * 3600  # Fingerprinted URLs never change content, cache for a year
+ASSET_MINIFY = os.environ.get('ASSET_MINIFY', 'False').lower() == 'true'
+ASSET_WATCH = os.environ.get('ASSET_WATCH', os.environ.get('FLASK_DEBUG', 'False')).lower() in ('true', '1')
+TEXT_EXTENSIONS = ('.js', '.css', '.svg', '.webmanifest')
+HASH_LENGTH = 10
+
+# Scripts loaded together on a page. With ASSET_MINIFY they are served as one
+# concatenated file; otherwise asset_urls() returns the individual files in order
+BUNDLES = {
+    'bundles/admin-calendar.js': ['js/calendar-dragdrop.js', 'js/calendar-virtual.js', 'js/calendar.js'],
+    'bundles/base.js': ['js/theme-toggle.js', 'js/mobile-menu.js', 'js/offline.js'],
+}
+
+_HASHED_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+
+
+def minify_css(text):
+    """Strip comments and collapse whitespace in a stylesheet"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """
+    Conservative JS minification: drop indentation, blank lines and
+    whole-line // comments. Statements are never joined, so ASI and string
+    contents are unaffected.
+    """
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+def fingerprint(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+class AssetManifest:
+    """
+    Content-hashed names for everything under static/, built at startup.
+
+    `logical` maps 'js/calendar.js' -> 'js/calendar.3f2a9c1b0d.js' and
+    `entries` maps the hashed name back to (logical name, body or None).
+    Text assets are held in memory (minified when ASSET_MINIFY is set) so
+    they can be compressed once and served without touching disk.
+    """
+
+    def __init__(self, static_dir, minify=ASSET_MINIFY, watch=ASSET_WATCH):
+        self.static_dir = static_dir
+        self.minify = minify
+        self.watch = watch
+        self.logical = {}
+        self.entries = {}
+        self._mtimes = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Hash every static file and build the configured bundles"""
+        with self._lock:
+            self.logical.clear()
+            self.entries.clear()
+            self._mtimes.clear()
+            for root, _, files in os.walk(self.static_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    rel = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                    self._add_file(rel, path)
+            if self.minify:
+                for bundle, parts in BUNDLES.items():
+                    self._add_bundle(bundle, parts)
+        logger.info(f"Asset manifest built: {len(self.logical)} assets (minify={self.minify})")
+        return self
+
+    def _read_body(self, rel, path):
+        with open(path, 'rb') as f:
+            body = f.read()
+        if self.minify and rel.endswith(('.js', '.css')):
+            text = body.decode('utf-8')
+            body = (minify_js(text) if rel.endswith('.js') else minify_css(text)).encode('utf-8')
+        return body
+
+    def _add_file(self, rel, path):
+        try:
+            body = self._read_body(rel, path)
+            self._mtimes[rel] = os.path.getmtime(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.error(f"Error fingerprinting static asset {rel}: {str(e)}")
+            return
+        hashed = fingerprint(rel, hashlib.sha256(body).hexdigest())
+        old = self.logical.get(rel)
+        if old and old != hashed:
+            self.entries.pop(old, None)
+        self.logical[rel] = hashed
+        self.entries[hashed] = (rel, body if rel.endswith(TEXT_EXTENSIONS) else None)
+
+    def _add_bundle(self, bundle, parts):
+        bodies = []
+        for part in parts:
+            hashed = self.logical.get(part)
+            if hashed is None:
+                logger.warning(f"Bundle {bundle} references missing asset {part}")
+                return
+            bodies.append(self.entries[hashed][1])
+        body = b';\n'.join(bodies)
+        hashed = fingerprint(bundle, hashlib.sha256(body).hexdigest())
+        self.logical[bundle] = hashed
+        self.entries[hashed] = (bundle, body)
+
+    def _refresh(self, filename):
+        """In watch mode, re-hash a file (and rebuild bundles) when its mtime changes"""
+        path = os.path.join(self.static_dir, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if self._mtimes.get(filename) == mtime:
+            return
+        with self._lock:
+            self._add_file(filename, path)
+            if self.minify:
+                for bundle, parts in BUNDLES.items():
+                    if filename in parts:
+                        self._add_bundle(bundle, parts)
+
+    def hashed_name(self, filename):
+        """Fingerprinted name for a logical static path, or the path unchanged if unknown"""
+        if self.watch and filename not in BUNDLES:
+            self._refresh(filename)
+        return self.logical.get(filename, filename)
+
+    def bundle_files(self, bundle):
+        """Logical names to load for a bundle: the bundle itself when built, else its parts"""
+        if bundle in self.logical:
+            return [bundle]
+        return BUNDLES.get(bundle, [bundle])
+
+
+manifest = None
+
+
+def serve_asset(filename):
+    """
+    Serve static files. Fingerprinted names are immutable and cached for a
+    year; plain paths (and stale hashes) revalidate with ETag/304.
+    """
+    entry = manifest.entries.get(filename) if manifest else None
+    if entry is None:
+        match = _HASHED_RE.match(filename)
+        if match and manifest and f"{match['stem']}{match['ext']}" in manifest.logical:
+            # Old fingerprint (e.g. a page cached across a deploy): serve current content, revalidating
+            filename = f"{match['stem']}{match['ext']}"
+        response = send_from_directory(manifest.static_dir if manifest else 'static', filename, max_age=0)
+        response.cache_control.no_cache = True
+        return response
+
+    logical, body = entry
+    if body is None:
+        response = send_from_directory(manifest.static_dir, logical, max_age=ASSET_MAX_AGE)
+    else:
+        mimetype = mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        if logical.endswith('.webmanifest'):
+            mimetype = 'application/manifest+json'
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(filename.rsplit('.', 2)[-2])
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.make_conditional(request)
+    response.cache_control.immutable = True
+    return response
+
+
+def asset_urls(bundle):
+    """Template helper: URLs for a bundle (one file when minified, otherwise each part)"""
+    if manifest is None:
+        return [url_for('static', filename=name) for name in BUNDLES.get(bundle, [bundle])]
+    return [url_for('static', filename=name) for name in manifest.bundle_files(bundle)]
+
+
+def init_assets(app, static_dir):
+    """
+    Build the manifest and take over the 'static' endpoint so
+    url_for('static', filename=...) emits fingerprinted URLs.
+    """
+    global manifest
+    manifest = AssetManifest(static_dir).build()
+
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=serve_asset)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = manifest.hashed_name(values['filename'])
+
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    return manifest
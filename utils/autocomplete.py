@@ -0,0 +1,185 @@
+# utils/autocomplete.py
+import os
+import bisect
+import logging
+import threading
+
+from .helpers import DATA_DIR, load_global_data
+from .project_index import ProjectIndex
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_TYPES = ('location', 'department', 'sequence')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+REFERENCE_FILES = ('locations.json', 'areas.json', 'departments.json')
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+def _prefix_keys(text):
+    """Keys an entry can be found under: the full name and every word-start suffix"""
+    words = normalize(text).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class UsageIndex(ProjectIndex):
+    """How often each location, sequence and department is used across all projects"""
+
+    name = 'usage'
+    version = 1
+
+    def __init__(self):
+        super().__init__()
+        self.totals = {kind: {} for kind in AUTOCOMPLETE_TYPES}
+        self.generation = 0  # Bumped on every change so dependent indexes know to rebuild
+
+    def build_segment(self, project_id, calendar_data):
+        locations, sequences, departments = {}, {}, {}
+        for day in calendar_data.get('days', []):
+            location = (day.get('location') or '').strip()
+            if location:
+                locations[location] = locations.get(location, 0) + 1
+            sequence = (day.get('sequence') or '').strip()
+            if sequence:
+                sequences[sequence] = sequences.get(sequence, 0) + 1
+            for code in day.get('departments') or []:
+                departments[code] = departments.get(code, 0) + 1
+        # Prefer the calendar's own location counts where they exist
+        for name, count in (calendar_data.get('locationCounts') or {}).items():
+            if isinstance(count, (int, float)):
+                locations[name] = max(locations.get(name, 0), int(count))
+        return {'location': locations, 'sequence': sequences, 'department': departments}
+
+    def _apply(self, segment, sign):
+        for kind in AUTOCOMPLETE_TYPES:
+            totals = self.totals[kind]
+            for key, count in segment.get(kind, {}).items():
+                value = totals.get(key, 0) + sign * count
+                if value > 0:
+                    totals[key] = value
+                else:
+                    totals.pop(key, None)
+        self.generation += 1
+
+    def add_segment(self, project_id, segment):
+        self._apply(segment, 1)
+
+    def remove_segment(self, project_id, segment):
+        self._apply(segment, -1)
+
+
+usage_index = UsageIndex()
+
+
+class SortedPrefixIndex:
+    """Sorted (key, entry position) pairs; a prefix lookup is two bisects"""
+
+    def __init__(self, entries, label_fields):
+        self.entries = entries
+        pairs = []
+        for pos, entry in enumerate(entries):
+            keys = set()
+            for field in label_fields:
+                if entry.get(field):
+                    keys |= _prefix_keys(entry[field])
+            pairs.extend((key, pos) for key in keys)
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = [pos for _, pos in pairs]
+
+    def match(self, prefix):
+        """Positions of entries with a name (or later word in it) starting with prefix"""
+        if not prefix:
+            return range(len(self.entries))
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff')
+        return set(self.positions[start:end])
+
+
+class Autocompleter:
+    """
+    Prefix lookups for the day editor pickers. Location and department
+    indexes are rebuilt when the reference files change; sequences come from
+    the usage index. Results are ranked by usage across all projects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reference_signature = None
+        self._usage_generation = None
+        self._indexes = {}
+
+    def _signature(self):
+        signature = []
+        for name in REFERENCE_FILES:
+            try:
+                st = os.stat(os.path.join(DATA_DIR, name))
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def _build_reference(self):
+        areas = {area.get('id'): area.get('name', '') for area in load_global_data('areas.json', [])}
+        locations = []
+        for location in load_global_data('locations.json', []):
+            if location.get('name'):
+                locations.append({
+                    'value': location['name'],
+                    'id': location.get('id'),
+                    'areaId': location.get('areaId') or '',
+                    'area': areas.get(location.get('areaId'), ''),
+                })
+        departments = []
+        for department in load_global_data('departments.json', []):
+            if department.get('code'):
+                departments.append({
+                    'value': department['code'],
+                    'id': department.get('id'),
+                    'name': department.get('name', ''),
+                    'color': department.get('color', ''),
+                })
+        self._indexes['location'] = SortedPrefixIndex(locations, ('value',))
+        self._indexes['department'] = SortedPrefixIndex(departments, ('value', 'name'))
+        logger.info(f"Autocomplete reference indexes built: {len(locations)} locations, {len(departments)} departments")
+
+    def _build_sequences(self):
+        with usage_index._lock:
+            values = sorted(usage_index.totals['sequence'])
+        sequences = [{'value': value} for value in values]
+        self._indexes['sequence'] = SortedPrefixIndex(sequences, ('value',))
+
+    def _usage(self, kind, entry):
+        totals = usage_index.totals[kind]
+        if kind == 'department':
+            # Calendars store department ids (older ones store codes)
+            return sum(totals.get(key, 0) for key in {entry.get('id'), entry['value']} if key)
+        return totals.get(entry['value'], 0)
+
+    def complete(self, kind, query, limit=DEFAULT_LIMIT):
+        """Up to `limit` entries of `kind` matching the query prefix, most used first"""
+        usage_index.refresh()
+        with self._lock:
+            signature = self._signature()
+            if signature != self._reference_signature:
+                self._build_reference()
+                self._reference_signature = signature
+            if kind == 'sequence' and usage_index.generation != self._usage_generation:
+                self._build_sequences()
+                self._usage_generation = usage_index.generation
+            index = self._indexes[kind]
+
+        ranked = []
+        for pos in index.match(normalize(query)):
+            entry = index.entries[pos]
+            ranked.append((-self._usage(kind, entry), entry['value'].lower(), pos))
+        results = []
+        for usage, _, pos in sorted(ranked)[:limit]:
+            results.append(dict(index.entries[pos], usage=-usage))
+        return results
+
+
+autocompleter = Autocompleter()
@@ -0,0 +1,324 @@
+# utils/branches.py
+import os
+import re
+import copy
+import json
+import uuid
+import logging
+from datetime import datetime
+
+from .helpers import (PROJECTS_DIR, get_project, save_project, get_project_calendar, save_project_calendar,
+                      recalculate_shoot_days, write_json_atomic)
+from .calendar_generator import generate_calendar_days, calculate_department_counts, calculate_location_counts
+
+logger = logging.getLogger(__name__)
+
+# Project fields a branch may override for its own regeneration
+BRANCH_PROJECT_FIELDS = ('prepStartDate', 'shootStartDate', 'wrapDate')
+# Special date lists a branch may override, and the project file each lives in
+SPECIAL_DATE_FILES = {
+    'holidays': 'holidays.json',
+    'weekends': 'weekends.json',
+    'hiatus': 'hiatus.json',
+    'specialDates': 'special_dates.json',
+}
+# Derived per-day fields that are recomputed, not merged
+DERIVED_FIELDS = ('shootDay',)
+
+
+class BranchConflict(Exception):
+    """Raised by merge when main and the branch changed the same day field"""
+
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} conflicting change(s)")
+        self.conflicts = conflicts
+
+
+def _branches_dir(project_id):
+    return os.path.join(PROJECTS_DIR, project_id, 'branches')
+
+
+def _branch_file(project_id, branch_id):
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', branch_id or ''):
+        raise ValueError("Invalid branch ID")
+    return os.path.join(_branches_dir(project_id), f"{branch_id}.json")
+
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+# --- Storage ---
+
+def list_branches(project_id):
+    """Branch metadata (without day deltas) for a project"""
+    branches = []
+    try:
+        names = os.listdir(_branches_dir(project_id))
+    except OSError:
+        return []
+    for name in sorted(names):
+        if name.endswith('.json'):
+            branch = get_branch(project_id, name[:-5])
+            if branch:
+                branches.append(branch_summary(branch))
+    return sorted(branches, key=lambda b: b.get('updated', ''), reverse=True)
+
+
+def get_branch(project_id, branch_id):
+    try:
+        with open(_branch_file(project_id, branch_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_branch(project_id, branch):
+    os.makedirs(_branches_dir(project_id), exist_ok=True)
+    branch['updated'] = _now()
+    write_json_atomic(_branch_file(project_id, branch['id']), branch, ensure_ascii=False)
+    return branch
+
+
+def delete_branch(project_id, branch_id):
+    try:
+        os.remove(_branch_file(project_id, branch_id))
+        return True
+    except OSError:
+        return False
+
+
+def create_branch(project_id, name, description=''):
+    base = get_project_calendar(project_id)
+    branch = {
+        'id': uuid.uuid4().hex[:12],
+        'name': name,
+        'description': description,
+        'baseRevision': base.get('revision', 0),
+        'created': _now(),
+        'project': {},        # Overridden project fields (BRANCH_PROJECT_FIELDS)
+        'specialDates': {},   # Overridden special date lists (SPECIAL_DATE_FILES keys)
+        'days': {},           # date -> {field: value} changed relative to main
+        'baseValues': {},     # date -> {field: main's value when the branch first changed it}
+        'added': {},          # date -> full record for dates main does not have
+        'removed': [],        # dates of main that the branch drops
+    }
+    return save_branch(project_id, branch)
+
+
+def branch_summary(branch):
+    return {
+        'id': branch['id'],
+        'name': branch.get('name', ''),
+        'description': branch.get('description', ''),
+        'baseRevision': branch.get('baseRevision', 0),
+        'created': branch.get('created'),
+        'updated': branch.get('updated'),
+        'project': branch.get('project', {}),
+        'specialDates': sorted(branch.get('specialDates', {})),
+        'changedDays': len(branch.get('days', {})),
+        'addedDays': len(branch.get('added', {})),
+        'removedDays': len(branch.get('removed', [])),
+    }
+
+
+# --- Delta layer ---
+
+def materialize(base_calendar, branch):
+    """
+    The branch's calendar: main's days with the branch delta laid over them.
+    Unchanged days are main's own dict objects (shared, not copied), so a
+    view costs one new dict per edited day.
+    """
+    removed = set(branch.get('removed', []))
+    deltas = branch.get('days', {})
+    days = []
+    for day in base_calendar.get('days', []):
+        date = day.get('date')
+        if date in removed:
+            continue
+        delta = deltas.get(date)
+        days.append({**day, **delta} if delta else day)
+    if branch.get('added'):
+        days.extend(branch['added'].values())
+        days.sort(key=lambda d: d.get('date', ''))
+    return dict(base_calendar, days=days, branch=branch_summary(branch))
+
+
+def compute_delta(branch, base_days, new_days):
+    """Store new_days in the branch as a delta against base_days (main's current days)"""
+    base_map = {d['date']: d for d in base_days if d.get('date')}
+    old_base_values = branch.get('baseValues', {})
+    deltas, base_values, added = {}, {}, {}
+    seen = set()
+    for day in new_days:
+        date = day.get('date')
+        if not date:
+            continue
+        seen.add(date)
+        base_day = base_map.get(date)
+        if base_day is None:
+            added[date] = day
+            continue
+        changed = {k: v for k, v in day.items() if base_day.get(k) != v}
+        if changed:
+            deltas[date] = changed
+            previous = old_base_values.get(date, {})
+            # Keep the value main had when the branch first diverged, for merge conflict checks
+            base_values[date] = {k: previous[k] if k in previous else base_day.get(k) for k in changed}
+    branch['days'] = deltas
+    branch['baseValues'] = base_values
+    branch['added'] = added
+    branch['removed'] = sorted(set(base_map) - seen)
+    return branch
+
+
+def update_branch_day(project_id, branch, date, day_data):
+    """Edit one day of a branch; returns the updated day, or None if the branch has no such date"""
+    base = get_project_calendar(project_id)
+    view = materialize(base, branch)
+    days = [dict(d) for d in view['days']]
+    target = next((d for d in days if d.get('date') == date), None)
+    if target is None:
+        return None
+    target.update(day_data)
+    days = recalculate_shoot_days(days)
+    compute_delta(branch, base.get('days', []), days)
+    save_branch(project_id, branch)
+    return target
+
+
+def branch_project(project, branch):
+    """The project record as the branch sees it"""
+    return dict(project, **branch.get('project', {}))
+
+
+def regenerate_branch(project_id, branch):
+    """Regenerate the branch's calendar from its own project dates and special date lists"""
+    project = get_project(project_id)
+    if not project:
+        raise ValueError("Project not found")
+    base = get_project_calendar(project_id)
+    view = materialize(base, branch)
+    generated = generate_calendar_days(branch_project(project, branch), view,
+                                       special_dates_override=branch.get('specialDates') or None)
+    if not generated.get('days'):
+        raise ValueError("Regeneration produced no days; check the branch's project dates")
+    compute_delta(branch, base.get('days', []), generated['days'])
+    return save_branch(project_id, branch)
+
+
+def with_counts(calendar_data):
+    calendar_data = calculate_department_counts(calendar_data)
+    return calculate_location_counts(calendar_data)
+
+
+def diff_branch(project_id, branch):
+    """Field-level differences between main and the branch, plus count deltas"""
+    base = get_project_calendar(project_id)
+    base_map = {d['date']: d for d in base.get('days', []) if d.get('date')}
+    changed = []
+    for date, delta in sorted(branch.get('days', {}).items()):
+        base_day = base_map.get(date)
+        if base_day is None:
+            continue
+        fields = {k: {'main': base_day.get(k), 'branch': v} for k, v in delta.items() if base_day.get(k) != v}
+        if fields:
+            changed.append({'date': date, 'fields': fields})
+
+    main_counts = with_counts(copy.deepcopy(base))
+    branch_counts = with_counts(copy.deepcopy(materialize(base, branch)))
+    count_deltas = {}
+    for group in ('departmentCounts', 'locationCounts', 'areaCounts'):
+        before, after = main_counts.get(group, {}), branch_counts.get(group, {})
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in set(before) | set(after)
+                 if isinstance(after.get(k, 0), (int, float)) and isinstance(before.get(k, 0), (int, float))
+                 and after.get(k, 0) != before.get(k, 0)}
+        if delta:
+            count_deltas[group] = delta
+
+    return {
+        'branch': branch_summary(branch),
+        'changed': changed,
+        'added': sorted(branch.get('added', {})),
+        'removed': list(branch.get('removed', [])),
+        'countDeltas': count_deltas,
+    }
+
+
+# --- Merge / promote ---
+
+def _write_overrides(project_id, branch):
+    """Copy the branch's project field and special date overrides onto main"""
+    if branch.get('project'):
+        project = get_project(project_id)
+        save_project(branch_project(project, branch))
+    for key, entries in branch.get('specialDates', {}).items():
+        write_json_atomic(os.path.join(PROJECTS_DIR, project_id, SPECIAL_DATE_FILES[key]), entries)
+
+
+def _save_main(project_id, base, days):
+    from .events import publish_calendar_change, changed_dates # Local imports avoid circular imports
+    from .oplog import record_operation
+    before = [dict(d) for d in base.get('days', [])]
+    base['days'] = recalculate_shoot_days(days)
+    base = with_counts(base)
+    base.pop('branch', None)
+    saved = save_project_calendar(project_id, base)
+    record_operation(project_id, 'merge', before, saved)
+    publish_calendar_change(project_id, saved, 'regenerated', changed_dates(before, saved['days']), include_days=False)
+    return saved
+
+
+def merge_branch(project_id, branch, force=False):
+    """
+    Three-way merge of the branch delta into main. A field conflicts when
+    main changed it since the branch diverged and the branch changed it to
+    something else; conflicts raise BranchConflict unless force is set
+    (the branch wins). Cost is proportional to the size of the delta.
+    """
+    base = get_project_calendar(project_id)
+    days = [dict(d) for d in base.get('days', [])]
+    by_date = {d['date']: d for d in days if d.get('date')}
+
+    conflicts = []
+    for date, delta in branch.get('days', {}).items():
+        day = by_date.get(date)
+        if day is None:
+            conflicts.append({'date': date, 'field': None, 'reason': 'Date no longer exists in main'})
+            continue
+        original = branch.get('baseValues', {}).get(date, {})
+        for field, value in delta.items():
+            if field in DERIVED_FIELDS:
+                continue
+            current = day.get(field)
+            if field in original and current != original[field] and current != value:
+                conflicts.append({'date': date, 'field': field, 'main': current, 'branch': value,
+                                  'original': original[field]})
+    if conflicts and not force:
+        raise BranchConflict(conflicts)
+
+    for date, delta in branch.get('days', {}).items():
+        if date in by_date:
+            by_date[date].update({k: v for k, v in delta.items() if k not in DERIVED_FIELDS})
+    removed = set(branch.get('removed', []))
+    days = [d for d in days if d.get('date') not in removed]
+    days.extend(day for date, day in branch.get('added', {}).items() if date not in by_date)
+
+    _write_overrides(project_id, branch)
+    return _save_main(project_id, base, days), conflicts
+
+
+def promote_branch(project_id, branch):
+    """
+    Make the branch's calendar main without merge's conflict checks. The
+    branch delta is laid over main as it is now: where both changed a field
+    the branch's value wins, and main edits since branching to days or
+    fields the branch left alone are kept.
+    """
+    base = get_project_calendar(project_id)
+    view = materialize(base, branch)
+    days = [dict(d) for d in view['days']]
+    _write_overrides(project_id, branch)
+    return _save_main(project_id, base, days)
+
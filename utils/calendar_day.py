@@ -0,0 +1,197 @@
+# utils/calendar_day.py
+"""
+Compact in-memory day records.
+
+A day read from calendar.json is a dict of ~22 keys, and strings such as
+'Saturday', 'January', 'prep', location names and department codes are a
+separate object on every day. CalendarDay keeps the same mapping:
+
+* the standard fields in __slots__ (no per-day dict),
+* the is* flags as bits of one int,
+* repeated strings interned, so every day (and every cached calendar in
+  the worker) points at one copy,
+* anything else (secondUnit, daylight, locationAreaId, ...) in a small
+  dict, and the key order as a tuple shared by days with the same keys.
+
+It is a MutableMapping, so templates, counts and the row model use it
+like the dict it replaces; from_dict()/to_dict() convert at the JSON
+boundaries without losing keys, order or types.
+
+Days of a shared calendar snapshot (utils/snapshots.py) are lazy records:
+they hold only the snapshot and the day's index, and decode that day's
+cells on first access, so no worker keeps a decoded copy of the calendar.
+"""
+import sys
+from collections.abc import MutableMapping
+
+# Stored in slots (when present on the day)
+SLOT_FIELDS = ('date', 'dayOfWeek', 'monthName', 'day', 'month', 'year', 'dayType', 'shootDay', 'mainUnit',
+               'extras', 'featuredExtras', 'location', 'locationArea', 'sequence', 'departments', 'notes')
+# Stored as bits of _flags when the value is a bool (anything else goes to _extra)
+FLAG_FIELDS = ('isPrep', 'isShootDay', 'isWeekend', 'isHoliday', 'isHiatus', 'isWorkingWeekend')
+# Slot fields whose strings repeat across days
+INTERNED_FIELDS = frozenset(('dayOfWeek', 'monthName', 'dayType', 'mainUnit', 'location', 'locationArea', 'sequence'))
+
+_SLOTS = frozenset(SLOT_FIELDS)
+_FLAG_BITS = {name: 1 << i for i, name in enumerate(FLAG_FIELDS)}
+_PRESENT_SHIFT = len(FLAG_FIELDS)   # Bit i + _PRESENT_SHIFT: flag i is set on the day
+_MISSING = object()
+
+_key_orders = {}       # key tuple -> the shared instance
+_KEY_ORDERS_MAX = 256  # Distinct orders are few (old files, extra keys); beyond this they aren't shared
+
+
+def _order(keys):
+    shared = _key_orders.get(keys)
+    if shared is not None:
+        return shared
+    if len(_key_orders) < _KEY_ORDERS_MAX:
+        return _key_orders.setdefault(keys, keys)
+    return keys
+
+
+class CalendarDay(MutableMapping):
+    """One calendar day; behaves as the day dict it was built from"""
+
+    __slots__ = SLOT_FIELDS + ('_flags', '_extra', '_keys', '_source', '_index')
+
+    def __init__(self, data=()):
+        self._flags = 0
+        self._extra = None
+        self._keys = ()
+        self._source = None
+        if data:
+            self.update(data)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Record for a day dict as stored in calendar.json"""
+        record = cls.__new__(cls)
+        record._flags = 0
+        record._extra = None
+        record._source = None
+        for key, value in data.items():
+            record._store(key, value)
+        record._keys = _order(tuple(data))
+        return record
+
+    @classmethod
+    def lazy(cls, source, index):
+        """Record for day `index` of `source`, whose day_items(index) yields (key, value) pairs"""
+        record = cls.__new__(cls)
+        record._flags = 0
+        record._extra = None
+        record._keys = ()
+        record._source = source
+        record._index = index
+        return record
+
+    def _load(self):
+        """Decode a lazy record's day from its source"""
+        source, self._source = self._source, None
+        keys = []
+        for key, value in source.day_items(self._index):
+            self._store(key, value)
+            keys.append(key)
+        self._keys = _order(tuple(keys))
+
+    def to_dict(self):
+        """The day as a plain dict, in its original key order"""
+        if self._source is not None:
+            self._load()
+        return {key: self[key] for key in self._keys}
+
+    def copy(self):
+        """
+        A record another caller can change: top-level keys and the
+        departments list are its own, nested values are shared.
+        """
+        if self._source is not None:
+            return CalendarDay.lazy(self._source, self._index)
+        record = CalendarDay.__new__(CalendarDay)
+        record._source = None
+        for name in SLOT_FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                setattr(record, name, list(value) if name == 'departments' and isinstance(value, list) else value)
+        record._flags = self._flags
+        record._extra = dict(self._extra) if self._extra else None
+        record._keys = self._keys
+        return record
+
+    def _store(self, key, value):
+        if key in _SLOTS:
+            if key in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            elif key == 'departments' and type(value) is list:
+                value = [sys.intern(code) if type(code) is str else code for code in value]
+            setattr(self, key, value)
+            return
+        bit = _FLAG_BITS.get(key)
+        if bit is not None:
+            if type(value) is bool:
+                self._flags = (self._flags | bit << _PRESENT_SHIFT | bit) if value else \
+                    (self._flags | bit << _PRESENT_SHIFT) & ~bit
+                if self._extra:
+                    self._extra.pop(key, None)
+                return
+            self._flags &= ~(bit << _PRESENT_SHIFT | bit)
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def get(self, key, default=None):
+        if self._source is not None:
+            self._load()
+        if key in _SLOTS:
+            return getattr(self, key, default)
+        bit = _FLAG_BITS.get(key)
+        if bit is not None and self._flags & bit << _PRESENT_SHIFT:
+            return bool(self._flags & bit)
+        extra = self._extra
+        return extra.get(key, default) if extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        if key not in self:  # Also decodes a lazy record
+            self._keys = _order(self._keys + (key,))
+        self._store(key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in _SLOTS:
+            delattr(self, key)
+        elif key in _FLAG_BITS and self._flags & _FLAG_BITS[key] << _PRESENT_SHIFT:
+            self._flags &= ~(_FLAG_BITS[key] << _PRESENT_SHIFT | _FLAG_BITS[key])
+        else:
+            del self._extra[key]
+        self._keys = _order(tuple(k for k in self._keys if k != key))
+
+    def __iter__(self):
+        if self._source is not None:
+            self._load()
+        return iter(self._keys)
+
+    def __len__(self):
+        if self._source is not None:
+            self._load()
+        return len(self._keys)
+
+    def __eq__(self, other):
+        if isinstance(other, CalendarDay):
+            other = other.to_dict()
+        return self.to_dict() == other if isinstance(other, dict) else NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CalendarDay({self.to_dict()!r})"
@@ -0,0 +1,120 @@
+# utils/calendar_diff.py
+
+# Fields fixed by the date itself (or derived from other fields); never reported as changes
+IGNORED_FIELDS = frozenset(('date', 'dayOfWeek', 'monthName', 'day', 'month', 'year', 'locationAreaId', 'daylight'))
+# A day's content fingerprint: the same fingerprint on another date means the day moved
+FINGERPRINT_FIELDS = ('sequence', 'mainUnit', 'location')
+
+
+def _norm(value):
+    return ' '.join(str(value).lower().split()) if value else ''
+
+
+def fingerprint(day):
+    """Normalised (sequence, mainUnit, location), or None for days without scheduled content"""
+    if not day or not (day.get('sequence') or day.get('mainUnit')):
+        return None
+    return tuple(_norm(day.get(field)) for field in FINGERPRINT_FIELDS)
+
+
+def _count(days):
+    """Department, location, area and shoot day totals (computed here so diffs have no side effects)"""
+    counts = {'departments': {}, 'locations': {}, 'areas': {}, 'totals': {'shootDays': 0, 'secondUnitDays': 0}}
+    for day in days:
+        for code in day.get('departments') or []:
+            code = (code or '').strip().upper()
+            if code:
+                counts['departments'][code] = counts['departments'].get(code, 0) + 1
+        if day.get('location'):
+            counts['locations'][day['location']] = counts['locations'].get(day['location'], 0) + 1
+        if day.get('locationArea'):
+            counts['areas'][day['locationArea']] = counts['areas'].get(day['locationArea'], 0) + 1
+        if day.get('isShootDay'):
+            counts['totals']['shootDays'] += 1
+        if day.get('secondUnit'):
+            counts['totals']['secondUnitDays'] += 1
+    return counts
+
+
+def _count_deltas(old_days, new_days):
+    before, after = _count(old_days), _count(new_days)
+    deltas = {}
+    for group in before:
+        a, b = before[group], after[group]
+        delta = {key: b.get(key, 0) - a.get(key, 0) for key in a.keys() | b.keys() if b.get(key, 0) != a.get(key, 0)}
+        if delta:
+            deltas[group] = dict(sorted(delta.items()))
+    return deltas
+
+
+def diff_calendars(old, new):
+    """
+    Compare two calendars day by day, keyed by date.
+
+    Returns added and removed dates, per-field changes on dates present in
+    both, moves (a day's sequence/main unit/location fingerprint leaving one
+    date and appearing on another) and count deltas. Apart from ordering the
+    output, every step is a single pass over the days or a dictionary
+    lookup, so the cost is linear in the length of the schedule.
+    """
+    old_days = [d for d in (old or {}).get('days', []) if d.get('date')]
+    new_days = [d for d in (new or {}).get('days', []) if d.get('date')]
+    old_map = {d['date']: d for d in old_days}
+    new_map = {d['date']: d for d in new_days}
+
+    added = sorted(new_map.keys() - old_map.keys())
+    removed = sorted(old_map.keys() - new_map.keys())
+
+    changed = []
+    lost, gained = {}, {}   # fingerprint -> dates it left / arrived at
+    for date in sorted(old_map.keys() | new_map.keys()):
+        before, after = old_map.get(date), new_map.get(date)
+        if before is not None and after is not None:
+            fields = {}
+            for key in before.keys() | after.keys():
+                if key not in IGNORED_FIELDS and before.get(key) != after.get(key):
+                    fields[key] = {'old': before.get(key), 'new': after.get(key)}
+            if fields:
+                changed.append({'date': date, 'fields': dict(sorted(fields.items()))})
+        old_fp, new_fp = fingerprint(before), fingerprint(after)
+        if old_fp != new_fp:
+            if old_fp:
+                lost.setdefault(old_fp, []).append(date)
+            if new_fp:
+                gained.setdefault(new_fp, []).append(date)
+
+    # Pair dates a fingerprint left with dates it arrived at, in calendar order
+    moved = []
+    for fp, from_dates in lost.items():
+        for from_date, to_date in zip(from_dates, gained.get(fp, [])):
+            day = new_map[to_date]
+            moved.append({
+                'from': from_date,
+                'to': to_date,
+                **{field: day.get(field, '') for field in FINGERPRINT_FIELDS},
+            })
+    moved.sort(key=lambda m: (m['to'], m['from']))
+
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'moved': moved,
+        'countDeltas': _count_deltas(old_days, new_days),
+        'summary': {
+            'added': len(added), 'removed': len(removed),
+            'changed': len(changed), 'moved': len(moved),
+        },
+    }
+
+
+def day_statuses(diff):
+    """date -> 'added' | 'moved' | 'changed' for the newer calendar, for highlighting"""
+    statuses = {}
+    for entry in diff.get('changed', []):
+        statuses[entry['date']] = 'changed'
+    for move in diff.get('moved', []):
+        statuses[move['to']] = 'moved'
+    for date in diff.get('added', []):
+        statuses[date] = 'added'
+    return statuses
@@ -7,23 +7,24 @@ from dateutil.relativedelta import relativedelta
 
 logger = logging.getLogger(__name__)
 
-def generate_calendar_days(project, existing_calendar=None):
+def generate_calendar_days(project, existing_calendar=None, special_dates_override=None):
     """
     Generate calendar days for a project based on dates
     
     Args:
         project (dict): Project data including prepStartDate and shootStartDate
         existing_calendar (dict, optional): Existing calendar data to preserve
+        special_dates_override (dict, optional): Lists to use instead of the project's
+            files, keyed 'holidays', 'weekends', 'hiatus' and/or 'specialDates'
         
     Returns:
         dict: Calendar data with days array
     """
     try:
-         # Log project dates
-        logger.info(f"Calendar generation for project: {project.get('id')}")
-        logger.info(f"Prep Start: {project.get('prepStartDate')}")
-        logger.info(f"Shoot Start: {project.get('shootStartDate')}")
-        logger.info(f"Wrap Date: {project.get('wrapDate')}")
+        # Log project dates (debug only - this runs on every generation)
+        logger.debug("Calendar generation for project %s: prep %s, shoot %s, wrap %s",
+                     project.get('id'), project.get('prepStartDate'),
+                     project.get('shootStartDate'), project.get('wrapDate'))
         
         # Validate required fields
         if not project.get('prepStartDate') or not project.get('shootStartDate'):
@@ -42,10 +43,11 @@ def generate_calendar_days(project, existing_calendar=None):
             wrap_date = shoot_start + relativedelta(weeks=4)
         
         # Load special dates (bank holidays, working weekends, hiatus periods)
-        holidays = load_bank_holidays(project.get('id'))
-        working_weekends = load_working_weekends(project.get('id'))
-        hiatus_periods = load_hiatus_periods(project.get('id'))
-        special_dates = load_special_dates(project.get('id'))
+        override = special_dates_override or {}
+        holidays = override['holidays'] if 'holidays' in override else load_bank_holidays(project.get('id'))
+        working_weekends = override['weekends'] if 'weekends' in override else load_working_weekends(project.get('id'))
+        hiatus_periods = override['hiatus'] if 'hiatus' in override else load_hiatus_periods(project.get('id'))
+        special_dates = override['specialDates'] if 'specialDates' in override else load_special_dates(project.get('id'))
         
         # Create a map of existing days by date for quick lookup
         existing_days_map = {}
@@ -196,7 +198,7 @@ def generate_calendar_days(project, existing_calendar=None):
         calendar_data = {
             "projectId": project.get('id', ''),
             "days": calendar_days,
-            "departmentCounts": calculate_department_counts({"days": calendar_days}),
+            "departmentCounts": calculate_department_counts({"days": calendar_days}).get("departmentCounts", {}),
             "locationAreas": location_areas,
             "lastUpdated": datetime.utcnow().isoformat() + 'Z'
         }
@@ -298,13 +300,13 @@ def load_working_weekends(project_id):
     weekends_file = os.path.join(data_dir, 'data', 'projects', project_id, 'weekends.json')
     
     if not os.path.exists(weekends_file):
-        logger.info(f"No weekends file exists for project {project_id}")
+        logger.debug("No weekends file exists for project %s", project_id)
         return []
     
     try:
         with open(weekends_file, 'r') as f:
             weekends = json.load(f)
-        logger.info(f"Loaded {len(weekends)} working weekends for project {project_id}")
+        logger.debug("Loaded %d working weekends for project %s", len(weekends), project_id)
         return weekends
     except Exception as e:
         logger.error(f"Error loading working weekends for project {project_id}: {str(e)}")
@@ -572,7 +574,6 @@ def calculate_department_counts(calendar_data):
                     # Create mapping from code to ID for counting
                     if 'code' in dept and 'id' in dept:
                         dept_code_to_id[dept['code'].upper()] = dept['id']
-                        logger.debug(f"Mapped department code {dept['code']} to ID {dept['id']}")
 
             except Exception as e:
                 logger.error(f"Error loading or processing departments.json: {str(e)}")
@@ -590,10 +591,9 @@ def calculate_department_counts(calendar_data):
                 if dept_code in dept_code_to_id:
                     dept_id = dept_code_to_id[dept_code]
                     counts[dept_id] = counts.get(dept_id, 0) + 1
-                    logger.debug(f"Counted department {dept_code} using ID {dept_id}, new count: {counts[dept_id]}")
                 else:
                     # Log unknown tags for debugging
-                    logger.debug(f"Ignoring unknown department tag: {dept_code} found on date {day.get('date')}")
+                    logger.debug("Ignoring unknown department tag: %s found on date %s", dept_code, day.get('date'))
 
         # --- Standard Metrics Counting ---
         # These standard metrics are always counted regardless of departments
@@ -613,12 +613,12 @@ def calculate_department_counts(calendar_data):
 
         # Store the final counts dict in calendar data
         calendar_data["departmentCounts"] = counts
-        logger.info(f"Department counts updated: {counts}")
+        logger.debug("Department counts updated: %s", counts)
 
         # Make sure the current list of departments is included in calendar data for the frontend
         if 'departments' not in calendar_data or calendar_data['departments'] != departments:
              calendar_data['departments'] = departments
-             logger.info(f"Updated/Added {len(departments)} departments list to calendar data")
+             logger.debug("Updated/Added %d departments list to calendar data", len(departments))
 
         return calendar_data
 
@@ -0,0 +1,239 @@
+# utils/capacity.py
+import os
+import bisect
+import logging
+from datetime import date as date_cls
+
+from .helpers import DATA_DIR, load_global_data
+from .project_index import ProjectIndex
+
+logger = logging.getLogger(__name__)
+
+
+def department_capacity(department):
+    """Daily capacity of a department (how many projects may use it per day), or None for unlimited"""
+    value = department.get('capacity')
+    if value in (None, ''):
+        return None
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+_departments_cache = (None, [])
+
+def load_departments():
+    """departments.json, re-read only when the file changes"""
+    global _departments_cache
+    try:
+        st = os.stat(os.path.join(DATA_DIR, 'departments.json'))
+        signature = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return []
+    if _departments_cache[0] != signature:
+        _departments_cache = (signature, load_global_data('departments.json', []))
+    return _departments_cache[1]
+
+
+class UsageSeries:
+    """
+    Dense daily usage of one department over [first, last] with prefix sums,
+    so the total (or number of over-capacity days) in any date range is two
+    array lookups.
+    """
+
+    def __init__(self, daily, capacity):
+        self.capacity = capacity
+        self.dates = sorted(daily)
+        if not self.dates:
+            self.first = self.last = None
+            self.used = self.over = [0]
+            return
+        self.first = date_cls.fromisoformat(self.dates[0]).toordinal()
+        self.last = date_cls.fromisoformat(self.dates[-1]).toordinal()
+        used = [0] * (self.last - self.first + 2)
+        over = [0] * (self.last - self.first + 2)
+        for day, count in daily.items():
+            i = date_cls.fromisoformat(day).toordinal() - self.first + 1
+            used[i] = count
+            over[i] = 1 if capacity is not None and count > capacity else 0
+        for i in range(1, len(used)):
+            used[i] += used[i - 1]
+            over[i] += over[i - 1]
+        self.used = used
+        self.over = over
+
+    def _bounds(self, start_ordinal, end_ordinal):
+        if self.first is None:
+            return 0, 0
+        lo = min(max(start_ordinal - self.first, 0), len(self.used) - 1)
+        hi = min(max(end_ordinal - self.first + 1, 0), len(self.used) - 1)
+        return lo, max(hi, lo)
+
+    def total(self, start_ordinal, end_ordinal):
+        lo, hi = self._bounds(start_ordinal, end_ordinal)
+        return self.used[hi] - self.used[lo]
+
+    def over_days(self, start_ordinal, end_ordinal):
+        lo, hi = self._bounds(start_ordinal, end_ordinal)
+        return self.over[hi] - self.over[lo]
+
+
+class DepartmentUsageIndex(ProjectIndex):
+    """
+    Per-date usage of each department tag, aggregated over all projects.
+    Prefix-sum series are rebuilt lazily, per department, only after that
+    department's usage (or capacity) changed.
+    """
+
+    name = 'department_usage'
+    version = 1
+
+    def __init__(self):
+        super().__init__()
+        self._by_date = {}    # code -> {date: {project_id: count}}
+        self._daily = {}      # code -> {date: total count}
+        self._series = {}     # code -> UsageSeries
+        self._dirty = set()
+
+    # --- ProjectIndex hooks ---
+
+    def build_segment(self, project_id, calendar_data):
+        usage = {}
+        for day in calendar_data.get('days', []):
+            if not day.get('date'):
+                continue
+            for code in set(c.strip().upper() for c in day.get('departments') or [] if c and c.strip()):
+                usage.setdefault(code, {})[day['date']] = 1
+        return {'usage': usage}
+
+    def _apply(self, project_id, segment, sign):
+        for code, dates in segment.get('usage', {}).items():
+            by_date = self._by_date.setdefault(code, {})
+            daily = self._daily.setdefault(code, {})
+            for day, count in dates.items():
+                projects = by_date.setdefault(day, {})
+                if sign > 0:
+                    projects[project_id] = count
+                else:
+                    projects.pop(project_id, None)
+                total = daily.get(day, 0) + sign * count
+                if total > 0:
+                    daily[day] = total
+                else:
+                    daily.pop(day, None)
+                if not projects:
+                    del by_date[day]
+            self._dirty.add(code)
+
+    def add_segment(self, project_id, segment):
+        self._apply(project_id, segment, 1)
+
+    def remove_segment(self, project_id, segment):
+        self._apply(project_id, segment, -1)
+
+    # --- Queries ---
+
+    def series(self, code, capacity):
+        """Prefix-sum series for a department code (caller holds the lock)"""
+        series = self._series.get(code)
+        if series is None or code in self._dirty or series.capacity != capacity:
+            series = self._series[code] = UsageSeries(self._daily.get(code, {}), capacity)
+            self._dirty.discard(code)
+        return series
+
+    def _departments(self, codes=None):
+        departments = []
+        for dept in load_departments():
+            code = (dept.get('code') or '').strip().upper()
+            if code and (not codes or code in codes):
+                departments.append((code, dept))
+        return departments
+
+    def _prepare(self, start, end, codes):
+        """
+        (department entries with their series, start ordinal, end ordinal).
+        The range defaults to the span of recorded usage of those departments.
+        """
+        entries = []
+        for code, dept in self._departments(codes):
+            capacity = department_capacity(dept)
+            entries.append((code, dept, capacity, self.series(code, capacity)))
+        firsts = [s.first for _, _, _, s in entries if s.first is not None]
+        lasts = [s.last for _, _, _, s in entries if s.last is not None]
+        start_ord = date_cls.fromisoformat(start).toordinal() if start else (min(firsts) if firsts else None)
+        end_ord = date_cls.fromisoformat(end).toordinal() if end else (max(lasts) if lasts else None)
+        if start_ord is None or end_ord is None:
+            return entries, None, None
+        return entries, start_ord, end_ord
+
+    def summary(self, start=None, end=None, codes=None):
+        """Per-department totals and every over-allocated date in the range"""
+        self.refresh()
+        with self._lock:
+            entries, start_ord, end_ord = self._prepare(start, end, codes)
+            departments, over_allocated = [], []
+            for code, dept, capacity, series in entries:
+                entry = {
+                    'id': dept.get('id'), 'code': code, 'name': dept.get('name', ''),
+                    'capacity': capacity, 'used': 0, 'overAllocatedDays': 0,
+                }
+                if start_ord is not None:
+                    entry['used'] = series.total(start_ord, end_ord)
+                    entry['overAllocatedDays'] = series.over_days(start_ord, end_ord)
+                departments.append(entry)
+
+                if capacity is None or not entry['overAllocatedDays']:
+                    continue
+                # Only dates with recorded usage can be over capacity; bisect to the range
+                lo = bisect.bisect_left(series.dates, date_cls.fromordinal(start_ord).isoformat())
+                hi = bisect.bisect_right(series.dates, date_cls.fromordinal(end_ord).isoformat())
+                for day in series.dates[lo:hi]:
+                    used = self._daily[code].get(day, 0)
+                    if used > capacity:
+                        over_allocated.append({
+                            'date': day, 'code': code, 'departmentId': dept.get('id'),
+                            'used': used, 'capacity': capacity,
+                            'projects': dict(self._by_date[code].get(day, {})),
+                        })
+            over_allocated.sort(key=lambda o: (o['date'], o['code']))
+            return {
+                'start': date_cls.fromordinal(start_ord).isoformat() if start_ord else None,
+                'end': date_cls.fromordinal(end_ord).isoformat() if end_ord else None,
+                'departments': departments,
+                'overAllocated': over_allocated,
+            }
+
+    def heatmap(self, start=None, end=None, codes=None):
+        """Weekly (Monday-based) usage and utilisation per department, from prefix sums"""
+        self.refresh()
+        with self._lock:
+            entries, start_ord, end_ord = self._prepare(start, end, codes)
+            if start_ord is None:
+                return {'start': None, 'end': None, 'weeks': [], 'departments': []}
+            first_monday = start_ord - date_cls.fromordinal(start_ord).weekday()
+            weeks = list(range(first_monday, end_ord + 1, 7))
+            rows = []
+            for code, dept, capacity, series in entries:
+                cells = []
+                for week_start in weeks:
+                    lo, hi = max(week_start, start_ord), min(week_start + 6, end_ord)
+                    used = series.total(lo, hi)
+                    available = capacity * (hi - lo + 1) if capacity is not None else None
+                    cells.append({
+                        'used': used,
+                        'overAllocatedDays': series.over_days(lo, hi),
+                        'utilisation': round(used / available, 3) if available else None,
+                    })
+                rows.append({'id': dept.get('id'), 'code': code, 'name': dept.get('name', ''),
+                             'capacity': capacity, 'weeks': cells})
+            return {
+                'start': date_cls.fromordinal(start_ord).isoformat(),
+                'end': date_cls.fromordinal(end_ord).isoformat(),
+                'weeks': [date_cls.fromordinal(w).isoformat() for w in weeks],
+                'departments': rows,
+            }
+
+
+department_usage_index = DepartmentUsageIndex()
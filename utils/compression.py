@@ -0,0 +1,126 @@
+# utils/compression.py
+import os
+import gzip
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from .singleflight import group
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))        # Bytes; smaller bodies aren't worth it
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))                 # gzip level (brotli uses its own quality)
+COMPRESS_CACHE_BYTES = int(os.environ.get('COMPRESS_CACHE_BYTES', 32 * 1024 * 1024))
+COMPRESSIBLE_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/calendar',
+    'application/json', 'application/javascript', 'text/javascript', 'image/svg+xml',
+)
+
+
+class CompressedBodyCache:
+    """Small thread-safe LRU of compressed bodies keyed by (etag, encoding), capped by total bytes"""
+
+    def __init__(self, max_bytes=COMPRESS_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+body_cache = CompressedBodyCache()
+_flight = group('compress')  # Concurrent misses for the same body compress it once
+
+
+def choose_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def _compress_and_cache(key, body, encoding):
+    compressed = compress_body(body, encoding)
+    body_cache.put(key, compressed)
+    return compressed
+
+
+def compress_response(response):
+    """after_request hook: negotiate gzip/brotli for large text and JSON responses"""
+    try:
+        if (response.status_code != 200
+                or response.direct_passthrough          # send_file and streams (SSE) stay as-is
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+
+        # The ETag identifies the uncompressed body; each encoding gets its own variant tag
+        etag, weak = response.get_etag()
+        if etag is None:
+            response.add_etag()
+            etag, weak = response.get_etag()
+
+        key = (etag, encoding)
+        compressed = body_cache.get(key)
+        if compressed is None:
+            compressed = _flight.do(key, lambda: _compress_and_cache(key, body, encoding))
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+        response.make_conditional(request)
+        return response
+    except Exception as e:
+        logger.error(f"Error compressing response for {request.path}: {str(e)}")
+        return response
+
+
+def init_compression(app):
+    """Register response compression on the Flask app"""
+    app.after_request(compress_response)
+    logger.info(f"Response compression enabled ({'br, gzip' if brotli is not None else 'gzip'})")
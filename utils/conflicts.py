@@ -0,0 +1,184 @@
+# utils/conflicts.py
+import os
+import logging
+
+from .helpers import DATA_DIR, load_global_data, get_project
+from .project_index import ProjectIndex
+
+logger = logging.getLogger(__name__)
+
+CONFLICT_KINDS = ('location', 'area')
+
+
+def _key(value):
+    return ' '.join(str(value).lower().split()) if value else ''
+
+
+_location_ids_cache = (None, {})
+
+def _locations_signature():
+    """[mtime_ns, size] of locations.json, or None if there is none"""
+    try:
+        st = os.stat(os.path.join(DATA_DIR, 'locations.json'))
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _location_ids():
+    """Normalised location name -> id, re-read only when locations.json changes"""
+    global _location_ids_cache
+    signature = _locations_signature()
+    if signature is None:
+        return {}
+    if _location_ids_cache[0] != signature:
+        mapping = {_key(loc.get('name')): loc.get('id') for loc in load_global_data('locations.json', [])}
+        _location_ids_cache = (signature, mapping)
+    return _location_ids_cache[1]
+
+
+class ConflictIndex(ProjectIndex):
+    """
+    Global (date, location) and (date, area) index of bookings across all
+    projects, so two productions booking the same stage or studio complex
+    on the same date can be detected with a dictionary lookup.
+    """
+
+    name = 'conflicts'
+    version = 2
+
+    def __init__(self):
+        super().__init__()
+        self._by_location = {}   # (date, location key) -> {project_id: booking}
+        self._by_area = {}       # (date, area key) -> {project_id: booking}
+
+    # --- ProjectIndex hooks ---
+
+    def source_signature(self):
+        # Segments hold location ids: renaming, deleting or re-adding a location rebuilds them
+        return _locations_signature()
+
+    def build_segment(self, project_id, calendar_data):
+        # Days store location names; resolve them to ids so renamed spellings still collide
+        location_ids = _location_ids()
+        bookings = []
+        for day in calendar_data.get('days', []):
+            location = (day.get('location') or '').strip()
+            area = (day.get('locationArea') or '').strip()
+            if not day.get('date') or not (location or area):
+                continue
+            bookings.append({
+                'date': day['date'],
+                'location': location,
+                'locationId': location_ids.get(_key(location)) if location else None,
+                'area': area,
+                'dayType': day.get('dayType', ''),
+                'shootDay': day.get('shootDay'),
+            })
+        return {'bookings': bookings}
+
+    def _booking_keys(self, booking):
+        """(kind, table, key) entries a booking is filed under"""
+        keys = []
+        if booking.get('location'):
+            keys.append(('location', self._by_location, (booking['date'], booking.get('locationId') or _key(booking['location']))))
+        if booking.get('area'):
+            keys.append(('area', self._by_area, (booking['date'], _key(booking['area']))))
+        return keys
+
+    def add_segment(self, project_id, segment):
+        for booking in segment.get('bookings', []):
+            for _, table, key in self._booking_keys(booking):
+                table.setdefault(key, {})[project_id] = booking
+
+    def remove_segment(self, project_id, segment):
+        for booking in segment.get('bookings', []):
+            for _, table, key in self._booking_keys(booking):
+                projects = table.get(key)
+                if projects is not None:
+                    projects.pop(project_id, None)
+                    if not projects:
+                        del table[key]
+
+    # --- Queries ---
+
+    def conflicts_for_day(self, project_id, day):
+        """Other projects booked at this day's location or area on the same date (O(1) lookups)"""
+        self.refresh()
+        booking = {
+            'date': day.get('date'),
+            'location': (day.get('location') or '').strip(),
+            'area': (day.get('locationArea') or '').strip(),
+            'dayType': day.get('dayType', ''),
+            'shootDay': day.get('shootDay'),
+        }
+        if not booking['date']:
+            return []
+        if booking['location']:
+            booking['locationId'] = _location_ids().get(_key(booking['location']))
+
+        conflicts = []
+        with self._lock:
+            for kind, table, key in self._booking_keys(booking):
+                others = {pid: b for pid, b in table.get(key, {}).items() if pid != project_id}
+                if others:
+                    conflicts.append(self._describe(kind, booking['date'], {project_id: booking, **others}))
+        # Sharing a location implies sharing its area; only report area clashes with other projects
+        location_clash = {pid for c in conflicts if c['kind'] == 'location' for pid in c['projects']}
+        return [c for c in conflicts if c['kind'] == 'location' or not set(c['projects']) <= location_clash]
+
+    def conflicts(self, start=None, end=None, kinds=CONFLICT_KINDS, project_id=None):
+        """All dates where two or more projects share a location (or area) within the range"""
+        self.refresh()
+        results = []
+        with self._lock:
+            tables = [(kind, self._by_location if kind == 'location' else self._by_area) for kind in kinds]
+            for kind, table in tables:
+                for (date, _), projects in table.items():
+                    if len(projects) < 2:
+                        continue
+                    if (start and date < start) or (end and date > end):
+                        continue
+                    if project_id and project_id not in projects:
+                        continue
+                    results.append(self._describe(kind, date, projects))
+        results.sort(key=lambda c: (c['date'], c['kind'], c['name']))
+        return results
+
+    def _describe(self, kind, date, projects):
+        first = next(iter(projects.values()))
+        return {
+            'kind': kind,
+            'date': date,
+            'name': first['location'] if kind == 'location' else first['area'],
+            'projects': {
+                pid: {
+                    'location': b.get('location', ''),
+                    'area': b.get('area', ''),
+                    'dayType': b.get('dayType', ''),
+                    'shootDay': b.get('shootDay'),
+                }
+                for pid, b in projects.items()
+            },
+        }
+
+
+conflict_index = ConflictIndex()
+
+
+def conflict_warnings(project_id, days):
+    """Human-readable warnings for the given (just saved) days of a project"""
+    warnings = []
+    titles = {}
+    for day in days:
+        for conflict in conflict_index.conflicts_for_day(project_id, day):
+            others = []
+            for other_id in conflict['projects']:
+                if other_id == project_id:
+                    continue
+                if other_id not in titles:
+                    other = get_project(other_id) or {}
+                    titles[other_id] = other.get('title') or other_id
+                others.append(titles[other_id])
+            what = 'location' if conflict['kind'] == 'location' else 'area'
+            warnings.append(dict(conflict, message=f"{conflict['name']} ({what}) is also booked on {conflict['date']} by {', '.join(others)}"))
+    return warnings
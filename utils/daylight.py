@@ -0,0 +1,214 @@
+# utils/daylight.py
+"""
+Sunrise, sunset, civil twilight and daylight length for calendar days.
+
+Light times are computed when a calendar is saved (generation, edits,
+renames) and stored on each day as day['daylight'], so the viewer never
+does astronomy per request. Each day uses its location's coordinates,
+else its area's, else the DAYLIGHT_LATITUDE/DAYLIGHT_LONGITUDE default;
+times are local to DAYLIGHT_TZ.
+
+The stored record remembers the coordinates it was computed for, so a
+save only recomputes days whose coordinates changed (or that have none
+yet). Results are cached per (lat, lon, date) and the remaining work is
+batched per coordinate, sharing one observer and timezone per batch.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date as date_cls
+from zoneinfo import ZoneInfo
+
+from astral import Observer
+from astral import sun as astral_sun
+
+from .helpers import DATA_DIR, load_global_data
+
+logger = logging.getLogger(__name__)
+
+DAYLIGHT_TZ = os.environ.get('DAYLIGHT_TZ', 'Europe/Dublin')
+DEFAULT_COORDINATES = (float(os.environ.get('DAYLIGHT_LATITUDE', 53.3498)),
+                       float(os.environ.get('DAYLIGHT_LONGITUDE', -6.2603)))  # Dublin
+DAYLIGHT_CACHE_SIZE = int(os.environ.get('DAYLIGHT_CACHE_SIZE', 20000))  # (lat, lon, date) entries
+COORDINATE_PRECISION = 4  # ~11m; finer differences do not move the times by a second
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # (lat, lon, date) -> daylight record
+_reference_cache = (None, {}, {})
+
+
+def _key(value):
+    return ' '.join(str(value).lower().split()) if value else ''
+
+
+def parse_coordinates(record):
+    """
+    Normalise optional latitude/longitude on a location or area record in place.
+    Blank values remove the coordinates; invalid or half-given ones raise ValueError.
+    """
+    lat, lon = record.get('latitude'), record.get('longitude')
+    if lat in (None, '') and lon in (None, ''):
+        record.pop('latitude', None)
+        record.pop('longitude', None)
+        return record
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("Latitude and longitude must both be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Latitude must be between -90 and 90 and longitude between -180 and 180")
+    record['latitude'], record['longitude'] = round(lat, 6), round(lon, 6)
+    return record
+
+
+def coordinates_of(record):
+    """(lat, lon) of a location/area record, or None"""
+    if not record or record.get('latitude') in (None, '') or record.get('longitude') in (None, ''):
+        return None
+    try:
+        return (round(float(record['latitude']), COORDINATE_PRECISION),
+                round(float(record['longitude']), COORDINATE_PRECISION))
+    except (TypeError, ValueError):
+        return None
+
+
+def _references():
+    """(location key -> coordinates or area id, area key/id -> coordinates), re-read when the files change"""
+    global _reference_cache
+    signature = []
+    for name in ('locations.json', 'areas.json'):
+        try:
+            st = os.stat(os.path.join(DATA_DIR, name))
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    if _reference_cache[0] != signature:
+        areas = {}
+        for area in load_global_data('areas.json', []):
+            coords = coordinates_of(area)
+            areas[('id', area.get('id'))] = coords
+            areas[('name', _key(area.get('name')))] = coords
+        locations = {_key(loc.get('name')): (coordinates_of(loc), loc.get('areaId'))
+                     for loc in load_global_data('locations.json', [])}
+        _reference_cache = (signature, locations, areas)
+    return _reference_cache[1], _reference_cache[2]
+
+
+def resolve_coordinates(day, references=None):
+    """Coordinates for a day: its location's, else its area's, else the default"""
+    locations, areas = references or _references()
+    coords, area_id = locations.get(_key(day.get('location')), (None, None))
+    if coords:
+        return coords
+    coords = areas.get(('id', day.get('locationAreaId') or area_id)) or areas.get(('name', _key(day.get('locationArea'))))
+    return coords or DEFAULT_COORDINATES
+
+
+def _hhmm(moment):
+    return moment.strftime('%H:%M') if moment else None
+
+
+def _event(name, observer, tz, day_date):
+    try:
+        return getattr(astral_sun, name)(observer, date=day_date, tzinfo=tz)
+    except ValueError:
+        return None  # The sun never crosses that elevation on this date
+
+
+def _compute(observer, tz, day_date):
+    try:
+        times = astral_sun.sun(observer, date=day_date, tzinfo=tz)
+        dawn, sunrise, sunset, dusk = times['dawn'], times['sunrise'], times['sunset'], times['dusk']
+    except ValueError:
+        # Polar day/night or no civil twilight: keep whichever events exist
+        dawn, sunrise, sunset, dusk = (_event(name, observer, tz, day_date)
+                                       for name in ('dawn', 'sunrise', 'sunset', 'dusk'))
+    minutes = int((sunset - sunrise).total_seconds() // 60) if sunrise and sunset else None
+    return {
+        'dawn': _hhmm(dawn),
+        'sunrise': _hhmm(sunrise),
+        'sunset': _hhmm(sunset),
+        'dusk': _hhmm(dusk),
+        'minutes': minutes,
+    }
+
+
+def daylight_for(coords, dates):
+    """{date string: daylight record} for one coordinate, computing cache misses in one batch"""
+    results, missing = {}, []
+    with _lock:
+        for day_date in dates:
+            entry = _cache.get((coords[0], coords[1], day_date))
+            if entry is not None:
+                _cache.move_to_end((coords[0], coords[1], day_date))
+                results[day_date] = entry
+            else:
+                missing.append(day_date)
+    if missing:
+        observer, tz = Observer(latitude=coords[0], longitude=coords[1]), ZoneInfo(DAYLIGHT_TZ)
+        computed = {}
+        for day_date in missing:
+            try:
+                computed[day_date] = _compute(observer, tz, date_cls.fromisoformat(day_date))
+            except ValueError:
+                continue  # Malformed date string
+        with _lock:
+            for day_date, entry in computed.items():
+                _cache[(coords[0], coords[1], day_date)] = entry
+            while len(_cache) > DAYLIGHT_CACHE_SIZE:
+                _cache.popitem(last=False)
+        results.update(computed)
+    return results
+
+
+def enrich_days(days):
+    """
+    Set day['daylight'] on days that lack it or whose coordinates changed.
+    Modifies the days in place and returns the dates that were (re)computed.
+    """
+    references = _references()
+    pending = {}   # coords -> [day]
+    for day in days:
+        if not day.get('date'):
+            continue
+        coords = resolve_coordinates(day, references)
+        current = day.get('daylight')
+        if isinstance(current, dict) and tuple(current.get('at') or ()) == coords:
+            continue
+        pending.setdefault(coords, []).append(day)
+
+    updated = []
+    for coords, batch in pending.items():
+        times = daylight_for(coords, [d['date'] for d in batch])
+        for day in batch:
+            entry = times.get(day['date'])
+            if entry is not None:
+                day['daylight'] = dict(entry, at=list(coords))
+                updated.append(day['date'])
+    if updated:
+        logger.debug(f"Computed daylight for {len(updated)} day(s) over {len(pending)} coordinate(s)")
+    return updated
+
+
+def refresh_projects(project_ids):
+    """
+    Re-save calendars after location/area coordinates changed. Only the days
+    whose resolved coordinates moved are recomputed; projects with none are left alone.
+    Returns {project_id: [changed dates]}.
+    """
+    from .helpers import get_project_calendar, save_project_calendar, calendar_lock # Local imports avoid circular imports
+    from .events import publish_calendar_change
+    results = {}
+    for project_id in project_ids:
+        try:
+            with calendar_lock(project_id):
+                calendar_data = get_project_calendar(project_id)
+                changed = enrich_days(calendar_data.get('days', []))
+                if changed:
+                    save_project_calendar(project_id, calendar_data)
+                    publish_calendar_change(project_id, calendar_data, 'day', changed)
+                    results[project_id] = changed
+        except Exception as e:
+            logger.error(f"Error refreshing daylight for project {project_id}: {str(e)}")
+    return results
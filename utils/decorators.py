@@ -23,4 +23,19 @@ def admin_required(f):
              # Redirect to the admin login page defined in the 'auth' blueprint
             return redirect(url_for('auth.admin_login', next=request.url))
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+def calendar_write(f):
+    """
+    Decorator for views that read, edit and save a project's calendar: holds
+    the project's calendar lock for the whole request (except GET), so
+    concurrent edits in any worker apply one after the other.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'GET':
+            return f(*args, **kwargs)
+        from .helpers import calendar_lock # Local import keeps this module free of app state
+        with calendar_lock(kwargs['project_id']):
+            return f(*args, **kwargs)
+    return decorated_function
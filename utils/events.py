@@ -0,0 +1,361 @@
+# utils/events.py
+"""
+Calendar change log and live change events.
+
+Every calendar mutation records a compact entry (changed dates, counts and,
+for small patches, the day records) under the calendar's new revision in a
+small SQLite log under RUN_DIR, which every gunicorn worker can read.
+
+The log serves two readers:
+- SSE streams: each worker runs a single watcher thread that polls the log
+  (one cheap query per interval, however many clients are connected) and
+  wakes its local subscribers. An open stream holds one gthread thread, so
+  each worker keeps at most SSE_MAX_STREAMS open; beyond that a request is
+  answered at once with the events it missed and a longer retry, and the
+  browser polls (EventSource reconnects with Last-Event-ID) instead of
+  taking a thread away from normal requests.
+- Delta sync: calendar_changes_since() folds the entries after a revision
+  into changed day records and count deltas. The log is compacted to the
+  last CHANGE_LOG_RETENTION entries per project; older clients (or a wiped
+  RUN_DIR) fall back to a full snapshot.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from .helpers import RUN_DIR, get_project_calendar, save_project_calendar, calendar_lock, enriched_dates
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DB = os.path.join(RUN_DIR, 'events.sqlite3')
+POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))  # Seconds between watcher polls
+MAX_EVENT_ROWS = 50000  # Safety cap across all projects (e.g. deleted ones)
+CHANGE_LOG_RETENTION = int(os.environ.get('CHANGE_LOG_RETENTION', 500))  # Entries kept per project
+COUNT_GROUPS = ('departmentCounts', 'locationCounts', 'areaCounts')
+SSE_HEARTBEAT_SECONDS = 25   # Comment frame to keep proxies from closing idle streams
+SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 600))  # Clients reconnect with Last-Event-ID
+SSE_RETRY_MS = 3000
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 16))  # Open streams per worker; keep below gunicorn --threads
+SSE_POLL_RETRY_MS = int(os.environ.get('SSE_POLL_RETRY_MS', 15000))  # Reconnect delay for clients over the cap
+
+_local = threading.local()
+_streams = threading.BoundedSemaphore(max(SSE_MAX_STREAMS, 1))
+
+
+def _connect():
+    """Per-thread SQLite connection to the shared event log"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(RUN_DIR, exist_ok=True)
+        conn = sqlite3.connect(EVENTS_DB, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_project ON events (project_id, revision)")
+        _local.conn = conn
+    return conn
+
+
+def _row_to_event(row):
+    event_id, project_id, revision, event_type, payload = row
+    event = json.loads(payload)
+    event.update({'id': event_id, 'projectId': project_id, 'revision': revision, 'type': event_type})
+    return event
+
+
+def publish_event(project_id, event_type, revision, data=None):
+    """
+    Record a change event for a project and wake local subscribers.
+
+    Event types: 'day' (days patched), 'move' (days moved), 'counts'
+    (counts changed), 'special-dates' (holidays, hiatus etc. edited) and
+    'regenerated' (calendar rebuilt, clients reload).
+    Never raises - a failed publish must not fail the save that triggered it.
+    """
+    try:
+        conn = _connect()
+        revision = int(revision or 0)
+        cursor = conn.execute(
+            "INSERT INTO events (project_id, revision, type, payload, created) VALUES (?, ?, ?, ?, ?)",
+            (project_id, revision, event_type,
+             json.dumps(data or {}, separators=(',', ':'), ensure_ascii=False), time.time())
+        )
+        # Compact: keep only the most recent entries for this project
+        conn.execute("DELETE FROM events WHERE project_id = ? AND revision <= ?",
+                     (project_id, revision - CHANGE_LOG_RETENTION))
+        if cursor.lastrowid % 100 == 0:
+            conn.execute("DELETE FROM events WHERE id <= ?", (cursor.lastrowid - MAX_EVENT_ROWS,))
+        broker.poll()
+    except Exception as e:
+        logger.error(f"Error publishing {event_type} event for project {project_id}: {str(e)}")
+
+
+def publish_calendar_change(project_id, calendar_data, event_type, dates=None, include_days=True):
+    """
+    Record a change entry for the calendar's current revision: the changed
+    dates, the recalculated counts and (unless include_days is False, e.g.
+    for regenerations touching every day) the current records for those
+    dates, so live clients can patch rows in place.
+
+    `dates=None` means the changed dates are unknown; delta sync across such
+    an entry falls back to a full snapshot. Days whose daylight the save
+    recomputed are added to `dates`.
+    """
+    data = {'counts': {group: calendar_data.get(group, {}) for group in COUNT_GROUPS}}
+    if dates is not None:
+        wanted = set(dates)
+        wanted.update(enriched_dates(project_id, calendar_data.get('revision')))
+        data['dates'] = sorted(wanted)
+        if include_days:
+            data['days'] = [d for d in calendar_data.get('days', []) if d.get('date') in wanted]
+    publish_event(project_id, event_type, calendar_data.get('revision'), data)
+
+
+def special_entry_dates(entry):
+    """Calendar dates covered by a holiday / weekend / hiatus / special date entry"""
+    if not isinstance(entry, dict):
+        return []
+    if entry.get('startDate') and entry.get('endDate'):
+        try:
+            start = datetime.strptime(entry['startDate'], '%Y-%m-%d').date()
+            end = datetime.strptime(entry['endDate'], '%Y-%m-%d').date()
+            return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        except ValueError:
+            return []
+    return [entry['date']] if entry.get('date') else []
+
+
+def record_special_dates_change(project_id, *entries):
+    """
+    Log an edit to a project's special dates (holidays, working weekends,
+    hiatus periods, other special dates). The calendar gets a new revision
+    so delta sync clients learn which dates are affected; the day records
+    themselves only change when the calendar is regenerated.
+    """
+    try:
+        dates = set()
+        for entry in entries:
+            dates.update(special_entry_dates(entry))
+        with calendar_lock(project_id):
+            calendar_data = get_project_calendar(project_id)
+            if not calendar_data.get('days'):
+                return  # Nothing generated yet, nothing to sync
+            save_project_calendar(project_id, calendar_data)
+            publish_calendar_change(project_id, calendar_data, 'special-dates', dates, include_days=False)
+    except Exception as e:
+        logger.error(f"Error recording special dates change for project {project_id}: {str(e)}")
+
+
+def _numeric_counts(counts):
+    """Only the numeric entries of a counts dict (older files may hold nested data)"""
+    if not isinstance(counts, dict):
+        return {}
+    return {k: v for k, v in counts.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def calendar_changes_since(project_id, calendar_data, since):
+    """
+    Fold the change log after revision `since` into a delta:
+    {full: False, revision, since, days, removed, countDeltas, specialDatesChanged}.
+
+    Returns a full snapshot ({full: True, revision, calendar}) when the log
+    cannot answer exactly: `since` is unknown, older than the compacted log,
+    ahead of the calendar, or an entry in between lacks its changed dates.
+    """
+    current = int(calendar_data.get('revision') or 0)
+    snapshot = {'full': True, 'revision': current, 'since': since, 'calendar': calendar_data}
+    if since <= 0 or since > current:
+        return snapshot
+    if since == current:
+        return {'full': False, 'revision': current, 'since': since, 'days': [], 'removed': [],
+                'countDeltas': {}, 'specialDatesChanged': False}
+
+    entries = events_since(project_id, since - 1, limit=CHANGE_LOG_RETENTION + 1)
+    base = next((e for e in entries if e['revision'] == since), None)
+    newer = [e for e in entries if e['revision'] > since]
+    # Every revision after `since` must be present, with its changed dates
+    if base is None or {e['revision'] for e in newer} != set(range(since + 1, current + 1)) \
+            or any('dates' not in e for e in newer):
+        return snapshot
+
+    dates = set()
+    for entry in newer:
+        dates.update(entry['dates'])
+    days = [d for d in calendar_data.get('days', []) if d.get('date') in dates]
+    present = {d.get('date') for d in days}
+
+    count_deltas = {}
+    for group in COUNT_GROUPS:
+        before = _numeric_counts(base.get('counts', {}).get(group))
+        after = _numeric_counts(calendar_data.get(group))
+        delta = {k: after.get(k, 0) - before.get(k, 0) for k in set(before) | set(after)
+                 if after.get(k, 0) != before.get(k, 0)}
+        if delta:
+            count_deltas[group] = delta
+
+    return {
+        'full': False,
+        'revision': current,
+        'since': since,
+        'days': days,
+        'removed': sorted(dates - present),
+        'countDeltas': count_deltas,
+        'specialDatesChanged': any(e['type'] == 'special-dates' for e in newer)
+    }
+
+
+def events_since(project_id, revision, limit=500):
+    """Events for a project newer than the given revision (oldest first)"""
+    try:
+        rows = _connect().execute(
+            "SELECT id, project_id, revision, type, payload FROM events "
+            "WHERE project_id = ? AND revision > ? ORDER BY id LIMIT ?",
+            (project_id, int(revision), limit)
+        ).fetchall()
+        return [_row_to_event(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Error reading events for project {project_id}: {str(e)}")
+        return []
+
+
+class EventBroker:
+    """Fans events out to the SSE subscribers of this worker process"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, buffer_size=1000):
+        self.poll_interval = poll_interval
+        self._recent = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._last_id = None
+        self._watcher = None
+        self._pid = None
+
+    def _start(self):
+        """Start the watcher thread lazily (and again after a fork)"""
+        if self._watcher is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._watcher is not None and self._pid == os.getpid():
+                return
+            try:
+                row = _connect().execute("SELECT MAX(id) FROM events").fetchone()
+                self._last_id = row[0] or 0
+            except Exception as e:
+                logger.error(f"Error initialising event broker: {str(e)}")
+                self._last_id = 0
+            self._pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name='event-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.poll()
+
+    def poll(self):
+        """Pull rows written by any worker since the last poll and notify waiters"""
+        if self._last_id is None:
+            return
+        try:
+            rows = _connect().execute(
+                "SELECT id, project_id, revision, type, payload FROM events WHERE id > ? ORDER BY id",
+                (self._last_id,)
+            ).fetchall()
+        except Exception as e:
+            logger.error(f"Error polling event log: {str(e)}")
+            return
+        if not rows:
+            return
+        with self._cond:
+            for row in rows:
+                if row[0] > self._last_id:
+                    self._recent.append(_row_to_event(row))
+                    self._last_id = row[0]
+            self._cond.notify_all()
+
+    def cursor(self):
+        """Current position in the event stream, for new subscribers"""
+        self._start()
+        return self._last_id
+
+    def wait(self, cursor, timeout):
+        """
+        Block until events newer than `cursor` arrive or `timeout` passes.
+        Returns (events, new_cursor).
+        """
+        self._start()
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > cursor, timeout=timeout)
+            events = [e for e in self._recent if e['id'] > cursor]
+            return events, self._last_id
+
+
+broker = EventBroker()
+
+
+def format_sse(event):
+    """Serialise an event as a server-sent events frame (id = revision)"""
+    payload = {k: v for k, v in event.items() if k not in ('id', 'projectId')}
+    return (f"id: {event['revision']}\n"
+            f"event: {event['type']}\n"
+            f"data: {json.dumps(payload, separators=(',', ':'), ensure_ascii=False)}\n\n")
+
+
+def iter_sse(project_id, last_revision=None):
+    """
+    Generator of SSE frames for one project. Replays events newer than
+    `last_revision` (from Last-Event-ID or ?since=), then blocks on the
+    broker until the stream's maximum lifetime is reached.
+
+    When this worker already has SSE_MAX_STREAMS open, only the replay is
+    sent, with a retry of SSE_POLL_RETRY_MS, and the response ends.
+    """
+    streaming = SSE_MAX_STREAMS > 0 and _streams.acquire(blocking=False)
+    try:
+        cursor = broker.cursor()
+        sent_revision = -1
+        yield f"retry: {SSE_RETRY_MS if streaming else SSE_POLL_RETRY_MS}\n\n"
+
+        if last_revision is not None:
+            for event in events_since(project_id, last_revision):
+                sent_revision = max(sent_revision, event['revision'])
+                yield format_sse(event)
+        if not streaming:
+            return
+
+        deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            events, cursor = broker.wait(cursor, timeout=SSE_HEARTBEAT_SECONDS)
+            matching = [e for e in events if e['projectId'] == project_id and e['revision'] > sent_revision]
+            if not matching:
+                yield ": keepalive\n\n"
+                continue
+            for event in matching:
+                sent_revision = max(sent_revision, event['revision'])
+                yield format_sse(event)
+    finally:
+        if streaming:
+            _streams.release()
+
+
+def changed_dates(days_before, days_after):
+    """
+    Dates whose records differ between two day lists (including days added
+    or removed). `days_before` must hold copies taken before the mutation.
+    """
+    before = {d.get('date'): d for d in days_before}
+    after = {d.get('date'): d for d in days_after}
+    dates = [date for date, day in after.items() if before.get(date) != day]
+    dates.extend(date for date in before if date not in after)
+    return dates
@@ -1,9 +1,13 @@
 import os
+import re
 import json
 import shutil
+import hashlib
 import logging
 from datetime import datetime
 
+from .helpers import dump_json, write_json_atomic
+
 logger = logging.getLogger(__name__)
 
 def ensure_directory(directory_path):
@@ -28,7 +32,7 @@ def save_json_file(file_path, data):
         
         # Write data to file
         with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+            dump_json(data, f)
         
         return True
     except Exception as e:
@@ -49,37 +53,243 @@ def load_json_file(file_path, default=None):
         logger.error(f"Error loading JSON file {file_path}: {str(e)}")
         return default
 
+# --- Snapshot backups ---
+#
+# A snapshot is a normal directory tree (<backup_dir>/<YYYYmmdd_HHMMSS>/...) whose
+# files are hard links into a content-addressed blob store (<backup_dir>/blobs/),
+# plus a manifest (<backup_dir>/manifests/<name>.json) of every file's checksum,
+# size and mtime. Files whose size and mtime match the previous manifest are not
+# even read again, so a backup costs one stat per file plus the changed bytes.
+
+BLOBS_DIR = 'blobs'
+MANIFESTS_DIR = 'manifests'
+SNAPSHOT_NAME_FORMAT = "%Y%m%d_%H%M%S"
+# Retention: newest snapshot per hour / day / ISO week, for this many of the most recent such periods
+RETENTION = (
+    ('%Y%m%d%H', int(os.environ.get('BACKUP_KEEP_HOURLY', 24))),
+    ('%Y%m%d', int(os.environ.get('BACKUP_KEEP_DAILY', 7))),
+    ('%G%V', int(os.environ.get('BACKUP_KEEP_WEEKLY', 8))),
+)
+
+
+def _blob_path(backup_dir, digest):
+    return os.path.join(backup_dir, BLOBS_DIR, digest[:2], digest)
+
+
+def _manifest_path(backup_dir, name):
+    if not re.fullmatch(r'[0-9]{8}_[0-9]{6}(-[0-9]+)?', name or ''):
+        raise ValueError(f"Invalid snapshot name: {name}")
+    return os.path.join(backup_dir, MANIFESTS_DIR, f"{name}.json")
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, dest):
+    """Hard link source to dest, copying where links are unsupported (e.g. across filesystems)"""
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+def list_snapshots(backup_dir):
+    """Snapshot names (oldest first) that have a manifest"""
+    try:
+        names = os.listdir(os.path.join(backup_dir, MANIFESTS_DIR))
+    except OSError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+
+def load_manifest(backup_dir, name):
+    with open(_manifest_path(backup_dir, name), 'r') as f:
+        return json.load(f)
+
+
+def create_snapshot(data_dir, backup_dir, now=None):
+    """
+    Snapshot data_dir into backup_dir and apply the retention policy.
+    Returns the manifest (name, created, files, stats).
+    """
+    now = now or datetime.now()
+    snapshots = list_snapshots(backup_dir)
+    previous = load_manifest(backup_dir, snapshots[-1])['files'] if snapshots else {}
+
+    name = now.strftime(SNAPSHOT_NAME_FORMAT)
+    suffix = 1
+    while name in snapshots or os.path.exists(os.path.join(backup_dir, name)):
+        name = f"{now.strftime(SNAPSHOT_NAME_FORMAT)}-{suffix}"
+        suffix += 1
+    snapshot_path = os.path.join(backup_dir, name)
+
+    files = {}
+    stats = {'files': 0, 'hashed': 0, 'storedFiles': 0, 'storedBytes': 0, 'totalBytes': 0}
+    for root, dirs, filenames in os.walk(data_dir):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.tmp'):
+                continue  # In-flight atomic writes
+            path = os.path.join(root, filename)
+            rel = os.path.relpath(path, data_dir).replace(os.sep, '/')
+            st = os.stat(path)
+            entry = previous.get(rel)
+            if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns \
+                    and os.path.exists(_blob_path(backup_dir, entry['sha256'])):
+                digest = entry['sha256']
+            else:
+                digest = _hash_file(path)
+                stats['hashed'] += 1
+                blob = _blob_path(backup_dir, digest)
+                if not os.path.exists(blob):
+                    ensure_directory(os.path.dirname(blob))
+                    tmp = f"{blob}.{os.getpid()}.tmp"
+                    shutil.copyfile(path, tmp)
+                    os.chmod(tmp, 0o444)  # Blobs are shared by every snapshot; never edit in place
+                    os.replace(tmp, blob)
+                    stats['storedFiles'] += 1
+                    stats['storedBytes'] += st.st_size
+            files[rel] = {'sha256': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            stats['files'] += 1
+            stats['totalBytes'] += st.st_size
+
+            dest = os.path.join(snapshot_path, *rel.split('/'))
+            ensure_directory(os.path.dirname(dest))
+            _link_or_copy(_blob_path(backup_dir, digest), dest)
+
+    ensure_directory(snapshot_path)  # Even an empty data dir gets a snapshot
+    manifest = {'name': name, 'created': now.isoformat(), 'files': files, 'stats': stats}
+    ensure_directory(os.path.join(backup_dir, MANIFESTS_DIR))
+    write_json_atomic(_manifest_path(backup_dir, name), manifest)
+    logger.info(f"Snapshot {name}: {stats['files']} files, {stats['hashed']} hashed, "
+                f"{stats['storedFiles']} new blobs ({stats['storedBytes']} bytes)")
+    apply_retention(backup_dir)
+    return manifest
+
+
+def retained_snapshots(names):
+    """Names kept by the hourly/daily/weekly policy (the newest snapshot is always kept)"""
+    dated = []
+    for name in names:
+        try:
+            dated.append((datetime.strptime(name[:15], SNAPSHOT_NAME_FORMAT), name))
+        except ValueError:
+            continue
+    dated.sort(reverse=True)
+    keep = {dated[0][1]} if dated else set()
+    for bucket_format, count in RETENTION:
+        seen = set()
+        for when, name in dated:
+            bucket = when.strftime(bucket_format)
+            if bucket in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(bucket)
+            keep.add(name)
+    return keep
+
+
+def apply_retention(backup_dir):
+    """Delete snapshots outside the retention policy, then blobs no manifest references"""
+    names = list_snapshots(backup_dir)
+    keep = retained_snapshots(names)
+    removed = [name for name in names if name not in keep]
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+        os.remove(_manifest_path(backup_dir, name))
+    if not removed:
+        return []
+
+    referenced = set()
+    for name in keep:
+        referenced.update(entry['sha256'] for entry in load_manifest(backup_dir, name)['files'].values())
+    blobs_root = os.path.join(backup_dir, BLOBS_DIR)
+    for root, _, filenames in os.walk(blobs_root):
+        for filename in filenames:
+            if filename not in referenced:
+                os.remove(os.path.join(root, filename))
+    logger.info(f"Pruned {len(removed)} snapshot(s)")
+    return removed
+
+
+def restore_snapshot(backup_dir, name, data_dir, project_id=None):
+    """
+    Restore a snapshot (all data, or just projects/<project_id>/) into data_dir.
+    Files that already match are skipped; each restored file is replaced
+    atomically. A single-project restore also removes files the project
+    gained after the snapshot (e.g. later branches or versions).
+    Returns the list of restored relative paths.
+    """
+    manifest = load_manifest(backup_dir, name)
+    prefix = f"projects/{project_id}/" if project_id else ''
+    entries = {rel: e for rel, e in manifest['files'].items() if rel.startswith(prefix)}
+    if project_id and not entries:
+        raise ValueError(f"Project {project_id} is not in snapshot {name}")
+
+    restored = []
+    for rel, entry in entries.items():
+        dest = os.path.join(data_dir, *rel.split('/'))
+        try:
+            if os.path.getsize(dest) == entry['size'] and _hash_file(dest) == entry['sha256']:
+                continue
+        except OSError:
+            pass
+        ensure_directory(os.path.dirname(dest))
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        shutil.copyfile(_blob_path(backup_dir, entry['sha256']), tmp)  # Copy, never link: data files are rewritten
+        os.replace(tmp, dest)
+        restored.append(rel)
+
+    if project_id:
+        project_dir = os.path.join(data_dir, 'projects', project_id)
+        for root, _, filenames in os.walk(project_dir):
+            for filename in filenames:
+                rel = os.path.relpath(os.path.join(root, filename), data_dir).replace(os.sep, '/')
+                if rel not in entries:
+                    os.remove(os.path.join(root, filename))
+                    restored.append(rel)
+    logger.info(f"Restored {len(restored)} file(s) from snapshot {name}" + (f" for project {project_id}" if project_id else ''))
+    return restored
+
+
 def backup_project_data(data_dir, backup_dir):
     """
-    Create a backup of all project data
+    Create a backup of all project data (an incremental snapshot, see create_snapshot)
     """
     try:
-        # Ensure backup directory exists
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = os.path.join(backup_dir, f"backup_{timestamp}")
-        ensure_directory(backup_path)
-        
-        # Copy all files from data directory
-        shutil.copytree(data_dir, backup_path, dirs_exist_ok=True)
-        
+        manifest = create_snapshot(data_dir, backup_dir)
+        backup_path = os.path.join(backup_dir, manifest['name'])
         logger.info(f"Backup created at {backup_path}")
         return backup_path
     except Exception as e:
         logger.error(f"Error creating backup: {str(e)}")
         return None
 
-def restore_backup(backup_path, data_dir):
+def restore_backup(backup_path, data_dir, project_id=None):
     """
-    Restore data from a backup
+    Restore data from a backup (a snapshot, or a plain directory copy made by older versions)
     """
     try:
         if not os.path.exists(backup_path):
             logger.error(f"Backup path {backup_path} does not exist")
             return False
-        
-        # Copy files from backup to data directory
-        shutil.copytree(backup_path, data_dir, dirs_exist_ok=True)
-        
+
+        backup_dir, name = os.path.split(os.path.normpath(backup_path))
+        if name in list_snapshots(backup_dir):
+            restore_snapshot(backup_dir, name, data_dir, project_id)
+        elif project_id:
+            shutil.copytree(os.path.join(backup_path, 'projects', project_id),
+                            os.path.join(data_dir, 'projects', project_id), dirs_exist_ok=True)
+        else:
+            # Copy files from backup to data directory
+            shutil.copytree(backup_path, data_dir, dirs_exist_ok=True)
+
         logger.info(f"Restored backup from {backup_path}")
         return True
     except Exception as e:
@@ -2,7 +2,10 @@
 import os
 import json
 import uuid
+import fcntl
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 # Import necessary functions from calendar_generator directly
 # Adjust based on actual functions needed by these helpers
@@ -14,14 +17,107 @@ BASE_DIR = os.path.dirname(UTILS_DIR) # Project root (/app)
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 PROJECTS_DIR = os.path.join(DATA_DIR, 'projects')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
+# Runtime state shared between gunicorn workers (event log, caches). Not backed up.
+RUN_DIR = os.environ.get('RUN_DIR', os.path.join(BASE_DIR, 'run'))
+# Snapshot backups of DATA_DIR (see utils/file_utils.py); backup features are off when unset
+BACKUP_DIR = os.environ.get('BACKUP_DIR', '')
 
 # Setup logger for helpers
 logger = logging.getLogger(__name__)
 
+# JSON files are written compactly; set PRETTY_JSON=true to indent them for debugging
+PRETTY_JSON = os.environ.get('PRETTY_JSON', 'False').lower() == 'true'
+
+def dump_json(data, f, **kwargs):
+    """json.dump using the compact (or PRETTY_JSON debug) encoding used for all data files"""
+    if PRETTY_JSON:
+        json.dump(data, f, indent=2, **kwargs)
+    else:
+        json.dump(data, f, separators=(',', ':'), **kwargs)
+
+def write_json_atomic(path, data, **kwargs):
+    """Write JSON to a temp file in the same directory and os.replace it into place"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            dump_json(data, f, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# --- Calendar Save Listeners ---
+# Indexes (search, conflicts, ...) register here to be updated incrementally
+# whenever a calendar is saved. calendar_data is None when a project is deleted.
+_calendar_listeners = []
+
+def register_calendar_listener(listener):
+    """Call listener(project_id, calendar_data) after every calendar save"""
+    if listener not in _calendar_listeners:
+        _calendar_listeners.append(listener)
+    return listener
+
+def notify_calendar_listeners(project_id, calendar_data):
+    for listener in list(_calendar_listeners):
+        try:
+            listener(project_id, calendar_data)
+        except Exception as e:
+            logger.error(f"Calendar listener {getattr(listener, '__qualname__', listener)} failed for project {project_id}: {str(e)}")
+
+# --- Daylight Changes Made By Saves ---
+# save_project_calendar fills in daylight on days the caller did not edit
+# (first save after deploy, coordinates changed). The dates are kept for the
+# saving thread so publish_calendar_change can include them in the change.
+_enriched = threading.local()
+
+def enriched_dates(project_id, revision):
+    """Dates whose daylight this thread's save of `revision` (re)computed"""
+    last = getattr(_enriched, 'last', None)
+    if last is not None and last[0] == project_id and last[1] == revision:
+        return last[2]
+    return []
+
+# --- Calendar Lock ---
+_held_calendar_locks = threading.local()
+
+@contextmanager
+def calendar_lock(project_id):
+    """
+    Exclusive lock on a project's calendar across threads and gunicorn
+    workers (flock on the project directory). save_project_calendar takes it
+    for the revision bump; hold it around a whole read-modify-save so that
+    concurrent edits don't overwrite each other. Re-entrant within a thread.
+    """
+    held = getattr(_held_calendar_locks, 'projects', None)
+    if held is None:
+        held = _held_calendar_locks.projects = set()
+    project_dir = os.path.join(PROJECTS_DIR, project_id)
+    if project_id in held or not os.path.isdir(project_dir):
+        yield # Already held by this thread, or nothing on disk to race on
+        return
+    fd = os.open(project_dir, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        held.add(project_id)
+        try:
+            yield
+        finally:
+            held.discard(project_id)
+    finally:
+        os.close(fd) # Releases the flock
+
+def _stored_revision(calendar_file):
+    """Revision of the calendar on disk (0 if there is none)"""
+    try:
+        with open(calendar_file, 'r', encoding='utf-8') as f:
+            return int(json.load(f).get('revision') or 0)
+    except (OSError, ValueError, AttributeError):
+        return 0
+
 # --- Helper Functions ---
 
-def get_projects():
-    """Get all projects"""
+def get_projects(include_archived=False):
+    """Get all projects (archived ones, as manifest rows, only if include_archived)"""
     projects = []
     try:
         if os.path.exists(PROJECTS_DIR):
@@ -39,7 +135,11 @@ def get_projects():
                         except Exception as inner_e:
                              logger.error(f"Error reading main.json for project {project_id}: {str(inner_e)}")
 
-        return sorted(projects, key=lambda x: x.get('updated', ''), reverse=True)
+        projects = sorted(projects, key=lambda x: x.get('updated', ''), reverse=True)
+        if include_archived:
+            from .archive import archived_projects # Local import avoids a circular import
+            projects.extend(archived_projects())
+        return projects
     except Exception as e:
         logger.error(f"Error listing projects directory: {str(e)}")
         return []
@@ -54,6 +154,10 @@ def get_project(project_id):
         if os.path.exists(main_file):
             with open(main_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
+        from .archive import read_archived_json # Local import avoids a circular import
+        archived = read_archived_json(project_id, 'main.json')
+        if archived is not None:
+            return dict(archived, archived=True)
         logger.warning(f"Project main.json not found for ID: {project_id}")
         return None
     except Exception as e:
@@ -75,6 +179,11 @@ def save_project(project):
              raise ValueError("Invalid project ID")
 
 
+        from .archive import is_archived # Local import avoids a circular import
+        if is_archived(project_id):
+            raise ValueError("Project is archived; unarchive it to make changes")
+        project.pop('archived', None) # Read-only marker added by get_project
+
         project_dir = os.path.join(PROJECTS_DIR, project_id)
         os.makedirs(project_dir, exist_ok=True)
 
@@ -84,8 +193,14 @@ def save_project(project):
         project['updated'] = now
 
         main_file = os.path.join(project_dir, 'main.json')
+        previous = get_project(project_id) if os.path.exists(main_file) else None
+        if previous and previous.get('feedKey'):
+            project.setdefault('feedKey', previous['feedKey']) # Keep calendar feed tokens valid across edits
+        if previous and previous.get('version') != project.get('version'):
+            from .versions import on_version_change # Local import avoids a circular import
+            on_version_change(project_id, previous.get('version'), project.get('version'))
         with open(main_file, 'w', encoding='utf-8') as f:
-            json.dump(project, f, indent=2, ensure_ascii=False)
+            dump_json(project, f, ensure_ascii=False)
 
         logger.info(f"Project {project_id} saved successfully")
         return project
@@ -103,23 +218,47 @@ def get_project_calendar(project_id):
         if os.path.exists(calendar_file):
             with open(calendar_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
+        from .archive import read_archived_json # Local import avoids a circular import
+        archived = read_archived_json(project_id, 'calendar.json')
+        if archived is not None:
+            return archived
         return {"days": []} # Return empty structure if no file
     except Exception as e:
         logger.error(f"Error getting calendar for project {project_id}: {str(e)}")
         return {"days": []}
 
 def save_project_calendar(project_id, calendar_data):
-    """Save calendar data for a project"""
+    """Save calendar data for a project, bumping its revision number"""
     if not project_id: raise ValueError("Project ID is required to save calendar")
+    from .archive import is_archived # Local import avoids a circular import
     try:
         project_dir = os.path.join(PROJECTS_DIR, project_id)
-        os.makedirs(project_dir, exist_ok=True) # Ensure directory exists
         calendar_file = os.path.join(project_dir, 'calendar.json')
 
-        with open(calendar_file, 'w', encoding='utf-8') as f:
-            json.dump(calendar_data, f, indent=2, ensure_ascii=False)
+        # Light times for new days or days whose coordinates changed (see utils/daylight.py)
+        from .daylight import enrich_days # Local import avoids a circular import
+        enriched = enrich_days(calendar_data.get('days', []))
+
+        # Every save gets the next revision after the one on disk, under the
+        # calendar lock so concurrent saves (any worker) never share one. Live
+        # update events, delta sync and undo/redo rely on them being contiguous.
+        with calendar_lock(project_id):
+            # Checked under the lock: archive_project holds it from its read to removing the directory
+            if is_archived(project_id): raise ValueError("Project is archived; unarchive it to make changes")
+            os.makedirs(project_dir, exist_ok=True) # Ensure directory exists
+            stored = _stored_revision(calendar_file)
+            base = int(calendar_data.get('revision') or 0)
+            if base and base < stored:
+                logger.warning(f"Calendar for project {project_id} saved from revision {base} over revision {stored}; "
+                               f"take calendar_lock around the read-modify-save")
+            calendar_data['revision'] = max(stored, base) + 1
+
+            # Write to a temp file and rename, so readers never see a half-written calendar
+            write_json_atomic(calendar_file, calendar_data, ensure_ascii=False)
+        _enriched.last = (project_id, calendar_data['revision'], enriched)
 
         logger.info(f"Calendar data for project {project_id} saved successfully")
+        notify_calendar_listeners(project_id, calendar_data)
         return calendar_data # Return the saved data
     except Exception as e:
         logger.error(f"Error saving calendar data for project {project_id}: {str(e)}")
@@ -132,11 +271,22 @@ def generate_calendar(project):
         return {"days": [], "error": "Invalid project data"}
     try:
         project_id = project['id']
-        existing_calendar = get_project_calendar(project_id)
-        # generate_calendar_days is imported from .calendar_generator
-        calendar_data = generate_calendar_days(project, existing_calendar)
-        # Todo: Enhance generate_calendar_days to robustly merge/update area info
-        return save_project_calendar(project_id, calendar_data)
+        from .events import publish_calendar_change, changed_dates # Local imports avoid circular imports
+        from .oplog import record_operation
+        # Read through publish under the lock: an edit saved in between would be
+        # overwritten, and the undo delta and changed dates would describe a stale calendar
+        with calendar_lock(project_id):
+            existing_calendar = get_project_calendar(project_id)
+            # generate_calendar_days is imported from .calendar_generator
+            calendar_data = generate_calendar_days(project, existing_calendar)
+            # Todo: Enhance generate_calendar_days to robustly merge/update area info
+            saved = save_project_calendar(project_id, calendar_data)
+
+            record_operation(project_id, 'regenerate', existing_calendar.get('days', []), saved)
+            publish_calendar_change(project_id, saved, 'regenerated',
+                                    changed_dates(existing_calendar.get('days', []), saved.get('days', [])),
+                                    include_days=False)
+        return saved
     except Exception as e:
         logger.error(f"Error generating calendar for project {project.get('id', 'N/A')}: {str(e)}")
         return {"days": [], "error": f"Failed to generate calendar: {str(e)}"}
@@ -197,13 +347,16 @@ def save_day_changes(project_id, date, form_data):
     """
     logger.warning("save_day_changes helper function called - check if necessary.")
     try:
-        calendar_data = get_project_calendar(project_id)
-        day_index = next((i for i, d in enumerate(calendar_data.get('days', [])) if d.get('date') == date), None)
-        if day_index is None:
-            logger.error(f"Day not found for saving via helper: {date}")
-            return False
-        # Assume day object was already updated before calling this
-        save_project_calendar(project_id, calendar_data)
+        from .events import publish_calendar_change # Local import avoids a circular import
+        with calendar_lock(project_id):
+            calendar_data = get_project_calendar(project_id)
+            day_index = next((i for i, d in enumerate(calendar_data.get('days', [])) if d.get('date') == date), None)
+            if day_index is None:
+                logger.error(f"Day not found for saving via helper: {date}")
+                return False
+            # Assume day object was already updated before calling this
+            save_project_calendar(project_id, calendar_data)
+            publish_calendar_change(project_id, calendar_data, 'day', [date])
         return True
     except Exception as e:
         logger.error(f"Error in save_day_changes helper for {date}: {str(e)}")
@@ -246,17 +399,20 @@ def recalculate_shoot_days(days):
 
 def update_all_projects_department_counts():
     """Update department counts in all project calendars"""
+    from .events import publish_calendar_change # Local import avoids a circular import
     try:
         projects = get_projects()
         for project in projects:
             project_id = project.get('id')
             if project_id:
-                calendar_data = get_project_calendar(project_id)
-                if calendar_data and 'days' in calendar_data:
-                    # calculate_department_counts is imported from .calendar_generator
-                    calendar_data = calculate_department_counts(calendar_data)
-                    save_project_calendar(project_id, calendar_data)
-                    logger.info(f"Updated department counts for project {project_id}")
+                with calendar_lock(project_id):
+                    calendar_data = get_project_calendar(project_id)
+                    if calendar_data and 'days' in calendar_data:
+                        # calculate_department_counts is imported from .calendar_generator
+                        calendar_data = calculate_department_counts(calendar_data)
+                        save_project_calendar(project_id, calendar_data)
+                        publish_calendar_change(project_id, calendar_data, 'counts', [])
+                        logger.info(f"Updated department counts for project {project_id}")
     except Exception as e:
         logger.error(f"Error updating all department counts: {str(e)}")
 
@@ -279,7 +435,7 @@ def save_global_data(filename, data):
     filepath = os.path.join(DATA_DIR, filename)
     try:
         with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            dump_json(data, f, ensure_ascii=False)
         logger.info(f"Global data file {filename} saved successfully.")
     except Exception as e:
         logger.error(f"Error saving global data file {filename}: {e}")
@@ -0,0 +1,279 @@
+# utils/ics.py
+"""
+iCalendar (.ics) feeds of project schedules for phone/desktop calendars.
+
+Feeds are streamed: VEVENTs are yielded one day at a time rather than
+joined into one string. Each response carries an ETag derived from the
+calendar revision and the filter combination, and the check needs only
+a stat of the project files, so the hourly polls of subscribed clients
+are answered with 304s without reading the calendar. Rendered feeds
+are also kept in a small LRU per (project, filters, ETag) and replayed
+as a stream.
+
+Calendar apps cannot log in, so feeds accept a per-project token
+(an HMAC of the project ID and its rotatable feedKey).
+"""
+import os
+import hmac
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+
+from .helpers import PROJECTS_DIR, get_project
+from .snapshots import calendar_view
+from .references import reference_key
+
+logger = logging.getLogger(__name__)
+
+ICS_CACHE_SIZE = int(os.environ.get('ICS_CACHE_SIZE', 64))  # Rendered feeds kept per worker
+ICS_MAX_AGE = int(os.environ.get('ICS_MAX_AGE', 300))       # Seconds clients may reuse a feed before revalidating
+ICS_REFRESH = 'PT1H'   # Suggested polling interval for subscribed calendar apps
+PRODID = '-//At a Glance//Schedule Feed//EN'
+
+_lock = threading.Lock()
+_states = {}             # project_id -> (file signature, state)
+_feeds = OrderedDict()   # (project_id, filters, etag) -> [bytes chunks]
+
+
+# --- Access tokens ---
+
+def feed_token(secret, project):
+    """Feed token for a project; rotating project['feedKey'] revokes old tokens"""
+    message = f"ics:{project.get('id')}:{project.get('feedKey', '')}".encode('utf-8')
+    return hmac.new(str(secret).encode('utf-8'), message, hashlib.sha256).hexdigest()[:32]
+
+
+def check_feed_token(secret, project, token):
+    return bool(token) and hmac.compare_digest(feed_token(secret, project), str(token))
+
+
+# --- Filters ---
+
+def parse_filters(args):
+    """Canonical, hashable filter tuple from request args (dept, location, area, shoot)"""
+    departments = sorted({code.strip().upper() for value in args.getlist('dept')
+                          for code in value.split(',') if code.strip()})
+    return (
+        tuple(departments),
+        reference_key('location', args.get('location', '')),
+        reference_key('area', args.get('area', '')),
+        args.get('shoot', '').lower() in ('1', 'true', 'yes'),
+    )
+
+
+def _matches(day, filters):
+    departments, location, area, shoot_only = filters
+    if shoot_only and not day.get('isShootDay'):
+        return False
+    if departments and not set(departments) & {(c or '').strip().upper() for c in day.get('departments') or []}:
+        return False
+    if location and location not in (reference_key('location', day.get('location')),
+                                     reference_key('location', day.get('secondUnitLocation'))):
+        return False
+    if area and reference_key('area', day.get('locationArea')) != area:
+        return False
+    return True
+
+
+def _has_event(day):
+    """Days worth an event: shoot days, days with scheduled content, holidays and hiatus"""
+    return bool(day.get('isShootDay') or day.get('isHoliday') or day.get('isHiatus')
+                or day.get('mainUnit') or day.get('sequence') or day.get('location') or day.get('notes'))
+
+
+# --- Revision / ETag ---
+
+def _signature(project_id):
+    signature = []
+    for name in ('main.json', 'calendar.json'):
+        try:
+            st = os.stat(os.path.join(PROJECTS_DIR, project_id, name))
+            signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def feed_state(project_id):
+    """
+    {'project', 'revision', 'stamp'} for a project, or None if it does not exist.
+    Re-read only when main.json/calendar.json change on disk (archived projects never do).
+    The calendar itself is not kept: iter_feed loads it when a feed is rendered.
+    """
+    signature = _signature(project_id)
+    with _lock:
+        cached = _states.get(project_id)
+        if cached and cached[0] == signature:
+            return cached[1]
+    project = get_project(project_id)
+    if not project:
+        return None
+    calendar_data = calendar_view(project_id)
+    state = {
+        'project': project,
+        'revision': int(calendar_data.get('revision') or 0),
+        'stamp': _utc_stamp(calendar_data.get('lastUpdated') or project.get('updated')),
+    }
+    with _lock:
+        _states[project_id] = (signature, state)
+    return state
+
+
+def feed_etag(project_id, state, filters):
+    """ETag for a feed: the calendar revision, project details and the filter combination"""
+    project = state['project']
+    details = '|'.join(str(project.get(field) or '') for field in ('title', 'version', 'feedKey'))
+    digest = hashlib.sha1(f"{details}|{filters!r}".encode('utf-8')).hexdigest()[:12]
+    return f"ics-{project_id[:8]}-{state['revision']}-{digest}"
+
+
+# --- Rendering ---
+
+def _utc_stamp(value):
+    """iCalendar UTC timestamp from an ISO string; a fixed stamp keeps output (and ETags) stable"""
+    try:
+        return datetime.fromisoformat(str(value).rstrip('Z')).strftime('%Y%m%dT%H%M%SZ')
+    except (TypeError, ValueError):
+        return '20000101T000000Z'
+
+
+def escape_text(value):
+    """Escape a TEXT value (RFC 5545 3.3.11)"""
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Fold a content line at 75 octets, without splitting UTF-8 sequences"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > (75 if not parts else 74):
+            parts.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _summary(day):
+    if day.get('isShootDay'):
+        label = f"Day {day['shootDay']}" if day.get('shootDay') else 'Shoot'
+        return f"{label}: {day['mainUnit']}" if day.get('mainUnit') else label
+    if day.get('isHoliday'):
+        return 'Holiday'
+    if day.get('isHiatus'):
+        return 'Hiatus'
+    return day.get('mainUnit') or day.get('sequence') or (day.get('dayType') or 'Schedule').capitalize()
+
+
+def _description(day):
+    lines = []
+    if day.get('sequence'):
+        lines.append(f"Sequence: {day['sequence']}")
+    if day.get('departments'):
+        lines.append(f"Departments: {', '.join(day['departments'])}")
+    if day.get('extras'):
+        lines.append(f"Extras: {day['extras']}")
+    if day.get('featuredExtras'):
+        lines.append(f"Featured extras: {day['featuredExtras']}")
+    if day.get('secondUnit'):
+        second = day['secondUnit']
+        if day.get('secondUnitLocation'):
+            second += f" ({day['secondUnitLocation']})"
+        lines.append(f"Second unit: {second}")
+    light = day.get('daylight') or {}
+    if light.get('sunrise') and light.get('sunset'):
+        lines.append(f"Sunrise {light['sunrise']}, sunset {light['sunset']}")
+    if day.get('notes'):
+        lines.append(day['notes'])
+    return '\n'.join(lines)
+
+
+def vevent(project_id, day, stamp):
+    start = date.fromisoformat(day['date'])
+    location = ', '.join(v for v in (day.get('location'), day.get('locationArea')) if v)
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{project_id}-{day['date']}@at-a-glance",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+        f"DTEND;VALUE=DATE:{(start + timedelta(days=1)).strftime('%Y%m%d')}",
+        f"SUMMARY:{escape_text(_summary(day))}",
+    ]
+    if location:
+        lines.append(f"LOCATION:{escape_text(location)}")
+    description = _description(day)
+    if description:
+        lines.append(f"DESCRIPTION:{escape_text(description)}")
+    if day.get('dayType'):
+        lines.append(f"CATEGORIES:{escape_text(day['dayType'].upper())}")
+    lines.extend(['TRANSP:TRANSPARENT', 'END:VEVENT'])
+    return ''.join(fold(line) for line in lines)
+
+
+def _calendar_name(project, filters):
+    departments, location, area, shoot_only = filters
+    name = project.get('title') or 'Schedule'
+    if project.get('version'):
+        name += f" ({project['version']})"
+    details = [', '.join(departments)] if departments else []
+    details += [v for v in (location, area) if v]
+    if shoot_only:
+        details.append('shoot days')
+    return f"{name} - {' / '.join(details)}" if details else name
+
+
+def iter_feed(project_id, state, filters):
+    """Yield the feed as encoded chunks: the header, then one VEVENT per matching day (cache misses only)"""
+    header = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f"PRODID:{PRODID}", 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{escape_text(_calendar_name(state['project'], filters))}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{ICS_REFRESH}", f"X-PUBLISHED-TTL:{ICS_REFRESH}",
+    ]
+    yield ''.join(fold(line) for line in header).encode('utf-8')
+    for day in calendar_view(project_id).get('days', []):
+        if not day.get('date') or not _has_event(day) or not _matches(day, filters):
+            continue
+        try:
+            yield vevent(project_id, day, state['stamp']).encode('utf-8')
+        except ValueError:
+            continue  # Malformed date
+    yield b'END:VCALENDAR\r\n'
+
+
+def cached_feed(project_id, state, filters, etag):
+    """
+    Stream a feed, replaying it from the LRU when this (project, filters, ETag)
+    was rendered before; otherwise render it, storing the chunks as they are sent.
+    """
+    key = (project_id, filters, etag)
+    with _lock:
+        chunks = _feeds.get(key)
+        if chunks is not None:
+            _feeds.move_to_end(key)
+    if chunks is not None:
+        yield from chunks
+        return
+
+    rendered = []
+    for chunk in iter_feed(project_id, state, filters):
+        rendered.append(chunk)
+        yield chunk
+    with _lock:
+        _feeds[key] = rendered
+        while len(_feeds) > ICS_CACHE_SIZE:
+            _feeds.popitem(last=False)
+
+
+def forget_feeds(project_id):
+    with _lock:
+        _states.pop(project_id, None)
+        for key in [k for k in _feeds if k[0] == project_id]:
+            del _feeds[key]
@@ -0,0 +1,211 @@
+# utils/logging_setup.py
+import os
+import copy
+import json
+import time
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+# Defaults can be overridden through environment variables (see configure_logging)
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # 10 MB per log file
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_RATE_LIMIT = 20               # Identical messages allowed per module...
+DEFAULT_RATE_WINDOW = 60.0            # ...within this many seconds
+
+_listener = None
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Format records as one JSON object per line (structured logging)"""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TracebackQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps the traceback out of the message.
+
+    QueueHandler.prepare() formats the traceback into `msg` and clears
+    exc_info/exc_text; here the message is merged with its args and the
+    traceback is kept as exc_text, so the listener's formatter can still
+    put it on its own line (text) or in the "exc" key (JSON).
+    """
+
+    def prepare(self, record):
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+class SharedRotatingFileHandler(WatchedFileHandler):
+    """
+    Size-based rotation that is safe with several processes on one file.
+
+    Every gunicorn worker appends to the same app.log. The worker whose
+    record takes the file past max_bytes rotates it under an flock on
+    app.log.lock, after checking that no other worker rotated it first;
+    the others notice the new inode and reopen before their next record
+    (WatchedFileHandler), so at most a record per worker lands in the
+    renamed file and none are lost.
+    """
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, encoding=None):
+        super().__init__(filename, encoding=encoding, delay=True)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock_file = self.baseFilename + '.lock'
+
+    def emit(self, record):
+        super().emit(record)  # Reopens first if another worker rotated the file
+        if self.max_bytes <= 0 or self.backup_count <= 0 or self.stream is None:
+            return
+        try:
+            if os.fstat(self.stream.fileno()).st_size >= self.max_bytes:
+                self.rotate()
+        except OSError:
+            self.handleError(record)
+
+    def rotate(self):
+        """Rename app.log to app.log.1 (shifting older files) unless another worker just did"""
+        fd = os.open(self.lock_file, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                st = os.stat(self.baseFilename)
+            except FileNotFoundError:
+                st = None
+            if st is not None and (st.st_dev, st.st_ino) == (self.dev, self.ino) and st.st_size >= self.max_bytes:
+                for i in range(self.backup_count - 1, 0, -1):
+                    source = f"{self.baseFilename}.{i}"
+                    if os.path.exists(source):
+                        os.replace(source, f"{self.baseFilename}.{i + 1}")
+                os.replace(self.baseFilename, f"{self.baseFilename}.1")
+            self.reopenIfNeeded()
+        finally:
+            os.close(fd) # Releases the flock
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop repeated messages per module.
+
+    Each (logger name, level, message template) may pass `limit` times per
+    `window` seconds. When a window closes with suppressed repeats, the next
+    passing record is annotated with how many were dropped.
+    """
+
+    def __init__(self, limit=DEFAULT_RATE_LIMIT, window=DEFAULT_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._buckets = {}  # key -> [window_start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.ERROR:
+            return True  # Never rate limit errors
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self._buckets[key] = [now, 1, 0]
+                if len(self._buckets) > 10000:  # Keep memory bounded
+                    self._buckets = {key: self._buckets[key]}
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} repeats suppressed]"
+                return True
+            if bucket[1] < self.limit:
+                bucket[1] += 1
+                return True
+            bucket[2] += 1
+            return False
+
+
+def configure_logging(log_dir, level=logging.INFO):
+    """
+    Route all logging through a QueueHandler so request threads never block
+    on disk. A background QueueListener writes to app.log and to stderr.
+
+    Every gunicorn worker appends to the same app.log; it is rotated by size
+    with SharedRotatingFileHandler, which coordinates the workers.
+
+    Environment variables:
+        LOG_FORMAT        'text' (default) or 'json' for structured JSON lines
+        LOG_MAX_BYTES     Rotate app.log at this size (default 10 MB)
+        LOG_BACKUP_COUNT  Rotated files to keep (default 5)
+        LOG_RATE_LIMIT    Repeats per message per window, 0 disables (default 20)
+        LOG_RATE_WINDOW   Rate limit window in seconds (default 60)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener  # Already configured (e.g. module imported twice)
+
+    os.makedirs(log_dir, exist_ok=True)
+
+    if os.environ.get('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonLineFormatter()
+    else:
+        formatter = logging.Formatter(DEFAULT_FORMAT)
+
+    file_handler = SharedRotatingFileHandler(
+        os.path.join(log_dir, 'app.log'),
+        max_bytes=int(os.environ.get('LOG_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        backup_count=int(os.environ.get('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT)),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(
+        limit=int(os.environ.get('LOG_RATE_LIMIT', DEFAULT_RATE_LIMIT)),
+        window=float(os.environ.get('LOG_RATE_WINDOW', DEFAULT_RATE_WINDOW))
+    ))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the background listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,90 @@
+# utils/offline.py
+"""
+Service worker for the offline viewer.
+
+/sw.js is served from the site root so it controls every page. It is
+static/js/service-worker.js prefixed with an OFFLINE_CONFIG object: the
+fingerprinted URLs of the app shell (the /offline/viewer page and the
+assets it loads) and a version derived from them, so a deploy that
+changes any shell asset installs a new worker and drops the old cache.
+
+The worker does not cache viewer pages. It keeps the latest compact row
+model per project (/api/projects/<id>/rows), revalidated with its
+revision-keyed ETag, and serves the shell when a viewer page cannot be
+loaded; the shell renders the calendar from that cached copy.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from flask import Response, request, url_for
+
+from . import assets
+
+logger = logging.getLogger(__name__)
+
+OFFLINE_NAV_TIMEOUT = int(os.environ.get('OFFLINE_NAV_TIMEOUT', 4000))  # ms to wait for a viewer page before showing the cached copy
+
+SW_SOURCE = 'js/service-worker.js'
+# Static files the offline shell needs, besides the scripts in asset bundles
+SHELL_ASSETS = (
+    'css/style.css', 'css/components/modals.css', 'css/calendar.css',
+    'js/calendar-virtual.js', 'js/calendar.js', 'js/offline-viewer.js',
+    'images/site.webmanifest', 'images/favicon.svg', 'images/favicon-96x96.png', 'images/favicon.ico',
+    'images/apple-touch-icon.png', 'images/web-app-manifest-192x192.png', 'images/web-app-manifest-512x512.png',
+)
+
+_lock = threading.Lock()
+_cached = None  # (shell URLs, worker source) -> (body, etag) of the last built /sw.js
+
+
+def _read_source():
+    manifest = assets.manifest
+    hashed = manifest.hashed_name(SW_SOURCE)
+    entry = manifest.entries.get(hashed)
+    if entry is None:
+        raise FileNotFoundError(SW_SOURCE)
+    return entry[1].decode('utf-8')
+
+
+def shell_urls():
+    """URLs precached on install: the shell page and its fingerprinted assets"""
+    urls = [url_for('main.offline_viewer')] + assets.asset_urls('bundles/base.js')
+    urls += [url_for('static', filename=name) for name in SHELL_ASSETS]
+    return urls
+
+
+def service_worker_script():
+    """(body, etag) of /sw.js for the current shell assets (needs a request context)"""
+    global _cached
+    key = (tuple(shell_urls()), _read_source())
+    with _lock:
+        if _cached and _cached[0] == key:
+            return _cached[1]
+        urls, source = key
+        version = hashlib.sha1('\n'.join(urls + (source,)).encode('utf-8')).hexdigest()[:12]
+        config = {
+            'version': version,
+            'shell': urls[0],
+            'precache': list(urls),
+            'navTimeout': OFFLINE_NAV_TIMEOUT,
+        }
+        body = f"const OFFLINE_CONFIG = {json.dumps(config)};\n\n{source}"
+        _cached = (key, (body.encode('utf-8'), f"sw-{version}"))
+        logger.info(f"Service worker built: version {version}, {len(urls)} shell URLs")
+        return _cached[1]
+
+
+def service_worker_response():
+    try:
+        body, etag = service_worker_script()
+    except (OSError, AttributeError) as e:
+        logger.error(f"Error building service worker: {str(e)}")
+        return Response('// Service worker unavailable\n', status=404, mimetype='application/javascript')
+    response = Response(body, mimetype='application/javascript')
+    response.set_etag(etag)
+    # Browsers check for a new worker on navigation; always revalidate so deploys are picked up
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
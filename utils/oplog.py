@@ -0,0 +1,249 @@
+# utils/oplog.py
+"""
+Undo/redo log for calendar edits.
+
+Each calendar mutation is recorded as an operation holding only its delta:
+the fields it changed on each date (old and new values) plus any days it
+added or removed. Undo applies the delta backwards and redo forwards, so
+neither touches days the operation did not change. The log is bounded per
+project and lives in SQLite under RUN_DIR so every gunicorn worker shares
+one history.
+
+Undo and redo are refused (OperationConflict) when the calendar no longer
+holds the values the operation left behind - e.g. another user edited the
+same field since - or when the caller's expected revision is stale.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from .helpers import RUN_DIR, get_project_calendar, save_project_calendar, calendar_lock
+from .calendar_generator import calculate_department_counts, calculate_location_counts
+
+logger = logging.getLogger(__name__)
+
+OPLOG_DB = os.path.join(RUN_DIR, 'oplog.sqlite3')
+OPLOG_LIMIT = int(os.environ.get('OPLOG_LIMIT', 50))  # Operations kept per project
+# Operation kinds: day edits, drag/drop swaps, regenerations, reference renames, branch merges, spreadsheet imports
+OPERATION_KINDS = ('patch', 'swap', 'regenerate', 'rename', 'merge', 'import')
+# Day fields recomputed on every save (utils/daylight.py); never part of a delta
+DERIVED_FIELDS = frozenset(('daylight',))
+
+_local = threading.local()
+
+
+class OperationConflict(Exception):
+    """Raised when an undo/redo would overwrite changes made after the operation"""
+
+    def __init__(self, message, conflicts=None):
+        super().__init__(message)
+        self.conflicts = conflicts or []
+
+
+def _connect():
+    """Per-thread SQLite connection to the shared operation log"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(RUN_DIR, exist_ok=True)
+        conn = sqlite3.connect(OPLOG_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS operations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                revision INTEGER NOT NULL,
+                delta TEXT NOT NULL,
+                undone INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_operations_project ON operations (project_id, id)")
+        _local.conn = conn
+    return conn
+
+
+def compute_delta(days_before, days_after, dates=None):
+    """
+    {'changed': {date: {field: [old, new]}}, 'added': {date: day}, 'removed': {date: day}}
+    between two day lists, optionally limited to `dates`.
+    """
+    before = {d.get('date'): d for d in days_before if d.get('date')}
+    after = {d.get('date'): d for d in days_after if d.get('date')}
+    if dates is not None:
+        wanted = set(dates)
+        before = {k: v for k, v in before.items() if k in wanted}
+        after = {k: v for k, v in after.items() if k in wanted}
+
+    changed, added, removed = {}, {}, {}
+    for date, day in after.items():
+        old = before.get(date)
+        if old is None:
+            added[date] = day
+        elif old != day:
+            fields = {key: [old.get(key), day.get(key)] for key in old.keys() | day.keys()
+                      if key not in DERIVED_FIELDS and old.get(key) != day.get(key)}
+            if fields:
+                changed[date] = fields
+    for date, day in before.items():
+        if date not in after:
+            removed[date] = day
+    return {'changed': changed, 'added': added, 'removed': removed}
+
+
+def _delta_dates(delta):
+    return sorted(set(delta['changed']) | set(delta['added']) | set(delta['removed']))
+
+
+def record_operation(project_id, kind, days_before, calendar_data, dates=None):
+    """
+    Log a saved mutation. `days_before` must hold copies taken before the
+    mutation; `dates` limits the comparison when only those days can have
+    changed. Recording a new operation discards the redo history.
+    Never raises - a failed record must not fail the save that triggered it.
+    """
+    try:
+        delta = compute_delta(days_before, calendar_data.get('days', []), dates)
+        if not _delta_dates(delta):
+            return None
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM operations WHERE project_id = ? AND undone = 1", (project_id,))
+            cursor = conn.execute(
+                "INSERT INTO operations (project_id, kind, revision, delta, created) VALUES (?, ?, ?, ?, ?)",
+                (project_id, kind, int(calendar_data.get('revision') or 0),
+                 json.dumps(delta, separators=(',', ':'), ensure_ascii=False), time.time())
+            )
+            conn.execute("""
+                DELETE FROM operations WHERE project_id = ? AND id NOT IN (
+                    SELECT id FROM operations WHERE project_id = ? ORDER BY id DESC LIMIT ?)""",
+                         (project_id, project_id, OPLOG_LIMIT))
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        logger.error(f"Error recording {kind} operation for project {project_id}: {str(e)}")
+        return None
+
+
+def history(project_id):
+    """Logged operations for a project, newest first"""
+    rows = _connect().execute(
+        "SELECT id, kind, revision, delta, undone, created FROM operations WHERE project_id = ? ORDER BY id DESC",
+        (project_id,)).fetchall()
+    return [{
+        'id': op_id, 'kind': kind, 'revision': revision, 'undone': bool(undone), 'created': created,
+        'dates': _delta_dates(json.loads(delta)),
+    } for op_id, kind, revision, delta, undone, created in rows]
+
+
+def forget_project(project_id):
+    try:
+        _connect().execute("DELETE FROM operations WHERE project_id = ?", (project_id,))
+    except Exception as e:
+        logger.error(f"Error clearing operation log for project {project_id}: {str(e)}")
+
+
+def _apply(days, delta, forward):
+    """
+    Apply a delta to day records in place (forward = redo, otherwise undo).
+    Returns (days, conflicts); nothing is changed when there are conflicts.
+    """
+    expect, target = (0, 1) if forward else (1, 0)
+    by_date = {d.get('date'): d for d in days}
+    # Undo drops the days the operation added and restores those it removed; redo the reverse
+    to_remove, to_insert = (delta['removed'], delta['added']) if forward else (delta['added'], delta['removed'])
+
+    conflicts = []
+    for date, fields in delta['changed'].items():
+        day = by_date.get(date)
+        if day is None:
+            conflicts.append({'date': date, 'reason': 'Date no longer exists'})
+            continue
+        for field, values in fields.items():
+            if day.get(field) != values[expect]:
+                conflicts.append({'date': date, 'field': field, 'expected': values[expect], 'current': day.get(field)})
+    for date, day in to_remove.items():
+        if by_date.get(date) != day:
+            conflicts.append({'date': date, 'reason': 'Day was changed since'})
+    for date in to_insert:
+        if date in by_date:
+            conflicts.append({'date': date, 'reason': 'Date was added since'})
+    if conflicts:
+        return days, conflicts
+
+    for date, fields in delta['changed'].items():
+        day = by_date[date]
+        for field, values in fields.items():
+            day[field] = values[target]
+    if to_remove:
+        days = [d for d in days if d.get('date') not in to_remove]
+    if to_insert:
+        days = sorted(days + list(to_insert.values()), key=lambda d: d.get('date', ''))
+    return days, []
+
+
+def _step(project_id, forward, expected_revision=None):
+    from .events import publish_calendar_change # Local import avoids a circular import
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")  # Serialises undo/redo across workers
+    try:
+        if forward:
+            row = conn.execute("SELECT id, kind, delta FROM operations WHERE project_id = ? AND undone = 1 "
+                               "ORDER BY id ASC LIMIT 1", (project_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT id, kind, delta FROM operations WHERE project_id = ? AND undone = 0 "
+                               "ORDER BY id DESC LIMIT 1", (project_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return None
+        op_id, kind, delta = row
+        delta = json.loads(delta)
+
+        calendar_data = get_project_calendar(project_id)
+        if expected_revision is not None and int(expected_revision) != int(calendar_data.get('revision') or 0):
+            raise OperationConflict("The calendar has changed since it was loaded; reload and try again")
+        days, conflicts = _apply(calendar_data.get('days', []), delta, forward)
+        if conflicts:
+            raise OperationConflict(f"Cannot {'redo' if forward else 'undo'} {kind}: later edits changed the same days", conflicts)
+
+        calendar_data['days'] = days
+        calendar_data = calculate_department_counts(calendar_data)
+        calendar_data = calculate_location_counts(calendar_data)
+        save_project_calendar(project_id, calendar_data)
+        conn.execute("UPDATE operations SET undone = ? WHERE id = ?", (0 if forward else 1, op_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    dates = _delta_dates(delta)
+    structural = bool(delta['added'] or delta['removed'])
+    # Added/removed days need a page rebuild; field changes patch rows in place
+    event_type = 'regenerated' if structural else 'day'
+    publish_calendar_change(project_id, calendar_data, event_type, dates, include_days=not structural)
+    wanted = set(dates)
+    return {
+        'operation': {'id': op_id, 'kind': kind, 'dates': dates},
+        'type': event_type,
+        'revision': calendar_data.get('revision'),
+        'days': [] if structural else [d for d in calendar_data['days'] if d.get('date') in wanted],
+        'counts': {group: calendar_data.get(group, {}) for group in ('departmentCounts', 'locationCounts', 'areaCounts')},
+    }
+
+
+def undo(project_id, expected_revision=None):
+    """Revert the latest operation; None if there is nothing to undo"""
+    with calendar_lock(project_id): # Taken before the oplog transaction, in the same order as edits
+        return _step(project_id, False, expected_revision)
+
+
+def redo(project_id, expected_revision=None):
+    """Re-apply the most recently undone operation; None if there is nothing to redo"""
+    with calendar_lock(project_id):
+        return _step(project_id, True, expected_revision)
@@ -0,0 +1,413 @@
+# utils/pdf.py
+"""
+Server-side PDF one-liners of a project schedule.
+
+One row per day: date, shoot day, main unit, location (tinted with its
+area colour) and department tags in their colours; the 'wide' layout adds
+sequence and notes on a landscape page. The PDF is written directly with
+the standard Helvetica fonts, so no PDF library is needed.
+
+Rendering runs in a worker process (PDF_WORKERS) so long schedules don't
+hold a request thread's GIL. The pool is started through a forkserver:
+forking a multi-threaded gunicorn worker would copy locks held by other
+threads (logging queue, caches, SQLite) into the child. Finished
+documents are kept in an LRU keyed by (project, source files, range,
+layout), checked before the calendar is loaded. Concurrent requests for the
+same key wait on the one render in flight, so ten people printing the
+same one-liner cost one render.
+"""
+import os
+import zlib
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date as date_cls
+
+from .helpers import DATA_DIR, PROJECTS_DIR, load_global_data
+from .singleflight import group
+from .snapshots import calendar_view
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 1))          # Render processes; 0 renders in the request thread
+PDF_CACHE_SIZE = int(os.environ.get('PDF_CACHE_SIZE', 32))   # Rendered PDFs kept per worker
+PDF_TIMEOUT = int(os.environ.get('PDF_TIMEOUT', 60))         # Seconds to wait for a render
+
+# Page size in points, and the columns in order: (field, label, width; None takes the remaining width)
+LAYOUTS = {
+    'oneliner': {
+        'page': (595.0, 842.0),   # A4 portrait
+        'columns': [('date', 'Date', 58), ('shootDay', 'Day', 30), ('mainUnit', 'Main Unit', None),
+                    ('location', 'Location', 120), ('departments', 'Departments', 120)],
+    },
+    'wide': {
+        'page': (842.0, 595.0),   # A4 landscape
+        'columns': [('date', 'Date', 58), ('shootDay', 'Day', 30), ('mainUnit', 'Main Unit', 170),
+                    ('sequence', 'Sequence', 110), ('location', 'Location', 120),
+                    ('departments', 'Departments', 120), ('notes', 'Notes', None)],
+    },
+}
+DEFAULT_LAYOUT = 'oneliner'
+
+MARGIN = 36
+ROW_HEIGHT = 15
+FONT_SIZE = 8
+HEADER_HEIGHT = 58
+FOOTER_HEIGHT = 20
+TAG_GAP = 3
+
+_lock = threading.Lock()
+_cache = OrderedDict()   # key -> PDF bytes
+_flight = group('pdf')   # Concurrent requests for the same key wait on one render
+_executor = None
+_pool_lock = threading.Lock()   # Creating or replacing _executor (requests for different keys race on it)
+
+
+# --- Text metrics (Helvetica AFM widths, 1/1000 em, for ASCII 32-126) ---
+
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+ELLIPSIS = '\u2026'
+
+
+def text_width(text, size, bold=False):
+    widths = _HELVETICA_BOLD if bold else _HELVETICA
+    total = 0
+    for char in text:
+        code = ord(char)
+        total += widths[code - 32] if 32 <= code <= 126 else (1000 if char == ELLIPSIS else 556)
+    return total * size / 1000.0
+
+
+def fit_text(text, width, size, bold=False):
+    """Single-line text truncated with an ellipsis to fit `width` points"""
+    text = ' '.join(str(text or '').split())
+    if text_width(text, size, bold) <= width:
+        return text
+    while text and text_width(text + ELLIPSIS, size, bold) > width:
+        text = text[:-1]
+    return text.rstrip() + ELLIPSIS if text else ''
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'') + b')'
+
+
+def parse_color(value):
+    """'#RRGGBB' / '#RGB' -> (r, g, b) floats, or None"""
+    value = str(value or '').strip().lstrip('#')
+    if len(value) == 3:
+        value = ''.join(c * 2 for c in value)
+    try:
+        return tuple(int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4)) if len(value) == 6 else None
+    except ValueError:
+        return None
+
+
+def _text_color(background):
+    r, g, b = background
+    return (0, 0, 0) if 0.299 * r + 0.587 * g + 0.114 * b > 0.55 else (1, 1, 1)
+
+
+# --- Page drawing ---
+
+class _Canvas:
+    """Content stream operators for one page"""
+
+    def __init__(self):
+        self.ops = []
+
+    def rect(self, x, y, w, h, color):
+        self.ops.append(b'%.3f %.3f %.3f rg %.2f %.2f %.2f %.2f re f' % (*color, x, y, w, h))
+
+    def line(self, x1, y1, x2, y2, gray=0.8, width=0.5):
+        self.ops.append(b'%.2f G %.2f w %.2f %.2f m %.2f %.2f l S' % (gray, width, x1, y1, x2, y2))
+
+    def text(self, x, y, text, size=FONT_SIZE, bold=False, color=(0, 0, 0)):
+        if not text:
+            return
+        self.ops.append(b'BT /%s %d Tf %.3f %.3f %.3f rg %.2f %.2f Td %s Tj ET'
+                        % (b'F2' if bold else b'F1', size, *color, x, y, _pdf_string(text)))
+
+    def stream(self):
+        return zlib.compress(b'\n'.join(self.ops))
+
+
+def _column_widths(layout, page_width):
+    fixed = sum(width for _, _, width in layout['columns'] if width)
+    flexible = max(page_width - 2 * MARGIN - fixed, 40)
+    return [(field, label, width or flexible) for field, label, width in layout['columns']]
+
+
+def _day_label(day):
+    if day.get('isShootDay') and day.get('shootDay'):
+        return str(day['shootDay'])
+    for flag, label in (('isHoliday', 'HOL'), ('isHiatus', 'HIA'), ('isPrep', 'PREP'), ('isWeekend', 'W/E')):
+        if day.get(flag):
+            return label
+    return ''
+
+
+def _date_label(value):
+    try:
+        return date_cls.fromisoformat(value).strftime('%a %d %b')
+    except (TypeError, ValueError):
+        return str(value or '')
+
+
+def _draw_tags(canvas, x, y, width, codes, colors):
+    """Department codes as coloured chips, '+n' when they don't all fit"""
+    size = FONT_SIZE - 1
+    for index, code in enumerate(codes):
+        chip = text_width(code, size, bold=True) + 6
+        remaining = len(codes) - index - 1
+        reserve = text_width(f"+{remaining}", size) + TAG_GAP if remaining else 0
+        if chip + reserve > width:
+            canvas.text(x, y + 3, f"+{len(codes) - index}", size=size, color=(0.3, 0.3, 0.3))
+            return
+        background = colors.get(code.upper()) or (0.85, 0.85, 0.85)
+        canvas.rect(x, y + 1, chip, ROW_HEIGHT - 4, background)
+        canvas.text(x + 3, y + 4, code, size=size, bold=True, color=_text_color(background))
+        x += chip + TAG_GAP
+        width -= chip + TAG_GAP
+
+
+def _draw_page(payload, layout, rows, page_number, page_count):
+    page_width, page_height = layout['page']
+    columns = _column_widths(layout, page_width)
+    canvas = _Canvas()
+    top = page_height - MARGIN
+
+    canvas.text(MARGIN, top - 14, fit_text(payload['title'], page_width - 2 * MARGIN, 14, bold=True), size=14, bold=True)
+    canvas.text(MARGIN, top - 28, payload['subtitle'], size=9, color=(0.3, 0.3, 0.3))
+
+    y = top - HEADER_HEIGHT + ROW_HEIGHT
+    canvas.rect(MARGIN, y, page_width - 2 * MARGIN, ROW_HEIGHT, (0.2, 0.2, 0.2))
+    x = MARGIN
+    for _, label, width in columns:
+        canvas.text(x + 3, y + 4, label, bold=True, color=(1, 1, 1))
+        x += width
+
+    for day in rows:
+        y -= ROW_HEIGHT
+        if day.get('isHoliday') or day.get('isHiatus') or (day.get('isWeekend') and not day.get('isShootDay')):
+            canvas.rect(MARGIN, y, page_width - 2 * MARGIN, ROW_HEIGHT, (0.93, 0.93, 0.93))
+        x = MARGIN
+        for field, _, width in columns:
+            if field == 'departments':
+                _draw_tags(canvas, x + 2, y, width - 4, [str(c) for c in day.get('departments') or [] if c],
+                           payload['departmentColors'])
+            else:
+                if field == 'date':
+                    value = _date_label(day.get('date'))
+                elif field == 'shootDay':
+                    value = _day_label(day)
+                elif field == 'location':
+                    area = payload['areaColors'].get(day.get('locationAreaId')) or \
+                        payload['areaColors'].get(str(day.get('locationArea') or '').lower())
+                    if area:
+                        canvas.rect(x, y, width, ROW_HEIGHT, area)
+                    value = day.get('location') or day.get('locationArea')
+                else:
+                    value = day.get(field)
+                canvas.text(x + 3, y + 4, fit_text(value, width - 6, FONT_SIZE),
+                            bold=field == 'shootDay' and bool(day.get('isShootDay')))
+            x += width
+        canvas.line(MARGIN, y, page_width - MARGIN, y)
+
+    canvas.text(MARGIN, MARGIN - 12, payload['footer'], size=7, color=(0.4, 0.4, 0.4))
+    label = f"Page {page_number} of {page_count}"
+    canvas.text(page_width - MARGIN - text_width(label, 7), MARGIN - 12, label, size=7, color=(0.4, 0.4, 0.4))
+    return canvas.stream()
+
+
+def render_pdf(payload):
+    """
+    PDF bytes for a payload from build_payload(). Top-level and given only
+    plain data, so it can run in a worker process.
+    """
+    layout = LAYOUTS[payload['layout']]
+    page_width, page_height = layout['page']
+    per_page = max(int((page_height - 2 * MARGIN - HEADER_HEIGHT - FOOTER_HEIGHT) // ROW_HEIGHT), 1)
+    days = payload['days']
+    pages = [days[i:i + per_page] for i in range(0, len(days), per_page)] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3-4 fonts, then a page and its content stream per page
+    objects = [None, None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>']
+    kids = []
+    for number, rows in enumerate(pages, 1):
+        stream = _draw_page(payload, layout, rows, number, len(pages))
+        page_id, content_id = len(objects) + 1, len(objects) + 2
+        kids.append(b'%d 0 R' % page_id)
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+                       b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>'
+                       % (page_width, page_height, content_id))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream')
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objects[1] = b'<< /Type /Pages /Kids [' + b' '.join(kids) + b'] /Count %d >>' % len(kids)
+    info_id = len(objects) + 1
+    objects.append(b'<< /Title ' + _pdf_string(payload['title']) + b' /Producer (At a Glance) >>')
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, info_id, xref)
+    return bytes(out)
+
+
+# --- Payload / cache ---
+
+def parse_range(args):
+    """(start, end) ISO dates from ?start=&end= (either may be None); raises ValueError"""
+    bounds = []
+    for name in ('start', 'end'):
+        value = (args.get(name) or '').strip()
+        if value:
+            try:
+                value = date_cls.fromisoformat(value).isoformat()
+            except ValueError:
+                raise ValueError(f"Invalid {name} date: {value}")
+        bounds.append(value or None)
+    if bounds[0] and bounds[1] and bounds[0] > bounds[1]:
+        raise ValueError("Start date is after end date")
+    return tuple(bounds)
+
+
+def _signature(project_id):
+    signature = []
+    project_dir = os.path.join(PROJECTS_DIR, project_id)
+    for path in (os.path.join(project_dir, 'calendar.json'), os.path.join(project_dir, 'main.json'),
+                 os.path.join(DATA_DIR, 'departments.json'), os.path.join(DATA_DIR, 'areas.json')):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def cache_key(project_id, date_range, layout):
+    """Cache key: range and layout, plus the calendar/project/colour files it depends on (stat only)"""
+    return (project_id, date_range, layout, _signature(project_id))
+
+
+def build_payload(project, calendar_data, date_range, layout):
+    """The plain data render_pdf() needs: the days in range and the colour maps"""
+    start, end = date_range
+    days = [{k: day.get(k) for k in ('date', 'shootDay', 'mainUnit', 'sequence', 'location', 'locationArea',
+                                     'locationAreaId', 'departments', 'notes', 'isShootDay', 'isPrep',
+                                     'isWeekend', 'isHoliday', 'isHiatus')}
+            for day in calendar_data.get('days', [])
+            if day.get('date') and (not start or day['date'] >= start) and (not end or day['date'] <= end)]
+    area_colors = {}
+    for area in load_global_data('areas.json', []):
+        color = parse_color(area.get('color'))
+        if color:
+            area_colors[area.get('id')] = color
+            area_colors[str(area.get('name') or '').lower()] = color
+    department_colors = {str(d.get('code') or '').upper(): parse_color(d.get('color'))
+                         for d in load_global_data('departments.json', []) if parse_color(d.get('color'))}
+
+    title = project.get('title') or 'Untitled Project'
+    shoot_days = sum(1 for d in days if d.get('isShootDay'))
+    span = f"{_date_label(days[0]['date'])} - {_date_label(days[-1]['date'])}" if days else 'No days in range'
+    details = [v for v in (project.get('version'), span, f"{shoot_days} shoot day(s)") if v]
+    return {
+        'layout': layout,
+        'title': title,
+        'subtitle': ' | '.join(details),
+        'footer': f"{title} - revision {int(calendar_data.get('revision') or 0)}",
+        'days': days,
+        'areaColors': area_colors,
+        'departmentColors': department_colors,
+    }
+
+
+def _submit(payload):
+    """Start a render in the worker pool; None when PDF_WORKERS=0 (the caller renders)"""
+    if PDF_WORKERS <= 0:
+        return None
+    executor = _pool()
+    try:
+        return executor.submit(render_pdf, payload)
+    except (BrokenProcessPool, RuntimeError):
+        return _pool(broken=executor).submit(render_pdf, payload)
+
+
+def _pool(broken=None):
+    """
+    The worker pool, started on first use. Pass the pool a submit failed on to
+    replace it: only the first thread to report it does, the rest get its
+    replacement, so no extra pools (and forkserver children) are started.
+    """
+    global _executor
+    with _pool_lock:
+        if broken is not None and _executor is broken:
+            logger.warning("PDF worker pool was broken; starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            _executor = _new_pool()
+        return _executor
+
+
+def _new_pool():
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])  # Render processes start with this module already imported
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+
+
+def _render_and_cache(key, project, date_range, layout):
+    payload = build_payload(project, calendar_view(project['id']), date_range, layout)
+    future = _submit(payload)
+    body = render_pdf(payload) if future is None else future.result(timeout=PDF_TIMEOUT)
+    with _lock:
+        _cache[key] = body
+        while len(_cache) > PDF_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return body
+
+
+def get_pdf(project, date_range=(None, None), layout=DEFAULT_LAYOUT):
+    """
+    (PDF bytes, cache key digest) for a project, rendering at most once per
+    key across concurrent requests. The calendar is only loaded on a miss.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout: {layout} (use {', '.join(LAYOUTS)})")
+    key = cache_key(project['id'], date_range, layout)
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    with _lock:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+            return body, digest
+    body = _flight.do(key, lambda: _render_and_cache(key, project, date_range, layout),
+                      timeout=PDF_TIMEOUT)
+    return body, digest
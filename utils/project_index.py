@@ -0,0 +1,188 @@
+# utils/project_index.py
+import os
+import json
+import time
+import logging
+import threading
+
+from .helpers import PROJECTS_DIR, RUN_DIR, write_json_atomic, register_calendar_listener
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.path.join(RUN_DIR, 'indexes')
+INDEX_REFRESH_INTERVAL = float(os.environ.get('INDEX_REFRESH_INTERVAL', 2.0))  # Seconds between disk checks
+
+
+def calendar_signature(project_id):
+    """
+    (mtime_ns, size, inode) of a project's calendar.json, or None if it has
+    none. Saves replace the file (write_json_atomic), so the inode tells two
+    quick saves of the same size apart where mtime is coarse.
+    """
+    try:
+        st = os.stat(os.path.join(PROJECTS_DIR, project_id, 'calendar.json'))
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+    except OSError:
+        return None
+
+
+def read_calendar(project_id):
+    try:
+        with open(os.path.join(PROJECTS_DIR, project_id, 'calendar.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading calendar for project {project_id}: {str(e)}")
+        return None
+
+
+class ProjectIndex:
+    """
+    Base class for in-memory indexes built from every project's calendar.
+
+    Subclasses turn one calendar into a JSON-serialisable "segment"
+    (build_segment) and merge/unmerge segments into their lookup structures
+    (add_segment/remove_segment). The base class handles the rest:
+
+    * incremental updates from save_project_calendar via the listener registry
+    * persisting each segment to RUN_DIR/indexes/<name>/<project_id>.json so a
+      restart only re-reads calendars whose (mtime, size) signature changed
+    * picking up saves made by other worker processes by comparing signatures
+      at most every INDEX_REFRESH_INTERVAL seconds
+    * rebuilding every segment when a shared file the segments depend on
+      changes (source_signature, e.g. locations.json for the conflict index)
+    """
+
+    name = None     # Directory name for persisted segments
+    version = 1     # Bump to discard persisted segments after a format change
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._signatures = {}    # project_id -> signature the segment was built from
+        self._sources = None     # source_signature() the segments were built with
+        self._segments = {}      # project_id -> segment
+        self._loaded = False
+        self._last_refresh = 0.0
+        register_calendar_listener(self.on_calendar_saved)
+
+    # --- Subclass hooks ---
+
+    def build_segment(self, project_id, calendar_data):
+        raise NotImplementedError
+
+    def add_segment(self, project_id, segment):
+        raise NotImplementedError
+
+    def remove_segment(self, project_id, segment):
+        raise NotImplementedError
+
+    def include_project(self, project_id):
+        """Return False to leave a project out of the index"""
+        return True
+
+    def source_signature(self):
+        """JSON-serialisable signature of files other than calendar.json that segments are built from"""
+        return None
+
+    # --- Maintenance ---
+
+    def _segment_path(self, project_id):
+        return os.path.join(INDEX_DIR, self.name, f"{project_id}.json")
+
+    def _set(self, project_id, signature, segment, persist=True):
+        old = self._segments.pop(project_id, None)
+        if old is not None:
+            self.remove_segment(project_id, old)
+        self._signatures.pop(project_id, None)
+        if segment is None:
+            if persist:
+                try:
+                    os.remove(self._segment_path(project_id))
+                except OSError:
+                    pass
+            return
+        self._segments[project_id] = segment
+        self._signatures[project_id] = signature
+        self.add_segment(project_id, segment)
+        if persist:
+            try:
+                os.makedirs(os.path.join(INDEX_DIR, self.name), exist_ok=True)
+                write_json_atomic(self._segment_path(project_id),
+                                  {'version': self.version, 'signature': signature, 'sources': self._sources,
+                                   'segment': segment})
+            except Exception as e:
+                logger.error(f"Error persisting {self.name} index segment for {project_id}: {str(e)}")
+
+    def _load_persisted(self, project_id, signature):
+        try:
+            with open(self._segment_path(project_id), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('version') == self.version and stored.get('signature') == signature \
+                    and stored.get('sources') == self._sources:
+                return stored.get('segment')
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _project_ids(self):
+        try:
+            return [p for p in os.listdir(PROJECTS_DIR) if os.path.isdir(os.path.join(PROJECTS_DIR, p))]
+        except OSError:
+            return []
+
+    def _remove_orphaned_segments(self, project_ids):
+        """Delete persisted segments of projects that no longer exist"""
+        try:
+            names = os.listdir(os.path.join(INDEX_DIR, self.name))
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json') and name[:-5] not in project_ids:
+                try:
+                    os.remove(os.path.join(INDEX_DIR, self.name, name))
+                except OSError:
+                    pass
+
+    def refresh(self, force=False):
+        """Bring the index in line with calendars on disk (cheap when nothing changed)"""
+        now = time.monotonic()
+        if not force and self._loaded and now - self._last_refresh < INDEX_REFRESH_INTERVAL:
+            return
+        with self._lock:
+            self._last_refresh = now
+            sources = self.source_signature()
+            if sources != self._sources:
+                self._sources = sources
+                self._signatures.clear()  # Rebuild every segment below
+            seen = set()
+            for project_id in self._project_ids():
+                if not self.include_project(project_id):
+                    continue
+                signature = calendar_signature(project_id)
+                if signature is None:
+                    continue
+                seen.add(project_id)
+                if self._signatures.get(project_id) == signature:
+                    continue
+                segment = None if self._loaded else self._load_persisted(project_id, signature)
+                if segment is not None:
+                    self._set(project_id, signature, segment, persist=False)
+                    continue
+                calendar_data = read_calendar(project_id)
+                if calendar_data is not None:
+                    self._set(project_id, signature, self.build_segment(project_id, calendar_data))
+            for project_id in set(self._segments) - seen:
+                self._set(project_id, None, None)
+            if not self._loaded:
+                self._remove_orphaned_segments(seen)
+                logger.info(f"{self.name} index ready: {len(self._segments)} projects")
+            self._loaded = True
+
+    def on_calendar_saved(self, project_id, calendar_data):
+        """Listener for save_project_calendar; calendar_data is None when a project is removed"""
+        with self._lock:
+            if not self._loaded:
+                return  # The first refresh() will pick the change up from disk
+            if calendar_data is None or not self.include_project(project_id):
+                self._set(project_id, None, None)
+            else:
+                self._set(project_id, calendar_signature(project_id), self.build_segment(project_id, calendar_data))
@@ -0,0 +1,289 @@
+# utils/publish.py
+"""
+Pre-rendered static snapshots of published schedules.
+
+Publishing a project renders its viewer page once and writes it, with
+the fingerprinted assets it references, under PUBLISH_DIR in the same
+URL layout the app serves:
+
+    static/<hashed asset>                  shared, content-addressed
+    viewer/<project_id>/index.html         the current published page
+    viewer/<project_id>/index.html.gz      pre-compressed copy
+    viewer/<project_id>/<version>/index.html  one page per project version
+    viewer/<project_id>/published.json     revision, ETag and source signature
+
+Assets are written before the pages that reference them and every file
+is written to a temp name and renamed into place, so the directory is
+always consistent and can be served by a plain static web server if the
+app is down. /viewer/<id> sends the published file directly while its
+source files are unchanged; after a calendar save the project is
+republished in the background.
+"""
+import os
+import re
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from flask import current_app, render_template, request, send_file
+
+from .helpers import BASE_DIR, DATA_DIR, PROJECTS_DIR, get_project, load_global_data, write_json_atomic, register_calendar_listener
+from .calendar_generator import calculate_department_counts, calculate_location_counts
+from .snapshots import calendar_view
+from . import assets
+
+logger = logging.getLogger(__name__)
+
+# Generated output: kept out of DATA_DIR so backups and restores never copy it
+PUBLISH_DIR = os.environ.get('PUBLISH_DIR', os.path.join(BASE_DIR, 'published'))
+LEGACY_PUBLISH_DIR = os.path.join(DATA_DIR, 'published')  # Default before it moved out of DATA_DIR
+PUBLISH_DELAY = float(os.environ.get('PUBLISH_DELAY', 2))  # Seconds to coalesce bursts of saves before republishing
+SOURCE_FILES = ('departments.json', 'locations.json', 'areas.json')  # Global data the viewer page shows
+
+_STATIC_URL_RE = re.compile(r'''(?:href|src)=["']/static/([^"'?#]+)["']''')
+
+_lock = threading.Lock()            # Serialises writes to PUBLISH_DIR
+_records = {}                       # project_id -> (published.json signature, record)
+_pending = {}                       # project_id -> monotonic time it is due
+_condition = threading.Condition()
+_worker = None
+_app = None
+
+
+def _move_legacy_dir():
+    """Move published pages from the old default location on first start"""
+    if os.path.isdir(LEGACY_PUBLISH_DIR) and not os.path.exists(PUBLISH_DIR) \
+            and os.path.abspath(PUBLISH_DIR) != os.path.abspath(LEGACY_PUBLISH_DIR):
+        try:
+            shutil.move(LEGACY_PUBLISH_DIR, PUBLISH_DIR)
+            logger.info(f"Moved published pages from {LEGACY_PUBLISH_DIR} to {PUBLISH_DIR}")
+        except OSError as e:
+            logger.error(f"Error moving published pages to {PUBLISH_DIR}: {str(e)}")
+
+
+_move_legacy_dir()
+
+
+def _project_dir(project_id):
+    if not project_id or '/' in project_id or '\\' in project_id or '.' in project_id:
+        raise ValueError("Invalid project ID")
+    return os.path.join(PUBLISH_DIR, 'viewer', project_id)
+
+
+def version_slug(version):
+    """Directory name for a project version ('Blue Rev. 2' -> 'blue-rev-2')"""
+    slug = re.sub(r'[^a-z0-9]+', '-', str(version or '').lower()).strip('-')
+    return slug or 'unversioned'
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def source_signature(project_id):
+    """Stat signature of every file the viewer page is rendered from"""
+    paths = [os.path.join(PROJECTS_DIR, project_id, name) for name in ('main.json', 'calendar.json')]
+    paths += [os.path.join(DATA_DIR, name) for name in SOURCE_FILES]
+    return [_stat(path) for path in paths]
+
+
+def _write_atomic(path, body):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# --- Rendering ---
+
+def render_page(app, project, calendar_data):
+    """Viewer page HTML as an anonymous visitor sees it"""
+    calendar_data['departments'] = load_global_data('departments.json', [])
+    calendar_data['locationAreas'] = load_global_data('areas.json', [])
+    calendar_data = calculate_department_counts(calendar_data)
+    calendar_data = calculate_location_counts(calendar_data)
+    # A fresh request context has an empty session: no admin controls, flashes or per-user theme
+    with app.test_request_context(f"/viewer/{project['id']}"):
+        return render_template('viewer.html', project=project, calendar=calendar_data,
+                               locations=load_global_data('locations.json', []), diff=None, published=True)
+
+
+def _copy_assets(html):
+    """Write the fingerprinted assets a page references into PUBLISH_DIR/static"""
+    names = sorted(set(_STATIC_URL_RE.findall(html)))
+    manifest = assets.manifest
+    for name in names:
+        target = os.path.join(PUBLISH_DIR, 'static', *name.split('/'))
+        if os.path.exists(target):
+            continue  # Hashed names never change content
+        entry = manifest.entries.get(name) if manifest else None
+        if entry is None:
+            logger.warning(f"Published page references unknown asset {name}")
+            continue
+        logical, body = entry
+        if body is None:
+            with open(os.path.join(manifest.static_dir, logical), 'rb') as f:
+                body = f.read()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _write_atomic(target, body)
+    return names
+
+
+def publish_project(project_id, app=None):
+    """Render and write the project's static snapshot; returns its published.json record"""
+    app = app or _app or current_app._get_current_object()
+    project_dir = _project_dir(project_id)
+    signature = source_signature(project_id)  # Taken before reading, so a concurrent save leaves it stale
+    project = get_project(project_id)
+    if not project:
+        raise ValueError("Project not found")
+    calendar_data = calendar_view(project_id)
+    html = render_page(app, project, calendar_data).encode('utf-8')
+
+    slug = version_slug(project.get('version'))
+    revision = int(calendar_data.get('revision') or 0)
+    record = {
+        'projectId': project_id,
+        'version': project.get('version') or '',
+        'slug': slug,
+        'revision': revision,
+        'etag': f"pub-{revision}-{hashlib.sha1(html).hexdigest()[:16]}",
+        'publishedAt': datetime.utcnow().isoformat() + 'Z',
+        'signature': signature,
+    }
+    with _lock:
+        previous = published_record(project_id) or {}
+        record['versions'] = dict(previous.get('versions') or {}, **{slug: record['publishedAt']})
+        record['assets'] = _copy_assets(html.decode('utf-8'))
+        os.makedirs(os.path.join(project_dir, slug), exist_ok=True)
+        _write_atomic(os.path.join(project_dir, slug, 'index.html'), html)
+        _write_atomic(os.path.join(project_dir, 'index.html.gz'), gzip.compress(html, mtime=0))
+        _write_atomic(os.path.join(project_dir, 'index.html'), html)
+        write_json_atomic(os.path.join(project_dir, 'published.json'), record)
+    logger.info(f"Published project {project_id} ({slug}) at revision {revision}")
+    return record
+
+
+def published_record(project_id):
+    """The project's published.json record, or None if it is not published"""
+    try:
+        path = os.path.join(_project_dir(project_id), 'published.json')
+    except ValueError:
+        return None
+    signature = _stat(path)
+    if signature is None:
+        _records.pop(project_id, None)
+        return None
+    cached = _records.get(project_id)
+    if cached and cached[0] == signature:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading published record for project {project_id}: {str(e)}")
+        return None
+    _records[project_id] = (signature, record)
+    return record
+
+
+def unpublish_project(project_id):
+    """Remove a project's published pages; returns False if it was not published"""
+    project_dir = _project_dir(project_id)
+    with _condition:
+        _pending.pop(project_id, None)
+    with _lock:
+        _records.pop(project_id, None)
+        if not os.path.isdir(project_dir):
+            return False
+        shutil.rmtree(project_dir)
+    logger.info(f"Unpublished project {project_id}")
+    return True
+
+
+# --- Serving ---
+
+def published_response(project_id):
+    """
+    send_file response for the published page, or None when the project
+    is not published or its sources changed since (a republish is then queued).
+    """
+    record = published_record(project_id)
+    if not record:
+        return None
+    if record.get('signature') != source_signature(project_id):
+        schedule_publish(project_id)
+        return None
+
+    project_dir = _project_dir(project_id)
+    path, etag = os.path.join(project_dir, 'index.html'), record['etag']
+    compressed = os.path.join(project_dir, 'index.html.gz')
+    encoded = request.accept_encodings['gzip'] and os.path.exists(compressed)
+    if encoded:
+        path, etag = compressed, f"{etag}-gzip"
+    try:
+        response = send_file(path, mimetype='text/html', etag=etag, conditional=True, max_age=0)
+    except OSError:
+        return None
+    if encoded:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response
+
+
+# --- Background republishing ---
+
+def schedule_publish(project_id, delay=PUBLISH_DELAY):
+    """Queue a republish; saves within `delay` of the first are coalesced into one render"""
+    global _worker
+    with _condition:
+        _pending.setdefault(project_id, time.monotonic() + delay)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='publisher', daemon=True)
+            _worker.start()
+        _condition.notify()
+
+
+def _run_worker():
+    while True:
+        with _condition:
+            while not _pending:
+                _condition.wait()
+            project_id, due = min(_pending.items(), key=lambda item: item[1])
+            wait = due - time.monotonic()
+            if wait > 0:
+                _condition.wait(wait)
+                continue
+            del _pending[project_id]
+        try:
+            if published_record(project_id):
+                publish_project(project_id, _app)
+        except Exception as e:
+            logger.error(f"Error republishing project {project_id}: {str(e)}")
+
+
+def _on_calendar_saved(project_id, calendar_data):
+    # Deleting a project unpublishes it explicitly; archiving keeps its published pages
+    if calendar_data is not None and published_record(project_id):
+        schedule_publish(project_id)
+
+
+def init_publishing(app):
+    """Remember the app for background renders and republish published projects on save"""
+    global _app
+    _app = app
+    register_calendar_listener(_on_calendar_saved)
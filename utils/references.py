@@ -0,0 +1,172 @@
+# utils/references.py
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .helpers import get_project_calendar, save_project_calendar, calendar_lock
+from .calendar_generator import calculate_department_counts, calculate_location_counts
+from .project_index import ProjectIndex
+
+logger = logging.getLogger(__name__)
+
+CASCADE_WORKERS = int(os.environ.get('CASCADE_WORKERS', 4))
+
+# Reference data kind -> day fields that store it (by name, or by code for departments)
+REFERENCE_FIELDS = {
+    'location': ('location', 'secondUnitLocation'),
+    'area': ('locationArea',),
+    'department': ('departments',),
+}
+
+
+def reference_key(kind, value):
+    """Normalised form used for matching: department codes are upper case, names ignore case and spacing"""
+    if not value or not isinstance(value, str):
+        return ''
+    if kind == 'department':
+        return value.strip().upper()
+    return ' '.join(value.lower().split())
+
+
+def _day_values(day, field):
+    value = day.get(field)
+    if isinstance(value, list):
+        return value
+    return [value] if value else []
+
+
+class ReferenceIndex(ProjectIndex):
+    """
+    Reverse index from reference data (locations, areas, department codes)
+    to the projects and dates whose days use them.
+    """
+
+    name = 'references'
+    version = 1
+
+    def __init__(self):
+        super().__init__()
+        self._refs = {kind: {} for kind in REFERENCE_FIELDS}   # kind -> key -> {project_id: [dates]}
+
+    def build_segment(self, project_id, calendar_data):
+        refs = {kind: {} for kind in REFERENCE_FIELDS}
+        for day in calendar_data.get('days', []):
+            if not day.get('date'):
+                continue
+            for kind, fields in REFERENCE_FIELDS.items():
+                keys = {reference_key(kind, v) for field in fields for v in _day_values(day, field)}
+                for key in keys - {''}:
+                    refs[kind].setdefault(key, []).append(day['date'])
+        return refs
+
+    def add_segment(self, project_id, segment):
+        for kind, keys in segment.items():
+            table = self._refs.setdefault(kind, {})
+            for key, dates in keys.items():
+                table.setdefault(key, {})[project_id] = dates
+
+    def remove_segment(self, project_id, segment):
+        for kind, keys in segment.items():
+            table = self._refs.get(kind, {})
+            for key in keys:
+                projects = table.get(key)
+                if projects is not None:
+                    projects.pop(project_id, None)
+                    if not projects:
+                        del table[key]
+
+    def usage(self, kind, value, refresh=True):
+        """{project_id: [dates]} of days referencing a location/area name or department code"""
+        if refresh:
+            self.refresh(force=True)  # Deletes and renames must not act on a stale view
+        with self._lock:
+            return {pid: list(dates) for pid, dates in self._refs.get(kind, {}).get(reference_key(kind, value), {}).items()}
+
+
+reference_index = ReferenceIndex()
+
+
+def usage_summary(usage):
+    return {
+        'projects': len(usage),
+        'days': sum(len(dates) for dates in usage.values()),
+        'usage': usage,
+    }
+
+
+def _rewrite_days(days, renames):
+    """Apply (kind, old_key, new_value) renames to day records; returns the changed dates"""
+    changed = set()
+    for day in days:
+        for kind, old_key, new_value in renames:
+            for field in REFERENCE_FIELDS[kind]:
+                value = day.get(field)
+                if isinstance(value, list):
+                    if any(reference_key(kind, v) == old_key for v in value):
+                        rewritten = []
+                        for v in value:
+                            v = new_value if reference_key(kind, v) == old_key else v
+                            if v not in rewritten:
+                                rewritten.append(v)
+                        day[field] = rewritten
+                        changed.add(day.get('date'))
+                elif value and reference_key(kind, value) == old_key:
+                    day[field] = new_value
+                    changed.add(day.get('date'))
+    return changed
+
+
+def _cascade_project(project_id, renames):
+    with calendar_lock(project_id):
+        return _rewrite_project(project_id, renames)
+
+
+def _rewrite_project(project_id, renames):
+    from .events import publish_calendar_change # Local imports avoid circular imports
+    from .oplog import record_operation
+    calendar_data = get_project_calendar(project_id)
+    days_before = [dict(d) for d in calendar_data.get('days', [])]
+    changed = _rewrite_days(calendar_data.get('days', []), renames)
+    if not changed:
+        return []
+    calendar_data = calculate_department_counts(calendar_data)
+    calendar_data = calculate_location_counts(calendar_data)
+    # save_project_calendar writes atomically, so each project either has all renames or none
+    save_project_calendar(project_id, calendar_data)
+    record_operation(project_id, 'rename', days_before, calendar_data)
+    publish_calendar_change(project_id, calendar_data, 'day', changed)
+    return sorted(changed)
+
+
+def cascade_rename(renames):
+    """
+    Rewrite calendar days after reference data was renamed.
+
+    renames is a list of (kind, old value, new value). The reverse index
+    limits the work to projects that use an old value; every affected
+    calendar is rewritten once for the whole batch, in parallel, with an
+    atomic save. Returns {project_id: [changed dates]}.
+    """
+    batch = []
+    affected = set()
+    for kind, old, new in renames:
+        old_key = reference_key(kind, old)
+        if not old_key or not new or old == new:
+            continue
+        batch.append((kind, old_key, new))
+        affected |= set(reference_index.usage(kind, old, refresh=len(batch) == 1))
+    if not batch or not affected:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(CASCADE_WORKERS, len(affected)))) as pool:
+        futures = {pool.submit(_cascade_project, project_id, batch): project_id for project_id in affected}
+        for future, project_id in futures.items():
+            try:
+                dates = future.result()
+                if dates:
+                    results[project_id] = dates
+            except Exception as e:
+                logger.error(f"Error cascading rename to project {project_id}: {str(e)}")
+    logger.info(f"Cascaded {len(batch)} rename(s) to {len(results)} project(s)")
+    return results
@@ -0,0 +1,78 @@
+# utils/row_model.py
+"""
+Compact JSON row model of a calendar for the virtualized table.
+
+Instead of one <tr> per day, long calendars ship their days as arrays of
+values in FIELDS order, and static/js/calendar-virtual.js renders only
+the rows in view. Each row also carries a facet bitmask (its day type,
+plus flags such as second unit) so filters and filter stats are bit
+tests over an array rather than DOM queries.
+"""
+import os
+
+VIRTUAL_ROW_THRESHOLD = int(os.environ.get('VIRTUAL_ROW_THRESHOLD', 150))  # Calendars with this many days are virtualized; 0 disables
+VIRTUAL_INITIAL_ROWS = 40   # Rows rendered server-side, so the page paints before the script runs
+
+FIELDS = ('date', 'dayOfWeek', 'shootDay', 'mainUnit', 'extras', 'featuredExtras', 'location', 'locationArea',
+          'sequence', 'departments', 'notes', 'secondUnit', 'secondUnitLocation', 'daylight', 'dayType', 'facets')
+
+# One bit per row type (the row's class in the templates), then flags
+FACET_BITS = {
+    'weekend': 1, 'prep': 2, 'holiday': 4, 'hiatus': 8, 'shoot': 16,
+    'working-weekend': 32, 'normal': 64,
+    'secondUnit': 128,
+}
+
+
+def row_type(day):
+    """The row's type class, as viewer.html and admin/calendar.html compute it"""
+    if day.get('dayType'):
+        return day['dayType']
+    for flag, name in (('isWeekend', 'weekend'), ('isHoliday', 'holiday'), ('isHiatus', 'hiatus'),
+                       ('isPrep', 'prep'), ('isShootDay', 'shoot')):
+        if day.get(flag):
+            return name
+    return ''
+
+
+def row_facets(day):
+    facets = FACET_BITS.get(row_type(day), 0)
+    if day.get('secondUnit'):
+        facets |= FACET_BITS['secondUnit']
+    return facets
+
+
+def build_row(day):
+    light = day.get('daylight')
+    values = {
+        'dayType': row_type(day),
+        'facets': row_facets(day),
+        'daylight': {k: v for k, v in light.items() if k != 'at'} if isinstance(light, dict) else None,
+    }
+    return [values[field] if field in values else day.get(field) for field in FIELDS]
+
+
+def build_row_model(calendar_data, offset=0, limit=None):
+    """{'revision', 'total', 'offset', 'fields', 'facetBits', 'areas', 'departments', 'rows'} for a window of days"""
+    days = calendar_data.get('days', [])
+    window = days[offset:offset + limit if limit is not None else None]
+    return {
+        'revision': int(calendar_data.get('revision') or 0),
+        'total': len(days),
+        'offset': offset,
+        'fields': list(FIELDS),
+        'facetBits': FACET_BITS,
+        'areas': {area.get('name'): area.get('color') for area in calendar_data.get('locationAreas') or []
+                  if area.get('name') and area.get('color')},
+        'departments': {dept.get('code'): dept.get('color') for dept in calendar_data.get('departments') or []
+                        if dept.get('code') and dept.get('color')},
+        'rows': [build_row(day) for day in window],
+    }
+
+
+def calendar_row_model(calendar_data):
+    """Template global: the full row model when the calendar is long enough to virtualize, else None"""
+    days = calendar_data.get('days') or []
+    if not VIRTUAL_ROW_THRESHOLD or len(days) < VIRTUAL_ROW_THRESHOLD:
+        return None
+    return dict(build_row_model(calendar_data), initialRows=VIRTUAL_INITIAL_ROWS)
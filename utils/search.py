@@ -0,0 +1,239 @@
+# utils/search.py
+import re
+import math
+import bisect
+import logging
+
+from .project_index import ProjectIndex
+
+logger = logging.getLogger(__name__)
+
+# Indexed day fields and their ranking weights
+SEARCH_FIELDS = {
+    'location': 2.0,
+    'locationArea': 1.5,
+    'sequence': 1.5,
+    'secondUnitLocation': 1.5,
+    'mainUnit': 1.2,
+    'secondUnit': 1.0,
+    'notes': 1.0,
+}
+MAX_PREFIX_EXPANSIONS = 200
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+def parse_query(query):
+    """
+    Split a query into clauses: ('term', t), ('prefix', p) or ('phrase', [t, ...]).
+    Quoted text is a phrase, a trailing * makes a prefix query, and words
+    that tokenize into several terms (e.g. "D-Stage") are treated as phrases.
+    """
+    clauses = []
+    for phrase, word in _QUERY_RE.findall(query or ''):
+        if phrase:
+            terms = tokenize(phrase)
+            if len(terms) == 1:
+                clauses.append(('term', terms[0]))
+            elif terms:
+                clauses.append(('phrase', terms))
+            continue
+        is_prefix = word.endswith('*')
+        terms = tokenize(word)
+        if not terms:
+            continue
+        if len(terms) > 1:
+            clauses.append(('phrase', terms))
+        elif is_prefix:
+            clauses.append(('prefix', terms[0]))
+        else:
+            clauses.append(('term', terms[0]))
+    return clauses
+
+
+def _contains_sequence(tokens, terms):
+    n = len(terms)
+    first = terms[0]
+    for i, token in enumerate(tokens):
+        if token == first and tokens[i:i + n] == terms:
+            return True
+    return False
+
+
+class SearchIndex(ProjectIndex):
+    """
+    Inverted index over the text fields of every calendar day in every project.
+
+    Documents are keyed by (project_id, date). Postings map each term to the
+    field-weighted term frequency per document; a sorted vocabulary answers
+    prefix queries with bisect, and phrases are verified against the stored
+    token lists.
+    """
+
+    name = 'search'
+    version = 1
+
+    def __init__(self):
+        super().__init__()
+        self._docs = {}          # (project_id, date) -> doc
+        self._postings = {}      # term -> {(project_id, date): weighted tf}
+        self._vocab = []         # Sorted terms, rebuilt lazily
+        self._vocab_dirty = False
+        self._total_length = 0
+
+    # --- ProjectIndex hooks ---
+
+    def build_segment(self, project_id, calendar_data):
+        docs = {}
+        for day in calendar_data.get('days', []):
+            date = day.get('date')
+            if not date:
+                continue
+            fields, tokens = {}, {}
+            for field in SEARCH_FIELDS:
+                value = day.get(field)
+                if value and isinstance(value, str) and value.strip():
+                    fields[field] = value
+                    tokens[field] = tokenize(value)
+            if fields:
+                docs[date] = {'dayType': day.get('dayType', ''), 'fields': fields, 'tokens': tokens}
+        return {'docs': docs}
+
+    def add_segment(self, project_id, segment):
+        for date, doc in segment.get('docs', {}).items():
+            key = (project_id, date)
+            length = 0
+            for field, tokens in doc['tokens'].items():
+                weight = SEARCH_FIELDS.get(field, 1.0)
+                length += len(tokens)
+                for token in tokens:
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        postings = self._postings[token] = {}
+                        self._vocab_dirty = True
+                    postings[key] = postings.get(key, 0.0) + weight
+            self._docs[key] = dict(doc, projectId=project_id, date=date, length=length)
+            self._total_length += length
+
+    def remove_segment(self, project_id, segment):
+        for date, doc in segment.get('docs', {}).items():
+            key = (project_id, date)
+            stored = self._docs.pop(key, None)
+            if stored is None:
+                continue
+            self._total_length -= stored['length']
+            for tokens in doc['tokens'].values():
+                for token in set(tokens):
+                    postings = self._postings.get(token)
+                    if postings is None:
+                        continue
+                    postings.pop(key, None)
+                    if not postings:
+                        del self._postings[token]
+                        self._vocab_dirty = True
+
+    # --- Querying ---
+
+    def _prefix_terms(self, prefix):
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_left(self._vocab, prefix + '\uffff')
+        return self._vocab[start:min(end, start + MAX_PREFIX_EXPANSIONS)]
+
+    def _term_scores(self, term, avg_length):
+        """BM25 score of one term for every document containing it"""
+        postings = self._postings.get(term)
+        if not postings:
+            return {}
+        n = len(self._docs)
+        idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+        scores = {}
+        for key, tf in postings.items():
+            norm = 1 - BM25_B + BM25_B * self._docs[key]['length'] / avg_length
+            scores[key] = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+    def _clause_scores(self, clause, avg_length):
+        kind, value = clause
+        if kind == 'term':
+            return self._term_scores(value, avg_length)
+        if kind == 'prefix':
+            scores = {}
+            for term in self._prefix_terms(value):
+                for key, score in self._term_scores(term, avg_length).items():
+                    scores[key] = max(scores.get(key, 0.0), score)
+            return scores
+        # Phrase: documents containing every term, then check adjacency
+        per_term = [self._term_scores(term, avg_length) for term in value]
+        if not all(per_term):
+            return {}
+        candidates = set.intersection(*(set(s) for s in sorted(per_term, key=len)))
+        scores = {}
+        for key in candidates:
+            tokens = self._docs[key]['tokens']
+            if any(_contains_sequence(field_tokens, value) for field_tokens in tokens.values()):
+                scores[key] = sum(s[key] for s in per_term) * 1.5  # Phrase matches rank higher
+        return scores
+
+    def search(self, query, project_ids=None, start=None, end=None, day_types=None, limit=50):
+        """
+        Run a query. All clauses must match (AND); results are filtered by
+        project, inclusive date range and dayType, and ranked by BM25.
+        Returns (total_matches, results).
+        """
+        self.refresh()
+        clauses = parse_query(query)
+        if not clauses:
+            return 0, []
+
+        with self._lock:
+            if not self._docs:
+                return 0, []
+            avg_length = max(self._total_length / len(self._docs), 1.0)
+
+            combined = None
+            for clause in clauses:
+                scores = self._clause_scores(clause, avg_length)
+                if combined is None:
+                    combined = scores
+                else:
+                    combined = {key: combined[key] + score for key, score in scores.items() if key in combined}
+                if not combined:
+                    return 0, []
+
+            matches = []
+            for key, score in combined.items():
+                project_id, date = key
+                if project_ids and project_id not in project_ids:
+                    continue
+                if (start and date < start) or (end and date > end):
+                    continue
+                doc = self._docs[key]
+                if day_types and doc['dayType'] not in day_types:
+                    continue
+                matches.append((score, key))
+
+            matches.sort(key=lambda m: (-m[0], m[1][1], m[1][0]))
+            results = []
+            for score, key in matches[:limit]:
+                doc = self._docs[key]
+                results.append({
+                    'projectId': doc['projectId'],
+                    'date': doc['date'],
+                    'dayType': doc['dayType'],
+                    'score': round(score, 4),
+                    'fields': doc['fields'],
+                })
+            return len(matches), results
+
+
+search_index = SearchIndex()
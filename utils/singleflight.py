@@ -0,0 +1,106 @@
+# utils/singleflight.py
+"""
+Per-key coalescing of concurrent work ("singleflight").
+
+When many requests miss a cache for the same key at once (everyone opening
+a schedule right after it is published), only the first runs the
+computation; the others wait for it and share its result or exception.
+Nothing is kept once the call finishes: callers cache the result
+themselves, the group only covers the window while it is being computed.
+
+Results are shared between threads, so they should be immutable (bytes,
+str, tuples) or treated as read-only.
+
+Each group counts calls, executions and coalesced calls; stats() reports
+every group for the admin metrics endpoint.
+"""
+import threading
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """A named group of keyed calls; see do()"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}      # key -> _Call in progress
+        self.calls = 0        # do() invocations
+        self.executions = 0   # ... that ran fn
+        self.coalesced = 0    # ... that waited on another caller's fn
+        self.errors = 0       # executions that raised
+        self.max_waiters = 0  # Most callers coalesced onto one execution
+
+    def do(self, key, fn, timeout=None):
+        """
+        fn() if no call for `key` is in progress, else wait (up to `timeout`
+        seconds) for that call and return its result or raise its exception.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            owner = call is None
+            if owner:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if owner:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise TimeoutError(f"Timed out waiting for {self.name} call in progress")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'maxWaiters': self.max_waiters,
+                'inFlight': len(self._calls),
+            }
+
+
+def group(name):
+    """The process-wide group called `name`, created on first use"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def stats():
+    """{group name: counters} for every group"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {g.name: g.stats() for g in groups}
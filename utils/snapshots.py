@@ -0,0 +1,294 @@
+# utils/snapshots.py
+"""
+Shared, read-only calendar snapshots for multi-worker deployments.
+
+Every gunicorn worker reading calendar.json parses its own copy of the
+calendar. Instead, each saved revision is encoded once into a compact
+binary file under SNAPSHOT_DIR:
+
+    <project_id>/r<revision>-<mtime_ns hex>-<size hex>-<inode hex>-v<format>.snap
+
+and memory-mapped read-only by every worker, so the bytes live once in
+the page cache however many workers there are. The name carries the
+calendar.json stat signature it was built from: a worker finds the
+current snapshot with one stat(), and a save (in any worker) simply
+produces a new file. The saving worker writes it straight away; other
+workers build one only if they get there first. Saves replace
+calendar.json, so its inode tells apart two saves with the same size on
+a filesystem with coarse mtimes; should two names still match, the
+higher revision is used.
+
+Layout (host byte order; every section is a run of uint32):
+
+    header    magic, revision, source mtime_ns, size and inode, day/field/value counts, meta value
+    fields    value index of each field name
+    offsets   start of each value in the blob (one extra for the end)
+    cells     day_count x field_count value indexes, 0 = key absent
+    orders    per day, value index of its key order (a list of field positions)
+    blob      distinct JSON values, each stored once
+
+Values are interned: a location, department list or 'Saturday' used on a
+hundred days is stored, and decoded in each worker, once. Days come back
+as lazy CalendarDay records (utils/calendar_day.py) that decode their
+cells on first access; each calendar_view() call gets its own records,
+so changes such as calculate_location_counts adding locationAreaId stay
+with that caller and never touch the shared bytes.
+"""
+import os
+import re
+import json
+import mmap
+import struct
+import logging
+import threading
+from array import array
+
+from .calendar_day import CalendarDay
+from .helpers import RUN_DIR, PROJECTS_DIR, get_project_calendar, register_calendar_listener
+from .project_index import calendar_signature
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(RUN_DIR, 'snapshots'))
+SNAPSHOTS_ENABLED = os.environ.get('SNAPSHOTS', 'True').lower() == 'true'
+SNAPSHOT_KEEP = 2   # Snapshots kept per project; older ones may still be mapped by a slow request
+
+_MAGIC = b'AAGCAL03'
+_FORMAT = 3   # In file names too, so snapshots in an older layout are rebuilt rather than read
+_HEADER = struct.Struct('=8sQqQQIIII')  # magic, revision, mtime_ns, size, inode, days, fields, values, meta value
+_MISSING = object()
+
+_REVISION = re.compile(r'r(\d+)-')
+
+_lock = threading.Lock()
+_mapped = {}   # project_id -> CalendarSnapshot currently mapped by this worker
+
+
+# --- Encoding ---
+
+def encode_calendar(calendar_data, signature):
+    """Snapshot bytes for a calendar whose calendar.json has stat `signature`"""
+    blobs = [b'']      # Value 0 marks an absent key
+    interned = {}
+
+    def intern(value):
+        encoded = json.dumps(value, separators=(',', ':'), ensure_ascii=False, sort_keys=True)
+        index = interned.get(encoded)
+        if index is None:
+            index = interned[encoded] = len(blobs)
+            blobs.append(encoded.encode('utf-8'))
+        return index
+
+    days = calendar_data.get('days') or []
+    fields, field_index = [], {}
+    for day in days:
+        for key in day:
+            if key not in field_index:
+                field_index[key] = len(fields)
+                fields.append(key)
+
+    cells = array('I', bytes(4 * len(days) * len(fields)))
+    orders = array('I', bytes(4 * len(days)))
+    for i, day in enumerate(days):
+        base = i * len(fields)
+        for key, value in day.items():
+            cells[base + field_index[key]] = intern(value)
+        orders[i] = intern([field_index[key] for key in day])  # Days keep their own key order
+    field_ids = array('I', [intern(name) for name in fields])
+    meta = intern({k: v for k, v in calendar_data.items() if k != 'days'})
+
+    offsets = array('I', [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    header = _HEADER.pack(_MAGIC, int(calendar_data.get('revision') or 0), signature[0], signature[1],
+                          signature[2], len(days), len(fields), len(blobs), meta)
+    return b''.join([header, field_ids.tobytes(), offsets.tobytes(), cells.tobytes(), orders.tobytes()] + blobs)
+
+
+# --- Reading ---
+
+class CalendarSnapshot:
+    """A memory-mapped snapshot file; see calendar() for a calendar dict backed by it"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.revision, mtime_ns, size, inode, self.day_count, field_count, value_count, self._meta = \
+            _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a calendar snapshot: {path}")
+        self.path = path
+        self.signature = [mtime_ns, size, inode]
+
+        view = memoryview(self._mmap)
+        position = _HEADER.size
+        sections = []
+        for count in (field_count, value_count + 1, self.day_count * field_count, self.day_count):
+            sections.append(view[position:position + 4 * count].cast('I'))
+            position += 4 * count
+        field_ids, self._offsets, self._cells, self._orders = sections
+        self._blob = position
+        self._values = {}        # value index -> decoded scalar, shared by every day in this worker
+        self._key_orders = {}    # value index -> tuple of field positions
+
+        self.fields = [self.value(i) for i in field_ids]
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.field_count = field_count
+
+    def value(self, index):
+        """Decoded value; scalars are cached, lists and dicts are decoded fresh for the caller to own"""
+        value = self._values.get(index, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = json.loads(self._mmap[self._blob + self._offsets[index]:self._blob + self._offsets[index + 1]])
+        if not isinstance(value, (list, dict)):
+            self._values[index] = value
+        return value
+
+    def day_items(self, day_index):
+        """(field, value) pairs of one day, in the day's own key order"""
+        order_index = self._orders[day_index]
+        order = self._key_orders.get(order_index)
+        if order is None:
+            order = self._key_orders[order_index] = tuple(self.value(order_index))
+        base = day_index * self.field_count
+        fields, cells = self.fields, self._cells
+        return [(fields[position], self.value(cells[base + position])) for position in order]
+
+    def calendar(self):
+        """Calendar dict as get_project_calendar returns it, with days the caller may change"""
+        calendar_data = self.value(self._meta)
+        calendar_data['days'] = [CalendarDay.lazy(self, i) for i in range(self.day_count)]
+        return calendar_data
+
+
+# --- Store ---
+
+def _project_dir(project_id):
+    return os.path.join(SNAPSHOT_DIR, project_id)
+
+
+def _suffix(signature):
+    return f"-{signature[0]:x}-{signature[1]:x}-{signature[2]:x}-v{_FORMAT}.snap"
+
+
+def _prune(project_id, keep_path):
+    """Remove all but the newest SNAPSHOT_KEEP snapshots (mapped files stay readable until unmapped)"""
+    directory = _project_dir(project_id)
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith('.snap')]
+        current = f"-v{_FORMAT}.snap"
+        paths = [os.path.join(directory, n) for n in names if n.endswith(current)]
+        paths.sort(key=lambda p: (p == keep_path, os.path.getmtime(p)), reverse=True)
+    except OSError:
+        return
+    stale = [os.path.join(directory, n) for n in names if not n.endswith(current)]
+    for path in paths[SNAPSHOT_KEEP:] + stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_snapshot(project_id, calendar_data, signature):
+    """Encode and write a snapshot atomically; returns its path"""
+    directory = _project_dir(project_id)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"r{int(calendar_data.get('revision') or 0)}{_suffix(signature)}")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_calendar(calendar_data, signature))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _prune(project_id, path)
+    return path
+
+
+def _find(project_id, signature):
+    """Snapshot built from calendar.json with this signature; the newest revision if several match"""
+    suffix = _suffix(signature)
+    try:
+        names = os.listdir(_project_dir(project_id))
+    except OSError:
+        return None
+    revisions = {}
+    for name in names:
+        match = _REVISION.match(name)
+        if match and name.endswith(suffix):
+            revisions[int(match.group(1))] = name
+    if not revisions:
+        return None
+    return os.path.join(_project_dir(project_id), revisions[max(revisions)])
+
+
+def _build(project_id, signature):
+    """Write a snapshot from calendar.json; None if it changed while being read"""
+    with open(os.path.join(PROJECTS_DIR, project_id, 'calendar.json'), 'r', encoding='utf-8') as f:
+        calendar_data = json.load(f)
+    if calendar_signature(project_id) != signature:
+        return None
+    return write_snapshot(project_id, calendar_data, signature)
+
+
+def get_snapshot(project_id):
+    """This worker's mapping of the project's current snapshot, building it if needed; None if unavailable"""
+    if not SNAPSHOTS_ENABLED or not project_id or '/' in project_id or '.' in project_id:
+        return None
+    signature = calendar_signature(project_id)
+    if signature is None:
+        return None  # No calendar.json (e.g. archived): callers fall back to get_project_calendar
+    with _lock:
+        snapshot = _mapped.get(project_id)
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+    try:
+        path = _find(project_id, signature) or _build(project_id, signature)
+        if path is None:
+            return None
+        snapshot = CalendarSnapshot(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error loading calendar snapshot for project {project_id}: {str(e)}")
+        return None
+    with _lock:
+        _mapped[project_id] = snapshot
+    return snapshot
+
+
+def calendar_view(project_id):
+    """
+    The project's calendar for read-mostly use (rendering, feeds, exports):
+    backed by the shared snapshot when there is one, else read from disk.
+    Changes to it are never saved.
+    """
+    snapshot = get_snapshot(project_id)
+    return snapshot.calendar() if snapshot is not None else get_project_calendar(project_id)
+
+
+def _on_calendar_saved(project_id, calendar_data):
+    """Write the new revision's snapshot for every worker, or drop the project's snapshots"""
+    if not SNAPSHOTS_ENABLED:
+        return
+    if calendar_data is None:
+        with _lock:
+            _mapped.pop(project_id, None)
+        directory = _project_dir(project_id)
+        for name in (os.listdir(directory) if os.path.isdir(directory) else []):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+        return
+    signature = calendar_signature(project_id)
+    if signature is None:
+        return
+    try:
+        # Built from the file rather than calendar_data: another save may already have replaced it
+        _build(project_id, signature)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error writing calendar snapshot for project {project_id}: {str(e)}")
+
+
+register_calendar_listener(_on_calendar_saved)
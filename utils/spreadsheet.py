@@ -0,0 +1,468 @@
+# utils/spreadsheet.py
+"""
+CSV and XLSX export/import of calendar days.
+
+Exports are generators: CSV rows are flushed in small batches, and XLSX
+workbooks are written through a non-seekable zipfile so each compressed
+chunk is yielded as soon as it is produced (XLSX is plain zipped XML, so
+no spreadsheet library is needed).
+
+Imports read uploads incrementally (csv.reader over the upload
+stream, iterparse over the worksheet XML), validate every row against
+the reference data in one pass with dictionary lookups, and report all
+row-level errors together. Nothing is written unless every row is
+valid; a valid file is applied as one atomic calendar save with a
+single recount.
+"""
+import io
+import os
+import csv
+import zipfile
+import logging
+from itertools import chain
+from datetime import date, datetime, timedelta
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from .helpers import load_global_data, recalculate_shoot_days
+from .references import reference_key
+
+logger = logging.getLogger(__name__)
+
+# (header, day field); the order of export columns
+COLUMNS = (
+    ('Date', 'date'),
+    ('Day', 'dayOfWeek'),
+    ('Type', 'dayType'),
+    ('Shoot Day', 'shootDay'),
+    ('Main Unit', 'mainUnit'),
+    ('Sequence', 'sequence'),
+    ('Location', 'location'),
+    ('Area', 'locationArea'),
+    ('Departments', 'departments'),
+    ('Extras', 'extras'),
+    ('Featured Extras', 'featuredExtras'),
+    ('Second Unit', 'secondUnit'),
+    ('Second Unit Location', 'secondUnitLocation'),
+    ('Notes', 'notes'),
+)
+# Fields an import may set; the rest (day type, shoot day numbers, ...) are derived
+IMPORT_FIELDS = ('mainUnit', 'sequence', 'location', 'locationArea', 'departments', 'extras',
+                 'featuredExtras', 'secondUnit', 'secondUnitLocation', 'notes')
+HEADER_ALIASES = {
+    'location area': 'locationArea', 'depts': 'departments', 'department': 'departments',
+    'featured': 'featuredExtras', 'bg': 'extras', 'background': 'extras', '2nd unit': 'secondUnit',
+    '2nd unit location': 'secondUnitLocation',
+}
+FIELD_LABELS = {field: header for header, field in COLUMNS}
+MAX_IMPORT_ROWS = int(os.environ.get('MAX_IMPORT_ROWS', 20000))
+MAX_REPORTED_ERRORS = 200
+CSV_FLUSH_ROWS = 200
+
+XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+class SpreadsheetError(Exception):
+    """Raised for uploads that cannot be read at all (as opposed to row-level errors)"""
+
+
+def _cell_value(day, field):
+    value = day.get(field)
+    if field == 'departments':
+        return ', '.join(value or [])
+    if field in ('extras', 'featuredExtras') and not value:
+        return ''
+    return '' if value is None else value
+
+
+# --- Export ---
+
+def iter_csv(days):
+    """Yield the calendar as CSV text in batches of rows (with a BOM so Excel reads UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _ in COLUMNS])
+    for i, day in enumerate(days, 1):
+        writer.writerow([_cell_value(day, field) for _, field in COLUMNS])
+        if i % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file: zipfile then streams with data descriptors"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+# Control characters XML 1.0 cannot carry (tab, newline and carriage return are allowed)
+_XML_INVALID = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _xlsx_cell(ref, value):
+    if isinstance(value, bool) or value is None or value == '':
+        return ''
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = escape(str(value).translate(_XML_INVALID))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{PKG_REL_NS}">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<Relationships xmlns="{PKG_REL_NS}">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>'),
+}
+
+
+def iter_xlsx(days, sheet_name='Schedule'):
+    """Yield an XLSX workbook (one sheet, inline strings) as compressed chunks"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_PARTS.items():
+            zf.writestr(name, content)
+        zf.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<workbook xmlns="{XLSX_NS}" xmlns:r="{REL_NS}"><sheets>'
+            f'<sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        yield sink.drain()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{XLSX_NS}">'
+                         '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+                         'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews><sheetData>').encode('utf-8'))
+            rows = [[header for header, _ in COLUMNS]]
+            rows_iter = ([_cell_value(day, field) for _, field in COLUMNS] for day in days)
+            for number, values in enumerate(chain(rows, rows_iter), 1):
+                cells = ''.join(_xlsx_cell(f"{_column_letter(i)}{number}", v) for i, v in enumerate(values))
+                sheet.write(f'<row r="{number}">{cells}</row>'.encode('utf-8'))
+                if number % CSV_FLUSH_ROWS == 0:
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+# --- Reading uploads ---
+
+def _normalise_header(header):
+    key = ' '.join(str(header or '').replace('\ufeff', '').lower().split())
+    for label, field in COLUMNS:
+        if key in (label.lower(), field.lower()):
+            return field
+    return HEADER_ALIASES.get(key)
+
+
+def _iter_csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    except UnicodeDecodeError:
+        raise SpreadsheetError("CSV files must be UTF-8 encoded")
+    yield header
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        raise SpreadsheetError("CSV files must be UTF-8 encoded")
+    except csv.Error as e:
+        raise SpreadsheetError(f"Could not read CSV: {str(e)}")
+
+
+def _column_index(ref):
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+def _first_sheet_path(zf):
+    """Path of the workbook's first worksheet, following the workbook relationships"""
+    try:
+        workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+        sheet = workbook.find(f'{{{XLSX_NS}}}sheets/{{{XLSX_NS}}}sheet')
+        rel_id = sheet.get(f'{{{REL_NS}}}id')
+        rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels:
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target').lstrip('/')
+                return target if target.startswith('xl/') else f"xl/{target}"
+    except (KeyError, AttributeError, ElementTree.ParseError):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _shared_strings(zf):
+    strings = []
+    try:
+        with zf.open('xl/sharedStrings.xml') as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag == f'{{{XLSX_NS}}}si':
+                    strings.append(''.join(t.text or '' for t in elem.iter(f'{{{XLSX_NS}}}t')))
+                    elem.clear()
+    except KeyError:
+        pass
+    return strings
+
+
+def _iter_xlsx_rows(stream):
+    try:
+        zf = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise SpreadsheetError("Not a valid XLSX file")
+    with zf:
+        strings = _shared_strings(zf)
+        try:
+            sheet = zf.open(_first_sheet_path(zf))
+        except KeyError:
+            raise SpreadsheetError("The workbook has no worksheet")
+        cell_tag, value_tag, row_tag = f'{{{XLSX_NS}}}c', f'{{{XLSX_NS}}}v', f'{{{XLSX_NS}}}row'
+        try:
+            with sheet:
+                for _, elem in ElementTree.iterparse(sheet):
+                    if elem.tag != row_tag:
+                        continue
+                    values = []
+                    for cell in elem.iter(cell_tag):
+                        kind = cell.get('t')
+                        if kind == 'inlineStr':
+                            value = ''.join(t.text or '' for t in cell.iter(f'{{{XLSX_NS}}}t'))
+                        else:
+                            v = cell.find(value_tag)
+                            value = v.text if v is not None and v.text is not None else ''
+                            if kind == 's' and value != '':
+                                value = strings[int(value)]
+                            elif kind in (None, 'n') and value != '':
+                                number = float(value)
+                                value = int(number) if number.is_integer() else number
+                        index = _column_index(cell.get('r', '')) if cell.get('r') else len(values)
+                        values.extend([''] * (index + 1 - len(values)))
+                        values[index] = value
+                    elem.clear()  # Keep memory flat on large sheets
+                    yield values
+        except ElementTree.ParseError as e:
+            raise SpreadsheetError(f"Could not read worksheet: {str(e)}")
+
+
+def iter_upload_rows(stream, filename):
+    """
+    Yield (row number, {field: value}) for a CSV or XLSX upload, read incrementally.
+    Only recognised columns are included; blank rows are skipped.
+    """
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext == '.xlsx':
+        rows = _iter_xlsx_rows(stream)
+    elif ext in ('.csv', '.txt', ''):
+        rows = _iter_csv_rows(stream)
+    else:
+        raise SpreadsheetError(f"Unsupported file type '{ext}'; upload a .csv or .xlsx file")
+
+    header = next(rows, None)
+    if header is None:
+        raise SpreadsheetError("The file is empty")
+    fields = [_normalise_header(h) for h in header]
+    if 'date' not in fields:
+        raise SpreadsheetError("A 'Date' column is required")
+    for number, values in enumerate(rows, 2):
+        if number - 1 > MAX_IMPORT_ROWS:
+            raise SpreadsheetError(f"Too many rows (limit {MAX_IMPORT_ROWS})")
+        if not any(str(v).strip() for v in values):
+            continue
+        yield number, {field: values[i] if i < len(values) else ''
+                       for i, field in enumerate(fields) if field}
+
+
+# --- Validation ---
+
+def _parse_date(value):
+    if isinstance(value, (int, float)):
+        return (EXCEL_EPOCH + timedelta(days=int(value))).isoformat()  # Excel serial date
+    text = str(value).strip()
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date '{text}' (use YYYY-MM-DD or DD/MM/YYYY)")
+
+
+def _parse_count(value, label):
+    text = str(value).strip()
+    if not text:
+        return 0
+    try:
+        number = float(text)
+    except ValueError:
+        raise ValueError(f"{label} must be a number, got '{text}'")
+    if number < 0 or not number.is_integer():
+        raise ValueError(f"{label} must be a whole number of 0 or more")
+    return int(number)
+
+
+def _reference_data():
+    """Lookups for validation, built once per import"""
+    areas = load_global_data('areas.json', [])
+    area_names = {a.get('id'): a.get('name') for a in areas}
+    return {
+        'areas': {reference_key('area', a.get('name')): a for a in areas if a.get('name')},
+        'locations': {reference_key('location', loc.get('name')): dict(loc, areaName=area_names.get(loc.get('areaId')))
+                      for loc in load_global_data('locations.json', []) if loc.get('name')},
+        'departments': {reference_key('department', d.get('code')) for d in load_global_data('departments.json', [])
+                        if d.get('code')},
+    }
+
+
+def _validate_row(row, refs, day):
+    """
+    {field: value} of changes for one row (canonical names/codes); raises ValueError listing problems.
+    References the day already holds are accepted as they are, so exported files re-import cleanly.
+    """
+    problems, updates = [], {}
+    for field in IMPORT_FIELDS:
+        if field not in row:
+            continue
+        value = row[field]
+        try:
+            if field in ('extras', 'featuredExtras'):
+                updates[field] = _parse_count(value, FIELD_LABELS[field])
+            elif field == 'departments':
+                codes = [c for c in str(value).replace(';', ',').replace(' ', ',').split(',') if c.strip()]
+                current = {reference_key('department', c) for c in day.get('departments') or []}
+                unknown = [c for c in codes if reference_key('department', c) not in refs['departments'] | current]
+                if unknown:
+                    raise ValueError(f"Unknown department code(s): {', '.join(unknown)}")
+                updates[field] = list(dict.fromkeys(reference_key('department', c) for c in codes))
+            elif field in ('location', 'secondUnitLocation'):
+                text = str(value).strip()
+                if reference_key('location', text) == reference_key('location', day.get(field)):
+                    continue  # Unchanged
+                location = refs['locations'].get(reference_key('location', text))
+                if text and location is None:
+                    raise ValueError(f"Unknown location '{text}'")
+                updates[field] = location['name'] if location else ''
+                if field == 'location':
+                    updates['locationArea'] = (location or {}).get('areaName') or ''
+                    updates['locationAreaId'] = (location or {}).get('areaId') or None
+            elif field == 'locationArea':
+                text = str(value).strip()
+                if reference_key('area', text) == reference_key('area', day.get(field)) and 'location' not in updates:
+                    continue  # Unchanged
+                area = refs['areas'].get(reference_key('area', text))
+                if text and area is None:
+                    raise ValueError(f"Unknown area '{text}'")
+                location_area = updates.get('locationArea')
+                if 'location' in row and str(row['location']).strip():
+                    # The location decides the area; a conflicting Area column is a mistake
+                    if text and location_area and reference_key('area', text) != reference_key('area', location_area):
+                        raise ValueError(f"Area '{text}' does not match location area '{location_area}'")
+                    continue
+                updates['locationArea'] = area['name'] if area else ''
+                updates['locationAreaId'] = area.get('id') if area else None
+            elif ' '.join(str(value).split()) != ' '.join(str(day.get(field) or '').split()):
+                updates[field] = str(value).strip()  # Whitespace-only differences (e.g. CRLF) are not changes
+        except ValueError as e:
+            problems.append(str(e))
+    if problems:
+        raise ValueError('; '.join(problems))
+    return updates
+
+
+def validate_import(rows, calendar_data):
+    """
+    Validate all upload rows against the calendar and reference data.
+    Returns (updates {date: {field: value}}, errors [{'row', 'date', 'error'}], row count).
+    """
+    refs = _reference_data()
+    days = {d.get('date'): d for d in calendar_data.get('days', [])}
+    updates, errors, seen, count = {}, [], {}, 0
+    for number, row in rows:
+        count += 1
+        try:
+            day_date = _parse_date(row.get('date', ''))
+        except ValueError as e:
+            errors.append({'row': number, 'date': str(row.get('date', '')), 'error': str(e)})
+            continue
+        try:
+            if day_date not in days:
+                raise ValueError("Date is outside the project calendar")
+            if day_date in seen:
+                raise ValueError(f"Date already appears on row {seen[day_date]}")
+            seen[day_date] = number
+            updates[day_date] = _validate_row(row, refs, days[day_date])
+        except ValueError as e:
+            errors.append({'row': number, 'date': day_date, 'error': str(e)})
+    return updates, errors, count
+
+
+def apply_import(calendar_data, updates, shoot_start=None):
+    """
+    Apply validated updates to the calendar in place. Prep days on or after
+    the shoot start that gain a main unit or sequence become shoot days, as in
+    the day editor. Returns the dates whose records changed.
+    """
+    changed = []
+    for day in calendar_data.get('days', []):
+        fields = updates.get(day.get('date'))
+        if not fields:
+            continue
+        before = dict(day)
+        for field, value in fields.items():
+            if (day.get(field) or None) != (value or None):  # Blank, missing, 0 and [] are all "empty"
+                day[field] = value
+        if (shoot_start and day.get('isPrep') and not day.get('isShootDay') and day['date'] >= shoot_start
+                and (day.get('mainUnit') or day.get('sequence'))):
+            day['isPrep'], day['isShootDay'], day['dayType'] = False, True, 'shoot'
+        if day != before:
+            changed.append(day['date'])
+    if changed:
+        calendar_data['days'] = recalculate_shoot_days(calendar_data['days'])
+    return changed
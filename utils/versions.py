@@ -0,0 +1,122 @@
+# utils/versions.py
+import os
+import re
+import json
+import logging
+from datetime import datetime
+
+from .helpers import PROJECTS_DIR, BACKUP_DIR, get_project, get_project_calendar, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Calendar keys kept in a version snapshot (the rest is recomputed on load)
+SNAPSHOT_KEYS = ('days', 'revision', 'lastUpdated')
+
+
+def _versions_dir(project_id):
+    return os.path.join(PROJECTS_DIR, project_id, 'versions')
+
+
+def version_slug(label):
+    """Filesystem-safe name for a version label ('V13' -> 'v13')"""
+    return re.sub(r'[^a-z0-9_-]+', '-', str(label).strip().lower()).strip('-')
+
+
+def snapshot_version(project_id, label, calendar_data=None):
+    """Store the calendar under a version label (replacing an earlier snapshot of the same label)"""
+    slug = version_slug(label)
+    if not slug:
+        return None
+    if calendar_data is None:
+        calendar_data = get_project_calendar(project_id)
+    snapshot = {key: calendar_data.get(key) for key in SNAPSHOT_KEYS}
+    snapshot['version'] = str(label).strip()
+    snapshot['created'] = datetime.utcnow().isoformat() + 'Z'
+    os.makedirs(_versions_dir(project_id), exist_ok=True)
+    write_json_atomic(os.path.join(_versions_dir(project_id), f"{slug}.json"), snapshot, ensure_ascii=False)
+    logger.info(f"Stored calendar version {snapshot['version']} for project {project_id}")
+    return snapshot
+
+
+def on_version_change(project_id, old_label, new_label):
+    """
+    Called when a project's version label changes. The calendar as it
+    stands is the final state of the outgoing version, so it is kept under
+    that label (unless it was already snapshotted explicitly).
+    """
+    if not old_label or version_slug(old_label) == version_slug(new_label or ''):
+        return
+    if os.path.exists(os.path.join(_versions_dir(project_id), f"{version_slug(old_label)}.json")):
+        return
+    try:
+        snapshot_version(project_id, old_label)
+    except Exception as e:
+        logger.error(f"Error storing version {old_label} of project {project_id}: {str(e)}")
+
+
+def list_versions(project_id):
+    versions = []
+    try:
+        names = os.listdir(_versions_dir(project_id))
+    except OSError:
+        return []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_versions_dir(project_id), name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        versions.append({
+            'id': name[:-5],
+            'version': data.get('version'),
+            'created': data.get('created'),
+            'revision': data.get('revision'),
+            'days': len(data.get('days') or []),
+        })
+    return sorted(versions, key=lambda v: v.get('created') or '', reverse=True)
+
+
+def list_backups(project_id):
+    """Backups under BACKUP_DIR (<backup>/projects/<id>/calendar.json) that contain this project"""
+    if not BACKUP_DIR or not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for name in sorted(os.listdir(BACKUP_DIR), reverse=True):
+        if os.path.exists(os.path.join(BACKUP_DIR, name, 'projects', project_id, 'calendar.json')):
+            backups.append(name)
+    return backups
+
+
+def load_source(project_id, source):
+    """
+    Calendar for a diff source:
+      'current'          the live calendar
+      'version:<label>'  a stored version (a bare label works too)
+      'backup:<name>'    the calendar inside a backup under BACKUP_DIR
+    Returns (calendar, description) or raises ValueError.
+    """
+    source = (source or 'current').strip()
+    if source == 'current':
+        project = get_project(project_id) or {}
+        label = project.get('version')
+        return get_project_calendar(project_id), f"current ({label})" if label else 'current'
+
+    kind, _, name = source.partition(':')
+    if not name:
+        kind, name = 'version', source
+    if kind == 'version':
+        path = os.path.join(_versions_dir(project_id), f"{version_slug(name)}.json")
+    elif kind == 'backup':
+        if not BACKUP_DIR or not re.fullmatch(r'[A-Za-z0-9_.-]+', name) or name.startswith('.'):
+            raise ValueError(f"Unknown backup: {name}")
+        path = os.path.join(BACKUP_DIR, name, 'projects', project_id, 'calendar.json')
+    else:
+        raise ValueError(f"Unknown source type: {kind}")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        raise ValueError(f"{kind.capitalize()} not found: {name}")
+    return data, data.get('version') or f"{kind} {name}"
@@ -0,0 +1,69 @@
+# utils/view_cache.py
+"""
+Rendered viewer pages, shared across requests.
+
+A plain /viewer/<id> page depends only on the project's source files and
+on who is looking (role and theme: the nav and Edit link differ). Pages
+are kept in a small LRU keyed by (project, source signature, view), where
+the signature is the stat of every file the page is rendered from, so a
+save or a change to departments/locations/areas is a miss without reading
+anything. Concurrent misses for the same key go through one singleflight
+call: the calendar is loaded, counted and rendered once, and the other
+requests wait for that page.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .singleflight import group
+from .publish import source_signature
+
+VIEW_CACHE_SIZE = int(os.environ.get('VIEW_CACHE_SIZE', 32))  # Rendered pages kept; 0 disables caching (misses still coalesce)
+VIEW_TIMEOUT = int(os.environ.get('VIEW_TIMEOUT', 30))        # Seconds to wait for a render in progress
+
+_lock = threading.Lock()
+_cache = OrderedDict()        # key -> (body bytes, etag)
+_flight = group('viewer')
+_hits = 0
+_misses = 0
+
+
+def viewer_view(args, session):
+    """The view a request is rendered for, or None if its page can't be shared (options or flash messages)"""
+    if args or session.get('_flashes'):
+        return None
+    return (session.get('user_role') or '', session.get('theme', 'dark'))
+
+
+def get_view(project_id, view, render):
+    """
+    (body, etag) of the page for `view`; render() returns the page HTML and
+    runs at most once per key across concurrent requests.
+    """
+    global _hits, _misses
+    key = (project_id, repr(source_signature(project_id)), view)  # Taken before rendering, so a concurrent save leaves it stale
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return entry
+        _misses += 1
+
+    def compute():
+        body = render().encode('utf-8')
+        entry = (body, f"view-{hashlib.sha1(body).hexdigest()[:16]}")
+        if VIEW_CACHE_SIZE > 0:
+            with _lock:
+                _cache[key] = entry
+                while len(_cache) > VIEW_CACHE_SIZE:
+                    _cache.popitem(last=False)
+        return entry
+
+    return _flight.do(key, compute, timeout=VIEW_TIMEOUT)
+
+
+def stats():
+    with _lock:
+        return {'hits': _hits, 'misses': _misses, 'entries': len(_cache)}